@@ -0,0 +1,101 @@
+"""
+Messages/second of the compute task, per message vs micro-batched.
+
+Publishes the same amount of messages to the compute and compute_batched
+tasks through the in-memory broker, and measures how long an in-process
+worker takes to consume all of them.
+
+The tasks (and celery task tracing) loggers are silenced, so that the
+results are not dominated by writing thousands of log lines to the terminal.
+
+Usage:
+    make bench-compute-batching
+"""
+
+import logging
+import threading
+import time
+
+from celery import group
+from celery.contrib.testing.worker import start_worker
+from celery.signals import task_postrun
+
+from benchmarks.utils import print_table
+from {{ cookiecutter.project_slug }}.factory import create_app
+from {{ cookiecutter.project_slug }}.tasks import compute, compute_batched
+
+MESSAGES = 5000
+
+processed = {'count': 0}
+all_processed = threading.Event()
+
+
+@task_postrun.connect
+def count_processed(sender=None, args=None, **kwargs):
+    if sender.name == compute_batched.name:
+        processed['count'] += len(args[0])
+    else:
+        processed['count'] += 1
+    if processed['count'] >= MESSAGES:
+        all_processed.set()
+
+
+def run(celery, task) -> list:
+    processed['count'] = 0
+    all_processed.clear()
+
+    now_timestamp = '2025-01-01T00:00:00'
+    group(
+        [
+            task.s(random_number=number, now_timestamp=now_timestamp)
+            for number in range(MESSAGES)
+        ]
+    ).apply_async()
+
+    started_at = time.perf_counter()
+    queue = celery.conf.task_routes[task.name]['queue']
+    with start_worker(
+        celery,
+        pool='threads',
+        concurrency=1,
+        queues=[queue],
+        # unlimited prefetch: with the in-memory broker, a worker whose
+        # prefetch window is full only polls for more messages every 2s,
+        # which would make the benchmark measure that wait instead.
+        prefetch_multiplier=0,
+        perform_ping_check=False,
+        shutdown_timeout=30,
+    ):
+        all_processed.wait(timeout=300)
+        elapsed = time.perf_counter() - started_at
+
+    return [
+        task.name.split('.')[-1],
+        processed['count'],
+        f'{elapsed:.2f}',
+        f'{processed["count"] / elapsed:.0f}',
+    ]
+
+
+def main():
+    app = create_app()
+    celery = app.extensions['celery']
+    celery.conf.update(
+        broker_url='memory://',
+        broker_transport_options={'polling_interval': 0.01},
+        result_backend='cache+memory://',
+        task_always_eager=False,
+    )
+    for logger_name in (compute.__module__, 'celery.app.trace'):
+        logging.getLogger(logger_name).setLevel(logging.WARNING)
+
+    print(
+        f'Batched task flushes every {compute_batched.flush_every} messages '
+        f'or {compute_batched.flush_interval * 1000:.0f}ms.\n'
+    )
+    rows = [run(celery, compute), run(celery, compute_batched)]
+    print_table(['task', 'messages', 'seconds', 'messages/s'], rows)
+
+
+if __name__ == '__main__':
+    main()
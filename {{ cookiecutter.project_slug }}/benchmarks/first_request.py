@@ -0,0 +1,150 @@
+"""
+Latency of the first requests of a new gunicorn worker, with and without
+the warm-up (WARMUP_ENABLED, see warmup.py).
+
+Each run starts gunicorn with a single worker, waits until the readiness
+check passes (right away without the warm-up, once it is done with it),
+and then times the first POST /login (database, bcrypt and JWT) and the
+first GET /user (JWT and database) of the worker, and then a second
+login, for the steady state. The passwords are hashed with the minimum
+bcrypt cost, which would take most of the login time otherwise. A
+benchmark user is created for it, and deleted at the end.
+
+Usage:
+    make bench-first-request
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from statistics import median
+
+# here and on the gunicorn worker (set before the settings are imported)
+os.environ['BCRYPT_FAST_MODE'] = 'True'
+
+from benchmarks.utils import print_table
+from {{ cookiecutter.project_slug }}.extensions import db
+from {{ cookiecutter.project_slug }}.factory import create_app
+from {{ cookiecutter.project_slug }}.models import OutboxMessage, User
+from {{ cookiecutter.project_slug }}.tasks import notify_user_registered
+
+RUNS = 5
+READY_TIMEOUT = 60
+USERNAME = 'bench-first-request'
+EMAIL = 'bench-first-request@example.com'
+PASSWORD = '12345678'
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def timed_request(url: str, data: dict = None, token: str = None) -> tuple:
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    body = json.dumps(data).encode() if data is not None else None
+    started_at = time.perf_counter()
+    with urllib.request.urlopen(
+        urllib.request.Request(url, data=body, headers=headers), timeout=30
+    ) as response:
+        payload = json.loads(response.read())
+    return (time.perf_counter() - started_at) * 1000, payload
+
+
+def wait_until_ready(url: str) -> float:
+    started_at = time.perf_counter()
+    while time.perf_counter() - started_at < READY_TIMEOUT:
+        try:
+            with urllib.request.urlopen(f'{url}/health-check/readiness', timeout=5):
+                return (time.perf_counter() - started_at) * 1000
+        except OSError:  # not listening yet, or not ready (503)
+            time.sleep(0.05)
+    raise RuntimeError(f'Not ready after {READY_TIMEOUT} seconds.')
+
+
+def run(warm_up: bool) -> dict:
+    port = get_free_port()
+    url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, WEB_WORKERS='1', WARMUP_ENABLED=str(warm_up))
+    server = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn',
+            '-c', 'gunicorn_settings.py',
+            '-b', f'127.0.0.1:{port}',
+            '{{ cookiecutter.project_slug }}:app',
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        ready_ms = wait_until_ready(url)
+        credentials = {'email': EMAIL, 'password': PASSWORD}
+        login_ms, tokens = timed_request(f'{url}/login', credentials)
+        user_ms, _ = timed_request(f'{url}/user', token=tokens['access_token'])
+        steady_login_ms, _ = timed_request(f'{url}/login', credentials)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'ready': ready_ms,
+        'login': login_ms,
+        'user': user_ms,
+        'steady_login': steady_login_ms,
+    }
+
+
+def measure(warm_up: bool) -> list:
+    runs = [run(warm_up) for _ in range(RUNS)]
+    return [
+        'warm-up' if warm_up else 'none',
+        *(
+            f'{median(run[name] for run in runs):.0f}'
+            for name in ('ready', 'login', 'user', 'steady_login')
+        ),
+    ]
+
+
+def delete_user():
+    db.session.rollback()
+    users = User.query.filter_by(username=USERNAME)
+    uuids = [str(user.uuid) for user in users]
+    OutboxMessage.query.filter(
+        OutboxMessage.task_name == notify_user_registered.name,
+        OutboxMessage.kwargs['user_uuid'].astext.in_(uuids),
+    ).delete(synchronize_session=False)
+    users.delete(synchronize_session=False)
+    db.session.commit()
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        delete_user()  # left by an interrupted run
+        User().register(username=USERNAME, email=EMAIL, password=PASSWORD)
+        try:
+            rows = [measure(warm_up=False), measure(warm_up=True)]
+        finally:
+            delete_user()
+
+    print_table(
+        [
+            'worker',
+            'ready after (ms)',
+            'first login (ms)',
+            'first get user (ms)',
+            'steady login (ms)',
+        ],
+        rows,
+    )
+
+
+if __name__ == '__main__':
+    main()
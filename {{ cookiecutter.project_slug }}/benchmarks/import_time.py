@@ -0,0 +1,84 @@
+"""
+Boot time of the app: importing the factory and running create_app(), on
+a fresh interpreter each time (as a gunicorn worker or a test run pays
+it), with python -X importtime to find the imports that take the longest.
+
+Exits with an error when the median boot time is above
+BOOT_TIME_BUDGET_MS, so that it can guard against regressions (e.g. a new
+dependency imported at module level).
+
+Usage:
+    make bench-import-time
+"""
+
+import os
+import subprocess
+import sys
+from collections import Counter
+from statistics import median
+
+from benchmarks.utils import print_table
+
+RUNS = 7
+TOP_PACKAGES = 10
+BOOT_TIME_BUDGET_MS = float(os.environ.get('BOOT_TIME_BUDGET_MS', 1100))
+
+BOOT = """
+from time import perf_counter
+started_at = perf_counter()
+from {{ cookiecutter.project_slug }}.factory import create_app
+imported_at = perf_counter()
+create_app()
+finished_at = perf_counter()
+print((imported_at - started_at) * 1000, (finished_at - imported_at) * 1000)
+"""
+
+
+def parse_importtime(output: str) -> Counter:
+    """
+    Microseconds spent importing the modules of each package. The self
+    time of each module, so that the nested imports are not counted twice.
+    """
+    packages = Counter()
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:') :].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us)
+    return packages
+
+
+def boot() -> tuple:
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # the app logs to stdout too, the timings are on the last line
+    import_ms, create_app_ms = map(float, process.stdout.splitlines()[-1].split())
+    return import_ms, create_app_ms, parse_importtime(process.stderr)
+
+
+def main():
+    runs = sorted((boot() for _ in range(RUNS)), key=lambda run: sum(run[:2]))
+    import_ms, create_app_ms, packages = runs[len(runs) // 2]  # the median one
+
+    print_table(
+        ['package', 'import (ms)'],
+        [[name, f'{us / 1000:.1f}'] for name, us in packages.most_common(TOP_PACKAGES)],
+    )
+
+    boot_ms = median(sum(run[:2]) for run in runs)
+    print()
+    print_table(
+        ['import factory (ms)', 'create_app (ms)', 'boot (ms)', 'budget (ms)'],
+        [[f'{import_ms:.0f}', f'{create_app_ms:.0f}', f'{boot_ms:.0f}',
+          f'{BOOT_TIME_BUDGET_MS:.0f}']],
+    )
+    if boot_ms > BOOT_TIME_BUDGET_MS:
+        sys.exit(f'The boot time ({boot_ms:.0f}ms) is over the budget.')
+
+
+if __name__ == '__main__':
+    main()
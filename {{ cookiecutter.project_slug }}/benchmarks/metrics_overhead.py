@@ -0,0 +1,77 @@
+"""
+Request latency with and without the Prometheus metrics hooks.
+
+Sends the same requests to an app with METRICS_ENABLED and to one without,
+interleaved, and compares their latency on two endpoints:
+/welcome/<person>, which does nothing (so the hooks are as visible as they
+can be), and GET /users, a page of users read from the database. The
+metrics are written to a temporary METRICS_DIR.
+
+Usage:
+    make bench-metrics-overhead
+"""
+
+import os
+import tempfile
+import time
+
+# a throwaway metrics directory, set before the metrics module is imported
+os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='bench-metrics-')
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+
+from benchmarks.utils import percentile, print_table  # noqa: E402
+from {{ cookiecutter.project_slug }} import settings  # noqa: E402
+from {{ cookiecutter.project_slug }}.factory import create_app  # noqa: E402
+
+REQUESTS = 3000
+WARM_UP_REQUESTS = 200
+
+
+def create_client(metrics_enabled: bool):
+    settings.METRICS_ENABLED = metrics_enabled
+    app = create_app()
+    with app.app_context():
+        token = create_access_token(identity='bench-metrics', fresh=True)
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
+
+
+def measure(client, url: str) -> float:
+    started_at = time.perf_counter()
+    client.get(url)
+    return (time.perf_counter() - started_at) * 1_000_000
+
+
+def compare(clients: dict, url: str) -> list:
+    samples = {name: [] for name in clients}
+
+    for client in clients.values():
+        for _ in range(WARM_UP_REQUESTS):
+            measure(client, url)
+
+    # interleaved, so that both see the same noise
+    for _ in range(REQUESTS):
+        for name, client in clients.items():
+            samples[name].append(measure(client, url))
+
+    disabled = percentile(samples['disabled'], 50)
+    overhead = percentile(samples['enabled'], 50) - disabled
+    return [
+        url,
+        *(f'{percentile(samples[name], 50):.1f}' for name in clients),
+        f'{overhead:.1f} ({overhead / disabled:.1%})',
+    ]
+
+
+def main():
+    clients = {'disabled': create_client(False), 'enabled': create_client(True)}
+    rows = [compare(clients, url) for url in ('/welcome/picard', '/users?limit=20')]
+    print_table(
+        ['endpoint', 'p50 disabled (us)', 'p50 enabled (us)', 'overhead (us)'], rows
+    )
+
+
+if __name__ == '__main__':
+    main()
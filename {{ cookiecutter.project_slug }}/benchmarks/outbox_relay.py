@@ -0,0 +1,74 @@
+"""
+Messages/second published by the transactional outbox relay, per batch size.
+
+Fills the outbox with the same amount of compute messages for each batch
+size and measures how long relay_outbox_batch() takes to publish all of
+them to the in-memory broker. Each batch is one SELECT ... FOR UPDATE SKIP
+LOCKED, one producer and one DELETE + COMMIT, so the per-message cost of
+the database round-trips shrinks as the batches grow.
+
+The outbox table must exist (make migrate) and be empty.
+
+Usage:
+    make bench-outbox-relay
+"""
+
+import time
+
+from benchmarks.utils import print_table
+from {{ cookiecutter.project_slug }}.extensions import db
+from {{ cookiecutter.project_slug }}.factory import create_app
+from {{ cookiecutter.project_slug }}.models import OutboxMessage
+from {{ cookiecutter.project_slug }}.outbox import relay_outbox_batch
+from {{ cookiecutter.project_slug }}.tasks import compute
+
+MESSAGES = 2000
+BATCH_SIZES = [1, 10, 100, 500]
+
+
+def fill_outbox():
+    now_timestamp = '2025-01-01T00:00:00'
+    for number in range(MESSAGES):
+        OutboxMessage.enqueue(
+            compute, kwargs={'random_number': number, 'now_timestamp': now_timestamp}
+        )
+    db.session.commit()
+
+
+def run(celery, batch_size: int) -> list:
+    fill_outbox()
+
+    started_at = time.perf_counter()
+    relayed = 0
+    while True:
+        batch = relay_outbox_batch(celery, batch_size)
+        if not batch:
+            break
+        relayed += batch
+    elapsed = time.perf_counter() - started_at
+
+    # drop the published messages, so the next run starts empty
+    celery.connection_for_write().default_channel.queue_purge(
+        celery.conf.task_routes[compute.name]['queue']
+    )
+    return [batch_size, relayed, f'{elapsed:.2f}', f'{relayed / elapsed:.0f}']
+
+
+def main():
+    app = create_app()
+    celery = app.extensions['celery']
+    celery.conf.update(
+        broker_url='memory://',
+        task_always_eager=False,
+    )
+
+    with app.app_context():
+        db.create_all()
+        if OutboxMessage.query.count():
+            raise SystemExit('The outbox is not empty, is a relay running?')
+        rows = [run(celery, batch_size) for batch_size in BATCH_SIZES]
+    print_table(['batch size', 'messages', 'seconds', 'messages/s'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Latency of non-auth endpoints while auth traffic is saturated.
+
+Some threads hash passwords non-stop (like a login/registration storm on a
+gthread worker would do), while another thread measures the latency of
+/health-check/liveness. This runs once with the hashing inline, on the
+request threads, and once on the password hashing process pool.
+
+Usage:
+    make bench-password-hashing
+"""
+
+import threading
+import time
+
+from benchmarks.utils import percentile, print_table
+from {{ cookiecutter.project_slug }}.exceptions import PasswordHashingUnavailable
+from {{ cookiecutter.project_slug }}.extensions import password_hasher
+from {{ cookiecutter.project_slug }}.factory import create_app
+
+AUTH_THREADS = 8
+PROBE_REQUESTS = 300
+POOL_WORKERS = 2
+
+
+def saturate_auth(stop: threading.Event, counters: dict):
+    while not stop.is_set():
+        try:
+            password_hasher.generate_password_hash('12345678')
+            counters['hashed'] += 1
+        except PasswordHashingUnavailable:
+            counters['rejected'] += 1
+            time.sleep(0.001)
+
+
+def run(app, workers: int) -> list:
+    password_hasher.configure(
+        workers=workers, max_pending=AUTH_THREADS, timeout=30
+    )
+    client = app.test_client()
+    client.get('/health-check/liveness')  # warm up the route
+
+    counters = {'hashed': 0, 'rejected': 0}
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=saturate_auth, args=(stop, counters))
+        for _ in range(AUTH_THREADS)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)  # let the auth traffic ramp up
+
+    latencies = []
+    started_at = time.perf_counter()
+    for _ in range(PROBE_REQUESTS):
+        request_started_at = time.perf_counter()
+        client.get('/health-check/liveness')
+        latencies.append((time.perf_counter() - request_started_at) * 1000)
+    elapsed = time.perf_counter() - started_at
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    password_hasher.shutdown()
+
+    mode = f'pool ({workers} procs)' if workers else 'inline'
+    return [
+        mode,
+        f'{percentile(latencies, 50):.2f}',
+        f'{percentile(latencies, 99):.2f}',
+        f'{counters["hashed"] / elapsed:.1f}',
+        counters['rejected'],
+    ]
+
+
+def main():
+    app = create_app()
+    print(
+        f'{AUTH_THREADS} threads hashing with bcrypt '
+        f'(rounds={password_hasher.rounds}), '
+        f'{PROBE_REQUESTS} requests to /health-check/liveness:\n'
+    )
+    rows = [run(app, workers=0), run(app, workers=POOL_WORKERS)]
+    print_table(
+        ['hashing', 'p50 (ms)', 'p99 (ms)', 'hashes/s', 'rejected (429)'], rows
+    )
+
+
+if __name__ == '__main__':
+    main()
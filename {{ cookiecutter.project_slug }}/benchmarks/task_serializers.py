@@ -0,0 +1,85 @@
+"""
+Encode/decode time and bytes on the wire of the task serializers.
+
+Builds the message bodies celery publishes for the compute and
+generate_random_string tasks (and for a chunk of 1000 computations, as
+sent by POST /compute/batch with chunk_size) and runs them through the
+json, pickle and fastpack serializers.
+
+Usage:
+    make bench-task-serializers
+"""
+
+import timeit
+
+from kombu import serialization
+
+from benchmarks.utils import print_table
+from {{ cookiecutter.project_slug }}.factory import create_app
+from {{ cookiecutter.project_slug }}.serializers import SERIALIZER_NAME
+from {{ cookiecutter.project_slug }}.tasks import compute, generate_random_string
+
+SERIALIZERS = ['json', 'pickle', SERIALIZER_NAME]
+LOOPS = 20000
+
+
+def get_payloads(celery) -> dict:
+    now_timestamp = '2025-01-01T00:00:00.000000'
+
+    def body(task, args=(), kwargs=None):
+        message = celery.amqp.as_task_v2(
+            'c0ffee00-0000-4000-8000-000000000000', task.name, args, kwargs or {}
+        )
+        return message.body
+
+    chunk = compute.chunks(
+        [(number, now_timestamp) for number in range(1000)], 1000
+    ).group()
+    chunk_task = chunk.tasks[0]
+
+    return {
+        'compute': body(
+            compute, kwargs={'random_number': 1234, 'now_timestamp': now_timestamp}
+        ),
+        'generate_random_string': body(generate_random_string),
+        'compute x1000 (chunk)': body(
+            celery.tasks[chunk_task.task], chunk_task.args, chunk_task.kwargs
+        ),
+    }
+
+
+def measure(payload, serializer: str) -> list:
+    content_type, content_encoding, data = serialization.dumps(
+        payload, serializer=serializer
+    )
+    encode = timeit.timeit(
+        lambda: serialization.dumps(payload, serializer=serializer), number=LOOPS
+    )
+    decode = timeit.timeit(
+        lambda: serialization.loads(
+            data, content_type, content_encoding, accept={content_type}
+        ),
+        number=LOOPS,
+    )
+    return [
+        serializer,
+        len(data),
+        f'{encode / LOOPS * 1_000_000:.2f}',
+        f'{decode / LOOPS * 1_000_000:.2f}',
+    ]
+
+
+def main():
+    app = create_app()
+    celery = app.extensions['celery']
+
+    for name, payload in get_payloads(celery).items():
+        print(f'\n{name}:')
+        print_table(
+            ['serializer', 'bytes', 'encode (us)', 'decode (us)'],
+            [measure(payload, serializer) for serializer in SERIALIZERS],
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Rows/second of the user registration and update database writes.
+
+Compares the previous write path (add, commit and then refresh, which
+reloads the row with an extra SELECT) with the current one (User.register()
+and User.update(), a single INSERT/UPDATE ... RETURNING). The statements
+sent per operation are counted too.
+
+Password hashing is replaced by a constant hash, so that only the database
+round-trips are measured. The benchmark users (and their outbox messages)
+are deleted at the end.
+
+Usage:
+    make bench-user-writes
+"""
+
+import time
+
+from sqlalchemy import event
+
+from benchmarks.utils import print_table
+from {{ cookiecutter.project_slug }}.extensions import db
+from {{ cookiecutter.project_slug }}.factory import create_app
+from {{ cookiecutter.project_slug }}.models import OutboxMessage, User, utc_now
+from {{ cookiecutter.project_slug }}.tasks import notify_user_registered
+
+ROWS = 1000
+PASSWORD_HASH = '$2b$12$' + 'x' * 53
+
+
+def register_with_refresh(username: str, email: str, password: str) -> User:
+    new_user = User(username=username, email=email, password_hash=PASSWORD_HASH)
+    db.session.add(new_user)
+    db.session.flush()
+    OutboxMessage.enqueue(
+        notify_user_registered, kwargs={'user_uuid': str(new_user.uuid)}
+    )
+    db.session.commit()
+    db.session.refresh(new_user)
+    return new_user
+
+
+def update_with_refresh(user: User, email: str):
+    user.email = email
+    user.last_updated_at = utc_now()
+    db.session.add(user)
+    db.session.commit()
+    db.session.refresh(user)
+
+
+def run(name: str, register, update) -> list:
+    statements = []
+
+    def count_statement(*args):
+        statements.append(1)
+
+    event.listen(db.engine, 'before_cursor_execute', count_statement)
+    try:
+        started_at = time.perf_counter()
+        users = [
+            register(
+                username=f'bench-{name}-{number}',
+                email=f'bench-{name}-{number}@example.com',
+                password='12345678',
+            )
+            for number in range(ROWS)
+        ]
+        register_seconds = time.perf_counter() - started_at
+        register_statements = len(statements)
+
+        statements.clear()
+        started_at = time.perf_counter()
+        for number, user in enumerate(users):
+            update(user, email=f'bench-{name}-{number}@example.net')
+        update_seconds = time.perf_counter() - started_at
+        update_statements = len(statements)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+        delete_users(name)
+
+    return [
+        name,
+        f'{ROWS / register_seconds:.0f}',
+        f'{register_statements / ROWS:.1f}',
+        f'{ROWS / update_seconds:.0f}',
+        f'{update_statements / ROWS:.1f}',
+    ]
+
+
+def delete_users(name: str):
+    db.session.rollback()
+    users = User.query.filter(User.username.startswith(f'bench-{name}-'))
+    uuids = [str(user.uuid) for user in users]
+    OutboxMessage.query.filter(
+        OutboxMessage.task_name == notify_user_registered.name,
+        OutboxMessage.kwargs['user_uuid'].astext.in_(uuids),
+    ).delete(synchronize_session=False)
+    users.delete(synchronize_session=False)
+    db.session.commit()
+
+
+def main():
+    app = create_app()
+    User.hash = lambda self, password: PASSWORD_HASH
+
+    with app.app_context():
+        rows = [
+            run('refresh', register_with_refresh, update_with_refresh),
+            run('returning', User().register, User.update),
+        ]
+    print_table(
+        [
+            'write path',
+            'registers/s',
+            'statements/register',
+            'updates/s',
+            'statements/update',
+        ],
+        rows,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Cold start and memory of the celery pool processes, with the worker app
+built by:
+
+- web: create_app(), the web app, as the worker used to;
+- worker: create_worker_app();
+- preloaded: create_worker_app(), with the shared state preloaded and
+  frozen once, before the first fork (see preload.py).
+
+Each bootstrap runs on a fresh interpreter, which then forks CHILDREN
+processes the way the prefork pool does (with a garbage collection right
+before each, unless frozen). Each child runs some tasks and a full garbage collection (as it
+eventually would), and reports its memory: rss, and uss, the pages that
+are its own (not shared with the parent).
+
+Usage:
+    make bench-worker-bootstrap
+"""
+
+import json
+import subprocess
+import sys
+from statistics import median
+
+from benchmarks.utils import print_table
+
+RUNS = 5
+CHILDREN = 4
+TASKS_PER_CHILD = 50
+
+BOOTSTRAP = """
+import gc, json, os, sys
+from time import perf_counter
+
+profile = sys.argv[1]
+started_at = perf_counter()
+from {{ cookiecutter.project_slug }}.factory import create_app, create_worker_app
+app = create_app() if profile == 'web' else create_worker_app()
+celery = app.extensions['celery']
+celery.loader.import_default_modules()
+if profile == 'preloaded':
+    from {{ cookiecutter.project_slug }}.preload import (
+        freeze_shared_state,
+        preload_shared_state,
+    )
+
+    preload_shared_state()
+    freeze_shared_state()
+cold_start_ms = (perf_counter() - started_at) * 1000
+
+from {{ cookiecutter.project_slug }}.memory import get_memory_usage
+from {{ cookiecutter.project_slug }}.tasks import generate_random_string
+
+children = []
+for _ in range(int(sys.argv[2])):
+    if profile != 'preloaded':
+        gc.collect()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        with app.app_context():
+            for _ in range(int(sys.argv[3])):
+                generate_random_string.apply()
+        gc.collect()
+        os.write(write_fd, json.dumps(get_memory_usage()).encode())
+        os._exit(0)
+    os.close(write_fd)
+    children.append((pid, read_fd))
+
+usages = []
+for pid, read_fd in children:
+    usages.append(json.loads(os.read(read_fd, 4096)))
+    os.waitpid(pid, 0)
+print(json.dumps({'cold_start_ms': cold_start_ms, 'children': usages}))
+"""
+
+
+def bootstrap(profile: str) -> dict:
+    process = subprocess.run(
+        [sys.executable, '-c', BOOTSTRAP, profile, str(CHILDREN), str(TASKS_PER_CHILD)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # the app logs to stdout too, the results are on the last line
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def measure(profile: str) -> list:
+    runs = [bootstrap(profile) for _ in range(RUNS)]
+    children = [usage for run in runs for usage in run['children']]
+    return [
+        profile,
+        f'{median(run["cold_start_ms"] for run in runs):.0f}',
+        f'{median(usage["rss_bytes"] for usage in children) / 1024 ** 2:.1f}',
+        f'{median(usage["uss_bytes"] for usage in children) / 1024 ** 2:.1f}',
+    ]
+
+
+def main():
+    print_table(
+        ['bootstrap', 'cold start (ms)', 'child rss (MiB)', 'child uss (MiB)'],
+        [measure(profile) for profile in ('web', 'worker', 'preloaded')],
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,13 @@
-from {{ cookiecutter.project_slug }}.factory import create_app
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.factory import create_worker_app
+from {{ cookiecutter.project_slug }}.metrics import set_metrics_dir
 
-app = create_app()
+# the workers metrics are kept apart from the web ones
+set_metrics_dir(settings.CELERY_METRICS_DIR)
+
+# without the web extensions, see preload.py for what is shared with the
+# pool processes
+app = create_worker_app()
 celery = app.extensions['celery']
 celery.autodiscover_tasks(['{{ cookiecutter.project_slug }}'])
 
@@ -1,11 +1,43 @@
 # https://pythonspeed.com/articles/gunicorn-in-docker/
 
-import multiprocessing
+import importlib.util
+import os
+
+# not as `config`: gunicorn would take it for its own config setting
+from decouple import config as env_config
+
+
+def load_sizing():
+    # By its path: importing it from the package would import the whole
+    # package (and need all of its settings) on the master, to parse this
+    # file, even without WEB_PRELOAD_APP.
+    path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        '{{ cookiecutter.project_slug }}',
+        'sizing.py',
+    )
+    spec = importlib.util.spec_from_file_location('sizing', path)
+    sizing = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sizing)
+    return sizing
+
 
 # http://docs.gunicorn.org/en/latest/design.html#how-many-workers
-cpus = multiprocessing.cpu_count()
-WORKERS = (2 * cpus) + 1
-THREADS = WORKERS * 2
+# Sized from the cgroup CPU quota and memory limit of the container, not
+# from the CPUs of the host (see sizing.py), unless set. The same as the
+# app settings, whose connection pools are sized from WEB_THREADS too.
+WEB_SIZING = load_sizing().get_web_sizing(env_config)
+WORKERS = WEB_SIZING['workers']
+THREADS = WEB_SIZING['threads']
+BACKLOG = WEB_SIZING['backlog']
+# Recycle each worker after this many requests (plus a random jitter, so
+# that they do not restart together), 0 disables it. The app also recycles
+# them on WEB_MAX_RSS_MB (see the post_request hook).
+MAX_REQUESTS = env_config('WEB_MAX_REQUESTS', default=10000, cast=int)
+MAX_REQUESTS_JITTER = env_config('WEB_MAX_REQUESTS_JITTER', default=1000, cast=int)
+# Build the app once, on the master, and share it with the workers (see
+# the when_ready and post_fork hooks).
+PRELOAD_APP = env_config('WEB_PRELOAD_APP', default=True, cast=bool)
 
 # Gunicorn configuration file.
 
@@ -31,7 +63,7 @@ def get_timeout():
 #       range.
 #
 
-backlog = 500
+backlog = BACKLOG
 
 #
 # Worker processes
@@ -76,6 +108,13 @@ backlog = 500
 #
 #       A positive integer. Generally set in the 1-5 seconds range.
 #
+#   max_requests - The number of requests a worker handles before it
+#       is restarted (gracefully, the requests in progress are
+#       finished first), with a random jitter of up to
+#       max_requests_jitter added for each worker.
+#
+#       A positive integer, or 0 to disable the restarts.
+#
 
 workers = WORKERS
 worker_class = 'gthread'
@@ -86,6 +125,9 @@ worker_connections = 1000
 timeout = get_timeout()
 keepalive = 5
 
+max_requests = MAX_REQUESTS
+max_requests_jitter = MAX_REQUESTS_JITTER
+
 #
 #   spew - Install a trace function that spews every line of Python
 #       that is executed when running the server. This is the
@@ -134,6 +176,13 @@ spew = False
 #       A path to a directory where the process owner can write. Or
 #       None to signal that Python should choose one on its own.
 #
+#   preload_app - Load the application code before the worker processes
+#       are forked, so that the memory it takes is shared by the workers
+#       (copy-on-write) instead of taken by each one of them. The code is
+#       then not reloaded on HUP (restart the master instead).
+#
+#       True or False
+#
 
 daemon = False
 pidfile = None
@@ -141,6 +190,7 @@ umask = 0
 user = None
 group = None
 tmp_upload_dir = None
+preload_app = PRELOAD_APP
 
 #
 #   Logging
@@ -186,24 +236,101 @@ proc_name = None
 #
 #       A callable that accepts the same arguments as after_fork
 #
+#   With preload_app, the app is built on the master: when_ready freezes
+#   it (gc.freeze, see preload.py) so that the workers keep sharing its
+#   memory, and post_fork drops the database and broker connections the
+#   workers would otherwise share with the master.
+#
 #   pre_exec - Called just prior to forking off a secondary
 #       master process during things like config reloading.
 #
 #       A callable that takes a server instance as the sole argument.
 #
+#   post_request - Called after a worker processes the request.
+#
+#       A callable that takes a worker, the request, the WSGI
+#       environment and the response as arguments.
+#
 
 def post_fork(server, worker):
     server.log.info("Worker spawned (pid: %s)", worker.pid)
 
+    from {{ cookiecutter.project_slug }} import app, settings
+    from {{ cookiecutter.project_slug }}.broker import reset_broker_connections
+    from {{ cookiecutter.project_slug }}.database import dispose_engine
+    from {{ cookiecutter.project_slug }}.warmup import warm_up
+
+    # never share the database and broker connections of the parent process
+    dispose_engine(app)
+    reset_broker_connections(app.extensions['celery'])
+
+    # before the worker accepts connections (see warmup.py)
+    if settings.WARMUP_ENABLED:
+        warm_up(app)
+
+    from {{ cookiecutter.project_slug }}.memory import start_memory_tracing
+    from {{ cookiecutter.project_slug }}.metrics import track_process_memory
+
+    # with MEMORY_TRACING_ENABLED, from the start of each worker
+    start_memory_tracing()
+
+    # the shared and private memory of the master and every worker
+    track_process_memory(server.pid)
+
 def pre_fork(server, worker):
     pass
 
+def on_starting(server):
+    from {{ cookiecutter.project_slug }}.metrics import clear_metrics_dir
+
+    # the metrics of a previous run must not be merged into this one
+    clear_metrics_dir()
+
+def child_exit(server, worker):
+    from {{ cookiecutter.project_slug }}.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+def post_request(worker, req, environ, resp):
+    from {{ cookiecutter.project_slug }}.recycling import check_web_worker
+
+    # recycle the worker when it uses more than WEB_MAX_RSS_MB
+    check_web_worker(worker)
+
 def pre_exec(server):
     server.log.info("Forked child, re-executing.")
 
 def when_ready(server):
     server.log.info("Server is ready. Spawning workers")
 
+    memory_limit_mb = WEB_SIZING['memory_limit_mb']
+    server.log.info(
+        "Sizing: %s workers x %s threads, backlog %s (%s profile, %.2f CPUs, "
+        "memory limit %s)",
+        WORKERS, THREADS, BACKLOG, WEB_SIZING['profile'], WEB_SIZING['cpu_limit'],
+        f'{memory_limit_mb}MiB' if memory_limit_mb else 'none',
+    )
+
+    # the app (and its settings) is only loaded on the master with
+    # preload_app
+    if server.cfg.preload_app:
+        from {{ cookiecutter.project_slug }} import settings
+        from {{ cookiecutter.project_slug }}.preload import (
+            freeze_shared_state,
+            preload_shared_state,
+        )
+
+        # to check against the postgres max_connections
+        pool_size = settings.DATABASE_POOL_SIZE + settings.DATABASE_MAX_OVERFLOW
+        server.log.info(
+            "Database connections: up to %s (%s workers x %s per worker pool)",
+            WORKERS * pool_size, WORKERS, pool_size,
+        )
+
+        # once, before the first worker is forked
+        preload_shared_state()
+        freeze_shared_state()
+
 def worker_int(worker):
     worker.log.info("worker received INT or QUIT signal")
 
@@ -1,6 +1,15 @@
 from {{ cookiecutter.project_slug }}.factory import create_app
 
-app = create_app()
-
 # Ensure tasks are registered
 from {{ cookiecutter.project_slug }} import tasks  # noqa
+
+
+def __getattr__(name):
+    # The app is created on first use (e.g. by gunicorn, for
+    # {{ cookiecutter.project_slug }}:app), not when the package is imported:
+    # the tests, the celery worker and the scripts create their own.
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,19 +1,72 @@
+import csv
+import io
+import json
 import logging
+import os
 from datetime import datetime, timedelta
+from itertools import islice
 from random import randint
+from time import perf_counter
 
 import flask
-from flask import Blueprint, request, jsonify
+from celery import group
+from flask import (
+    Blueprint,
+    current_app,
+    request,
+    jsonify,
+    send_file,
+    stream_with_context,
+)
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
     jwt_required,
     get_jwt_identity,
 )
+from {{cookiecutter.project_slug}}.broker import get_broker_stats
+from {{cookiecutter.project_slug}}.commons import decode_cursor, encode_cursor
+from {{cookiecutter.project_slug}}.database import get_database_pool_stats
 from {{cookiecutter.project_slug}}.exceptions import APIError
+from {{cookiecutter.project_slug}}.exports import read_manifest
+from {{cookiecutter.project_slug}}.extensions import db
+from {{cookiecutter.project_slug}}.memory import COMPARE_TO, memory_tracker
+from {{cookiecutter.project_slug}}.metrics import generate_metrics
 from {{cookiecutter.project_slug}}.models import User
-from {{cookiecutter.project_slug}}.settings import VERSION
-from {{cookiecutter.project_slug}}.tasks import compute, generate_random_string
+from {{cookiecutter.project_slug}}.profiling import (
+    PROFILE_HEADER,
+    format_profile,
+    get_profile_path,
+    is_authorized,
+    list_profiles,
+)
+from {{cookiecutter.project_slug}}.queries import query_stats
+from {{cookiecutter.project_slug}}.settings import (
+    COMPUTE_BATCH_MAX_SIZE,
+    COMPUTE_BATCHING_ENABLED,
+    EXPORTS_DIR,
+    MEMORY_TOP_STATS,
+    USERS_IMPORT_MAX_ROWS,
+    USERS_IMPORT_REQUEST_TIMEOUT,
+    USERS_PAGE_MAX_SIZE,
+    USERS_PAGE_SIZE,
+    USERS_STREAM_BATCH_SIZE,
+    VERSION,
+)
+from {{cookiecutter.project_slug}}.spool import publish_group, publish_task
+from {{cookiecutter.project_slug}}.tasks import (
+    compute,
+    compute_batched,
+    export_users,
+    generate_random_string,
+)
+from {{cookiecutter.project_slug}}.warmup import ensure_warmed_up
+from {{cookiecutter.project_slug}}.user_import import (
+    CONTENT_TYPES,
+    HTTP_ON_CONFLICT,
+    import_users,
+    read_rows,
+)
 
 api_blueprint = Blueprint("api", __name__)
 
@@ -48,13 +101,97 @@ def call_compute_task():
     random_number = randint(1000, 9999)
     now_timestamp = datetime.now().isoformat()
 
-    compute.apply_async(
-        kwargs={"random_number": random_number, "now_timestamp": now_timestamp}
+    compute_task = compute_batched if COMPUTE_BATCHING_ENABLED else compute
+    publish_task(
+        compute_task,
+        kwargs={"random_number": random_number, "now_timestamp": now_timestamp},
     )
 
     return jsonify({"message": "Successfully sent to queue."})
 
 
+@api_blueprint.route("/compute/batch", methods=["POST"])
+def call_compute_task_batch():
+    """
+    Put many compute tasks on the queue at once.
+
+    All the tasks are published as a single celery group, through one
+    producer (one broker connection/channel), instead of one publish
+    per HTTP request. With "chunk_size", the numbers are also packed
+    into chunks, so that each message carries that many computations
+    (otherwise, with COMPUTE_BATCHING_ENABLED, the messages are sent to
+    the batched variant of the task).
+    ---
+    tags:
+      - Celery background task
+    parameters:
+      - name: numbers
+        type: array
+        items:
+          type: integer
+        required: true
+      - name: chunk_size
+        type: integer
+        required: false
+    responses:
+      200:
+        description: messages were put on the queue, with the group id
+                     and the publish throughput.
+      400:
+        description: invalid numbers or chunk_size.
+      503:
+        description: the broker is not available (the tasks are not spooled).
+    """
+    data = request.get_json(silent=True) or {}
+    numbers = data.get("numbers")
+    chunk_size = data.get("chunk_size")
+
+    if (
+        not isinstance(numbers, list)
+        or not numbers
+        or not all(type(number) is int for number in numbers)
+    ):
+        raise APIError(400, {"msg": "numbers must be a non-empty list of integers."})
+    if len(numbers) > COMPUTE_BATCH_MAX_SIZE:
+        raise APIError(
+            400, {"msg": f"numbers can not have more than {COMPUTE_BATCH_MAX_SIZE} items."}
+        )
+    if chunk_size is not None and (type(chunk_size) is not int or chunk_size < 1):
+        raise APIError(400, {"msg": "chunk_size must be a positive integer."})
+
+    now_timestamp = datetime.now().isoformat()
+    if chunk_size:
+        tasks = compute.chunks(
+            [(number, now_timestamp) for number in numbers], chunk_size
+        ).group()
+    else:
+        compute_task = compute_batched if COMPUTE_BATCHING_ENABLED else compute
+        tasks = group(
+            [
+                compute_task.s(random_number=number, now_timestamp=now_timestamp)
+                for number in numbers
+            ]
+        )
+
+    started_at = perf_counter()
+    result = publish_group(tasks)
+    publish_seconds = perf_counter() - started_at
+
+    messages = len(tasks.tasks)
+    return jsonify(
+        {
+            "message": "Successfully sent to queue.",
+            "group_id": result.id,
+            "count": len(numbers),
+            "metadata": {
+                "messages": messages,
+                "publish_seconds": round(publish_seconds, 6),
+                "messages_per_second": round(messages / publish_seconds, 2),
+            },
+        }
+    )
+
+
 @api_blueprint.route("/string", methods=["GET"])
 def call_generate_random_string_task():
     """
@@ -73,7 +210,7 @@ def call_generate_random_string_task():
         description: message was put on the queue.
     """
 
-    generate_random_string.apply_async()
+    publish_task(generate_random_string)
 
     return jsonify({"message": "Successfully sent to queue."})
 
@@ -91,15 +228,28 @@ def readiness():
     backends for Services.
     When a Pod is not ready, it is removed from Service load balancers.
     This will run ONLY ONCE.
+
+    The worker that answers is not ready until it is warmed up (see
+    warmup.py), which is tried again if it failed.
     ---
     tags:
       - Healthcheck
     responses:
       200:
         description: show the app as ready, with its app version and type.
+      503:
+        description: the worker is warming up.
     """
     flask_version = flask.__version__
     app_type = f"flask-framework {flask_version}"
+    if not ensure_warmed_up(current_app._get_current_object()):
+        response_dict = {
+            "ready": "warming up",
+            "app_version": VERSION,
+            "app_type": f"{app_type}",
+        }
+        return jsonify(response_dict), 503
+
     response_dict = {
         "ready": "OK",
         "app_version": VERSION,
@@ -136,6 +286,187 @@ def liveness():
     return jsonify(response_dict)
 
 
+@api_blueprint.route("/stats", methods=["GET"])
+def stats():
+    """
+    Internal statistics of the worker process that answered the request.
+
+    Each gunicorn worker has its own numbers, so the pid is returned too.
+    ---
+    tags:
+      - Healthcheck
+    responses:
+      200:
+        description: >
+          the process pid, its broker publish statistics, its database
+          connection pool usage and checkout wait times, and its query times.
+    """
+    celery = current_app.extensions["celery"]
+    response_dict = {
+        "pid": os.getpid(),
+        "broker": get_broker_stats(celery),
+        "database": get_database_pool_stats(db.engine),
+        "queries": query_stats.snapshot(),
+    }
+    return jsonify(response_dict)
+
+
+@api_blueprint.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Prometheus metrics of all the worker processes
+    ---
+    tags:
+      - Healthcheck
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: >
+          request latency histograms, in progress requests and status codes
+          per route, and tasks enqueued, in the Prometheus text format.
+    """
+    content, content_type = generate_metrics()
+    return current_app.response_class(content, content_type=content_type)
+
+
+def check_profiling_token():
+    if not is_authorized(request.headers.get(PROFILE_HEADER)):
+        raise APIError(403, {"msg": f"Missing or invalid {PROFILE_HEADER} header."})
+
+
+@api_blueprint.route("/profiles", methods=["GET"])
+def profiles():
+    """
+    Recent request and task profiles, newest first
+    ---
+    tags:
+      - Healthcheck
+    parameters:
+      - name: X-Profile
+        in: header
+        type: string
+        required: true
+        description: the PROFILING_TOKEN.
+    responses:
+      200:
+        description: the name and size of each profile.
+      403:
+        description: missing or invalid X-Profile header.
+    """
+    check_profiling_token()
+    return jsonify({"profiles": list_profiles()})
+
+
+@api_blueprint.route("/profiles/<name>", methods=["GET"])
+def download_profile(name: str):
+    """
+    Download a profile (a pstats file, e.g. for snakeviz)
+    ---
+    tags:
+      - Healthcheck
+    parameters:
+      - name: X-Profile
+        in: header
+        type: string
+        required: true
+        description: the PROFILING_TOKEN.
+      - name: name
+        in: path
+        type: string
+        required: true
+      - name: format
+        in: query
+        type: string
+        enum: [pstats, text]
+        default: pstats
+        description: text returns the functions with the highest cumulative time.
+    responses:
+      200:
+        description: the profile.
+      403:
+        description: missing or invalid X-Profile header.
+      404:
+        description: unknown profile.
+    """
+    check_profiling_token()
+    path = get_profile_path(name)
+    if path is None:
+        raise APIError(404, {"msg": "Profile not found."})
+
+    if request.args.get("format") == "text":
+        return current_app.response_class(format_profile(path), mimetype="text/plain")
+    return send_file(path, as_attachment=True, download_name=name)
+
+
+@api_blueprint.route("/memory/snapshot", methods=["POST"])
+def memory_snapshot():
+    """
+    Memory growth of the worker process that answered the request
+    ---
+    tags:
+      - Healthcheck
+    description: >
+      Takes a tracemalloc snapshot (tracing the allocations from now on,
+      if it was not already) and compares it with the first one of the
+      process, or the previous one. Each gunicorn worker has its own.
+      Tracing slows every allocation down, so stop it with the last
+      snapshot.
+    parameters:
+      - name: X-Profile
+        in: header
+        type: string
+        required: true
+        description: the PROFILING_TOKEN.
+      - name: compare_to
+        in: query
+        type: string
+        enum: [baseline, previous]
+        default: baseline
+      - name: limit
+        in: query
+        type: integer
+        description: allocation sites on the report.
+      - name: reset
+        in: query
+        type: boolean
+        description: make this snapshot the new baseline.
+      - name: stop
+        in: query
+        type: boolean
+        description: >
+          stop tracing after this snapshot (the snapshots are discarded,
+          the next one starts over).
+    responses:
+      200:
+        description: >
+          the process pid, its traced and resident memory, and the
+          allocation sites that grew the most.
+      400:
+        description: invalid compare_to or limit.
+      403:
+        description: missing or invalid X-Profile header.
+    """
+    check_profiling_token()
+
+    compare_to = request.args.get("compare_to", "baseline")
+    if compare_to not in COMPARE_TO:
+        raise APIError(
+            400, {"msg": f"compare_to must be one of {', '.join(COMPARE_TO)}."}
+        )
+    limit = request.args.get("limit", MEMORY_TOP_STATS, type=int)
+    if limit < 1:
+        raise APIError(400, {"msg": "limit must be a positive integer."})
+    reset = request.args.get("reset", "false").lower() in ("1", "true")
+    stop = request.args.get("stop", "false").lower() in ("1", "true")
+
+    report = memory_tracker.snapshot(compare_to=compare_to, limit=limit, reset=reset)
+    if stop:
+        memory_tracker.stop()
+    report["tracing"] = not stop
+    return jsonify(report)
+
+
 @api_blueprint.route("/welcome/<person>", methods=["GET"])
 def welcome(person: str):
     """
@@ -173,6 +504,10 @@ def login():
     responses:
       200:
         description: JWT temporary access token & JWT long-live refresh token
+      429:
+        description: too many authentication requests, try again later.
+      503:
+        description: authentication is temporarily unavailable.
     """
     data = request.get_json()
 
@@ -180,9 +515,8 @@ def login():
     password = data["password"]
 
     user = User.get_by(email=email)
-    is_valid_password = user.check_password(password=password)
 
-    if user and is_valid_password:
+    if user and user.check_password(password=password):
         # temporary access token:
         access_token = create_access_token(
             identity=str(user.uuid), expires_delta=timedelta(hours=1)
@@ -242,6 +576,10 @@ def create_user():
     responses:
       201:
         description: created user data.
+      429:
+        description: too many authentication requests, try again later.
+      503:
+        description: authentication is temporarily unavailable.
     """
     data = request.get_json()
 
@@ -295,6 +633,10 @@ def update_user():
     responses:
       200:
         description: updated user info
+      429:
+        description: too many authentication requests, try again later.
+      503:
+        description: authentication is temporarily unavailable.
     """
     user_uuid = get_jwt_identity()
 
@@ -316,3 +658,210 @@ def update_user():
         ),
         200,
     )
+
+
+def user_summary(uuid, username: str, email: str, created_at: datetime) -> dict:
+    return {
+        "uuid": str(uuid),
+        "username": username,
+        "email": email,
+        "created_at": created_at.isoformat(),
+    }
+
+
+@api_blueprint.route("/users", methods=["GET"])
+@jwt_required()
+def list_users():
+    """
+    List users, oldest first
+    ---
+    tags:
+      - Users
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        description: users per page (ignored with format=ndjson).
+      - name: cursor
+        in: query
+        type: string
+        description: the next_cursor of the previous page.
+      - name: format
+        in: query
+        type: string
+        enum: [json, ndjson]
+        default: json
+        description: >
+          ndjson streams all the users (after the cursor, if given),
+          one json object per line.
+    responses:
+      200:
+        description: a page of users and the next_cursor (null on the last page).
+      400:
+        description: invalid limit, cursor or format.
+    """
+    data_format = request.args.get("format", "json")
+    if data_format not in ("json", "ndjson"):
+        raise APIError(400, {"msg": "format must be json or ndjson."})
+
+    limit = request.args.get("limit", USERS_PAGE_SIZE, type=int)
+    if not 1 <= limit <= USERS_PAGE_MAX_SIZE:
+        raise APIError(
+            400, {"msg": f"limit must be between 1 and {USERS_PAGE_MAX_SIZE}."}
+        )
+
+    after = None
+    if request.args.get("cursor"):
+        try:
+            after = decode_cursor(request.args["cursor"])
+        except ValueError:
+            raise APIError(400, {"msg": "Invalid cursor."})
+
+    if data_format == "ndjson":
+
+        def generate():
+            for user in User.iterate(batch_size=USERS_STREAM_BATCH_SIZE, after=after):
+                yield json.dumps(user_summary(**user)) + "\n"
+
+        return current_app.response_class(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+    # one more than the page, to know whether there is a next one
+    users = User.list_page(limit=limit + 1, after=after)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(users[-1].created_at, users[-1].uuid)
+
+    return (
+        jsonify(
+            {
+                "users": [
+                    user_summary(
+                        user.uuid, user.username, user.email, user.created_at
+                    )
+                    for user in users
+                ],
+                "next_cursor": next_cursor,
+            }
+        ),
+        200,
+    )
+
+
+@api_blueprint.route("/users/export", methods=["POST"])
+@jwt_required()
+def start_users_export():
+    """
+    Export all the users (as gzip compressed NDJSON files) on the background
+    ---
+    tags:
+      - Users
+    responses:
+      202:
+        description: the task_id of the export, to follow it on /users/export/{task_id}.
+    """
+    task_id = publish_task(export_users)
+    return jsonify({"task_id": task_id}), 202
+
+
+@api_blueprint.route("/users/export/<task_id>", methods=["GET"])
+@jwt_required()
+def get_users_export(task_id: str):
+    """
+    Progress of a users export
+    ---
+    tags:
+      - Users
+    parameters:
+      - name: task_id
+        in: path
+        type: string
+        required: true
+    responses:
+      200:
+        description: status (running, done or failed), users exported so far and files.
+      404:
+        description: unknown export (or it did not start yet).
+    """
+    manifest = read_manifest(EXPORTS_DIR, task_id)
+    if manifest is None:
+        raise APIError(404, {"msg": "Export not found."})
+    return jsonify(manifest), 200
+
+
+@api_blueprint.route("/users/bulk", methods=["POST"])
+@jwt_required()
+def import_users_bulk():
+    """
+    Import many users at once
+    ---
+    tags:
+      - Users
+    consumes:
+      - text/csv
+      - application/x-ndjson
+    parameters:
+      - name: body
+        in: body
+        required: true
+        description: >
+          CSV (with a "username,email,password" header) or NDJSON (one
+          {"username", "email", "password"} object per line), as set by
+          the Content-Type. Bigger imports should use the
+          "flask users import" command.
+      - name: on_conflict
+        in: query
+        type: string
+        enum: [skip]
+        default: skip
+        description: >
+          the rows of users that already exist are reported as errors.
+          Updating existing users (their email and password) is left to
+          the "flask users import" command.
+    responses:
+      200:
+        description: created and failed rows, with the errors per line.
+      400:
+        description: invalid content type or on_conflict.
+      413:
+        description: too many rows.
+      429:
+        description: too many authentication requests, try again later.
+      503:
+        description: >
+          authentication is temporarily unavailable, or the passwords could
+          not be hashed within USERS_IMPORT_REQUEST_TIMEOUT seconds.
+    """
+    data_format = CONTENT_TYPES.get(request.mimetype)
+    if data_format is None:
+        raise APIError(
+            400, {"msg": f"Content-Type must be one of {', '.join(CONTENT_TYPES)}."}
+        )
+
+    on_conflict = request.args.get("on_conflict", "skip")
+    if on_conflict not in HTTP_ON_CONFLICT:
+        raise APIError(
+            400, {"msg": f"on_conflict must be one of {', '.join(HTTP_ON_CONFLICT)}."}
+        )
+
+    stream = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    try:
+        rows = list(islice(read_rows(stream, data_format), USERS_IMPORT_MAX_ROWS + 1))
+    except UnicodeDecodeError:
+        raise APIError(400, {"msg": "The body must be UTF-8 encoded."})
+    except csv.Error as error:
+        raise APIError(400, {"msg": f"Invalid CSV: {error}"})
+
+    if len(rows) > USERS_IMPORT_MAX_ROWS:
+        raise APIError(
+            413, {"msg": f"At most {USERS_IMPORT_MAX_ROWS} users per request."}
+        )
+
+    # a fixed budget, whatever the rows: the request thread is not to be
+    # held for long (bigger imports should use the command)
+    report = import_users(
+        rows, on_conflict=on_conflict, timeout=USERS_IMPORT_REQUEST_TIMEOUT
+    )
+    return jsonify(report.as_dict()), 200
@@ -0,0 +1,84 @@
+"""
+Broker (celery producer) connections: warm-up and publish instrumentation.
+
+Every request thread that publishes a task takes a producer (with its own
+broker connection) from the celery producer pool, and waits for one if the
+pool is exhausted. The pool is sized from the gunicorn threads per worker
+(see settings.BROKER_POOL_LIMIT), and the time each publish takes, from
+waiting for a producer to the message being sent, is recorded here (with
+the publishes that failed), so that slow enqueues show up on /stats.
+"""
+
+import logging
+from contextlib import contextmanager
+from time import perf_counter
+
+from kombu import pools
+
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.instrumentation import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+publish_stats = LatencyStats('task_publish', slow_ms=settings.BROKER_PUBLISH_SLOW_MS)
+
+
+@contextmanager
+def time_publish(task_name: str):
+    """
+    Record the time a publish takes (used around Task.apply_async, see
+    extensions.py), or that it failed.
+    """
+    started_at = perf_counter()
+    try:
+        yield
+    except Exception:
+        publish_stats.record_error()
+        raise
+
+    elapsed_ms = (perf_counter() - started_at) * 1000
+    publish_stats.observe(elapsed_ms)
+    if elapsed_ms > publish_stats.slow_ms:
+        logger.warning(f'Slow task publish: {task_name} took {elapsed_ms:.1f}ms.')
+
+
+def reset_broker_connections(celery):
+    """
+    Drop the broker connections inherited from the parent process, to be
+    called right after a fork (celery and kombu do it on the processes
+    started by multiprocessing, but not on the gunicorn workers). They are
+    left open for the parent: closing them would close its connections.
+    """
+    celery._after_fork()  # pylint: disable=protected-access
+    # the connection and producer pools are shared by the apps, per broker
+    pools.connections.clear()
+    pools.producers.clear()
+
+
+def warm_up_broker_connections(celery, connections: int = 1):
+    """
+    Open broker connections on the producer pool, so that the first
+    requests of a new worker do not pay for the connection handshake.
+    """
+    if celery.conf.task_always_eager:
+        return
+
+    producers = []
+    try:
+        for _ in range(connections):
+            producer = celery.producer_pool.acquire(block=True, timeout=1)
+            producer.connection.ensure_connection(max_retries=1)
+            producers.append(producer)
+        logger.info(f'Warmed up {len(producers)} broker connection(s).')
+    except Exception:
+        logger.warning('Could not warm up the broker connections.', exc_info=True)
+    finally:
+        for producer in producers:
+            producer.release()
+
+
+def get_broker_stats(celery) -> dict:
+    return {
+        'pool_limit': celery.conf.broker_pool_limit,
+        'publish': publish_stats.snapshot(),
+    }
@@ -1,30 +1,42 @@
+import base64
 import os
 import re
+from datetime import datetime
 from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple, Union
+from uuid import UUID
 
 from sqlalchemy.orm import Query
 from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import ClauseElement
 
 
-def get_query_raw_sql(query: Query) -> str:
+def get_query_raw_sql(
+    query: Union[Query, ClauseElement], params: Optional[dict] = None
+) -> str:
     """
-    Convert a SQLAlchemy query to a readable SQL string with parameters.
+    Convert a SQLAlchemy query (or statement) to a readable SQL string
+    with parameters. params are the values of its bound parameters given
+    when executing it, if any.
 
     Useful for debugging.
     """
+    statement = query.statement if isinstance(query, Query) else query
+    if params:
+        statement = statement.params(params)
+
     try:
         # Try with PostgreSQL dialect which handles UUIDs better
         raw_query = str(
-            query.statement.compile(
+            statement.compile(
                 dialect=postgresql.dialect(),
                 compile_kwargs={"literal_binds": True},
             )
         )
     except Exception:
         # Fallback to parameters approach if literal binds fail
-        compiled = query.statement.compile()
+        compiled = statement.compile()
         params = compiled.params
         raw_query = f"{str(compiled)} [params: {params}]"
 
@@ -32,6 +44,26 @@ def get_query_raw_sql(query: Query) -> str:
     return raw_query
 
 
+def encode_cursor(created_at: datetime, uuid: UUID) -> str:
+    """
+    Opaque pagination cursor with the key of the last item of a page.
+    """
+    key = f"{created_at.isoformat()},{uuid}"
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """
+    Raise ValueError when the cursor was not created by encode_cursor().
+    """
+    try:
+        key = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, uuid = key.split(",")
+    except ValueError as error:  # also base64 and unicode errors
+        raise ValueError(f"Invalid cursor: {cursor}") from error
+    return datetime.fromisoformat(created_at), UUID(uuid)
+
+
 def get_version_file_path() -> str:
     root_path = Path().absolute()
     file_path = os.path.join(str(root_path), "VERSION")
@@ -0,0 +1,110 @@
+"""
+Database connection pool: sizing, fork safety and checkout instrumentation.
+
+Each process (gunicorn worker or celery worker process) has its own
+SQLAlchemy engine and connection pool, sized from the gunicorn threads
+(see settings.DATABASE_POOL_SIZE). So the most connections the web app
+can open is workers * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW), which
+must fit in the postgres max_connections (with room for the celery
+workers, migrations, etc).
+
+Connections must not be shared across a fork, so the engine is disposed
+(without closing the parent's connections) on every new gunicorn worker
+and celery worker process. The time threads wait for a connection is
+recorded here and shown on /stats, with the pool usage.
+"""
+
+import logging
+from time import perf_counter
+
+from celery.signals import worker_process_init
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.instrumentation import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+pool_wait_stats = LatencyStats(
+    'db_pool_wait', slow_ms=settings.DATABASE_POOL_SLOW_WAIT_MS
+)
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waits for a connection
+    (including opening a new one, when the pool is not full yet).
+    """
+
+    def _do_get(self):
+        started_at = perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_wait_stats.record_error()
+            logger.error(
+                f'Timed out waiting for a database connection ({self.status()}).'
+            )
+            raise
+
+        elapsed_ms = (perf_counter() - started_at) * 1000
+        pool_wait_stats.observe(elapsed_ms)
+        if elapsed_ms > pool_wait_stats.slow_ms:
+            logger.warning(
+                f'Waited {elapsed_ms:.1f}ms for a database connection '
+                f'({self.status()}).'
+            )
+        return connection
+
+
+def get_engine_options() -> dict:
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': settings.DATABASE_POOL_SIZE,
+        'max_overflow': settings.DATABASE_MAX_OVERFLOW,
+        'pool_timeout': settings.DATABASE_POOL_TIMEOUT,
+        'pool_recycle': settings.DATABASE_POOL_RECYCLE,
+        'pool_pre_ping': settings.DATABASE_POOL_PRE_PING,
+        'connect_args': {'connect_timeout': settings.DATABASE_CONNECT_TIMEOUT},
+    }
+
+
+def dispose_engine(app):
+    """
+    Drop the connections inherited from the parent process, to be called
+    right after a fork. close=False leaves them open for the parent.
+    """
+    # pylint: disable=import-outside-toplevel
+    from {{ cookiecutter.project_slug }}.extensions import db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+_app = None
+
+
+def init_fork_safety(app):
+    global _app
+    _app = app
+
+
+@worker_process_init.connect
+def _on_worker_process_init(**kwargs):
+    # gunicorn workers do the same on their post_fork hook
+    if _app is not None:
+        dispose_engine(_app)
+
+
+def get_database_pool_stats(engine) -> dict:
+    pool = engine.pool
+    return {
+        'pool_size': pool.size(),
+        'max_overflow': settings.DATABASE_MAX_OVERFLOW,
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        # connections opened beyond pool_size
+        'overflow': max(pool.overflow(), 0),
+        'wait': pool_wait_stats.snapshot(),
+    }
@@ -3,3 +3,31 @@ class APIError(Exception):
         super().__init__(self)
         self.status_code = status_code
         self.payload = payload
+
+
+class PasswordHashingUnavailable(APIError):
+    """
+    Raised when the password hashing pool can not take more work.
+
+    429 means the pool queue is full (the client should back off),
+    503 means the pool is not answering in time.
+    """
+
+    def __init__(self, status_code, message):
+        super().__init__(status_code, {'msg': message})
+
+
+class TaskQueueUnavailable(APIError):
+    """
+    Raised when tasks can not be published to the broker, nor spooled.
+    """
+
+    def __init__(self):
+        super().__init__(503, {'msg': 'Task queue is temporarily unavailable.'})
+
+
+class TaskSpoolFull(TaskQueueUnavailable):
+    """
+    Raised when the broker is unavailable and the local task spool
+    has no room left for more messages.
+    """
@@ -0,0 +1,126 @@
+"""
+User exports (see tasks.export_users), written as gzip compressed NDJSON.
+
+The users are read from a server-side cursor and written to rotating chunk
+files (users-<export id>-00001.ndjson.gz, ...) on EXPORTS_DIR, so the
+worker memory does not depend on how many users there are. The progress
+is kept on a manifest (<export id>.json) next to the chunks, which is
+what GET /users/export/<export id> returns.
+"""
+
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Callable, List, Optional
+from uuid import UUID
+
+from {{ cookiecutter.project_slug }}.models import User
+
+logger = logging.getLogger(__name__)
+
+
+class NDJSONChunkWriter:
+    """
+    Write records as NDJSON to gzip files of up to rows_per_chunk lines.
+    """
+
+    def __init__(self, directory: str, prefix: str, rows_per_chunk: int):
+        self.directory = directory
+        self.prefix = prefix
+        self.rows_per_chunk = rows_per_chunk
+        self.files: List[str] = []
+        self.rows = 0
+        self._file = None
+        self._chunk_rows = 0
+
+    def write(self, record: dict):
+        if self._file is None or self._chunk_rows >= self.rows_per_chunk:
+            self._open_next_chunk()
+        self._file.write(json.dumps(record).encode('utf-8') + b'\n')
+        self._chunk_rows += 1
+        self.rows += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _open_next_chunk(self):
+        self.close()
+        file_name = f'{self.prefix}-{len(self.files) + 1:05d}.ndjson.gz'
+        self._file = gzip.open(os.path.join(self.directory, file_name), 'wb')
+        self.files.append(file_name)
+        self._chunk_rows = 0
+
+
+def get_manifest_path(directory: str, export_id: str) -> str:
+    return os.path.join(directory, f'{UUID(export_id)}.json')
+
+
+def write_manifest(directory: str, manifest: dict):
+    path = get_manifest_path(directory, manifest['id'])
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(f'{path}.tmp', path)  # readers never see a partial manifest
+
+
+def read_manifest(directory: str, export_id: str) -> Optional[dict]:
+    """
+    Return None when there is no such export (or the id is not valid).
+    """
+    try:
+        with open(get_manifest_path(directory, export_id), encoding='utf-8') as file:
+            return json.load(file)
+    except (ValueError, FileNotFoundError):
+        return None
+
+
+def export_users(
+    export_id: str,
+    directory: str,
+    rows_per_chunk: int,
+    batch_size: int,
+    on_progress: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    writer = NDJSONChunkWriter(directory, f'users-{export_id}', rows_per_chunk)
+    manifest = {
+        'id': export_id,
+        'status': 'running',
+        'rows': 0,
+        'files': writer.files,
+        'directory': directory,
+        'started_at': datetime.utcnow().isoformat(),
+        'finished_at': None,
+    }
+    write_manifest(directory, manifest)
+
+    def report_progress():
+        manifest['rows'] = writer.rows
+        write_manifest(directory, manifest)
+        if on_progress is not None:
+            on_progress(manifest)
+
+    try:
+        for user in User.iterate(batch_size=batch_size):
+            user['uuid'] = str(user['uuid'])
+            user['created_at'] = user['created_at'].isoformat()
+            writer.write(user)
+            if writer.rows % batch_size == 0:
+                report_progress()
+    except Exception:
+        manifest['status'] = 'failed'
+        raise
+    else:
+        manifest['status'] = 'done'
+    finally:
+        writer.close()
+        manifest['finished_at'] = datetime.utcnow().isoformat()
+        report_progress()
+
+    logger.info(
+        f'Exported {writer.rows} users to {len(writer.files)} file(s) on {directory}.'
+    )
+    return manifest
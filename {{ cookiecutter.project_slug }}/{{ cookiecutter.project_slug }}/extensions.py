@@ -4,25 +4,36 @@ from the official flask docs for app factories:
 https://flask.palletsprojects.com/en/1.1.x/patterns/appfactories/#factories-extensions
 """
 
+import click
 from celery import Celery
-from flasgger import Swagger
+from flask.cli import ScriptInfo
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from {{cookiecutter.project_slug}} import settings
+from {{cookiecutter.project_slug}}.broker import time_publish
+from {{cookiecutter.project_slug}}.database import get_engine_options, init_fork_safety
+from {{cookiecutter.project_slug}}.hashing import PasswordHasher
+from {{cookiecutter.project_slug}}.profiling import profile_task
+from {{cookiecutter.project_slug}}.serializers import SERIALIZER_NAME, init_serializer
+from {{cookiecutter.project_slug}}.tracing import start_task_span
 
 
 bcrypt = Bcrypt()
+password_hasher = PasswordHasher()
 jwt = JWTManager()
 
 
 def init_swagger(app):
+    # flasgger (with jsonschema and yaml) is only needed by the web app
+    from flasgger import Swagger
+
     return Swagger(app, template=settings.SWAGGER_TEMPLATE)
 
 
 def init_bcrypt(app):
     app.config['JWT_SECRET_KEY'] = settings.JWT_SECRET_KEY
+    password_hasher.init_app(app)
     bcrypt.init_app(app)
 
 
@@ -37,18 +48,38 @@ def init_celery(app):
     password = settings.QUEUE_PASSWORD
     host = settings.QUEUE_HOST
     port = settings.QUEUE_PORT
-    broker = f'amqp://{user}:{password}@{host}:{port}//'
+    broker_url = f'amqp://{user}:{password}@{host}:{port}//'
+
+    init_serializer(threshold=settings.TASK_COMPRESSION_THRESHOLD)
 
     # Create the Celery instance with the Flask app's import name
     celery = Celery(app.import_name)
 
     # Set the broker and other Celery configuration values
-    celery.conf.broker_url = broker
+    celery.conf.broker_url = broker_url
     configuration = {
         'task_default_queue': settings.DEFAULT_QUEUE_NAME,
         'task_create_missing_queues': True,
+        'broker_pool_limit': settings.BROKER_POOL_LIMIT,
+        'broker_connection_timeout': settings.BROKER_CONNECTION_TIMEOUT,
+        # py-amqp socket write timeout, so that publishing to a stalled
+        # broker fails fast (and goes to the spool) instead of blocking
+        'broker_transport_options': {'write_timeout': settings.BROKER_PUBLISH_TIMEOUT},
         'task_routes': settings.TASKS_QUEUES,
-        'accept_content': ['pickle', 'json'],
+        'task_serializer': settings.TASK_SERIALIZER,
+        # The task options win over the route ones when publishing,
+        # so the serializers chosen on the routes are set on the tasks.
+        'task_annotations': {
+            task_name: {'serializer': route['serializer']}
+            for task_name, route in settings.TASKS_QUEUES.items()
+            if 'serializer' in route
+        },
+        'accept_content': ['json', SERIALIZER_NAME],
+        # recycle the pool processes (see recycling.py), after their task.
+        # By name, so that only the workers import the pool.
+        'worker_pool': f'{__package__}.recycling:TaskPool',
+        'worker_max_tasks_per_child': settings.CELERY_MAX_TASKS_PER_CHILD or None,
+        'worker_max_memory_per_child': settings.CELERY_MAX_RSS_MB * 1024 or None,  # KiB
     }
 
     if settings.IS_DEV_APP:
@@ -62,14 +93,23 @@ def init_celery(app):
     flask_config.pop('broker_url', None)
     celery.conf.update(flask_config)
 
-    # Wrap tasks to run within the Flask app context
+    # Wrap tasks to run within the Flask app context, on a span that
+    # continues the trace of the request that published them, and under
+    # the profiler when requested (see profiling.py). Their publishes are
+    # timed, waiting for a producer included (see broker.py).
     TaskBase = celery.Task
 
     class ContextTask(TaskBase):
         def __call__(self, *args, **kwargs):
-            with app.app_context():
+            with app.app_context(), start_task_span(self), profile_task(self):
                 return TaskBase.__call__(self, *args, **kwargs)
 
+        def apply_async(self, *args, **kwargs):
+            if self.app.conf.task_always_eager:  # runs it, nothing is published
+                return TaskBase.apply_async(self, *args, **kwargs)
+            with time_publish(self.name):
+                return TaskBase.apply_async(self, *args, **kwargs)
+
     celery.Task = ContextTask
 
     # Optionally store the celery instance on the app for later use
@@ -79,17 +119,36 @@ def init_celery(app):
     return celery
 
 
-db = SQLAlchemy()
-migrate = Migrate()
+# The model writes load the database generated values with RETURNING, so
+# there is no need to expire (and reload with a SELECT) them on commit.
+db = SQLAlchemy(session_options={'expire_on_commit': False})
 
 
 # pylint: disable=unused-import
 def init_db(app):
     app.config['SQLALCHEMY_DATABASE_URI'] = settings.SQLALCHEMY_DATABASE_URI
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options()
     db.init_app(app)
+    init_fork_safety(app)
 
     # models must be imported here so that the migrations app detect them
-    from {{ cookiecutter.project_slug }}.models import User
+    from {{ cookiecutter.project_slug }}.models import OutboxMessage, User
+
+    init_migrate(app)
+
+
+def init_migrate(app):
+    """
+    The flask db commands, only when the app is loaded by the flask CLI:
+    flask_migrate imports alembic, which takes about a third of the time
+    it takes to import the whole app.
+    """
+    context = click.get_current_context(silent=True)
+    if context is None or context.find_object(ScriptInfo) is None:
+        return
+
+    from flask_migrate import Migrate
 
-    migrate.init_app(app, db)
+    # compare_server_default: generate migrations for server defaults changes
+    Migrate(app, db, compare_server_default=True)
@@ -8,6 +8,10 @@ from {{cookiecutter.project_slug}}.extensions import (
     init_bcrypt,
     init_jwt,
 )
+from {{cookiecutter.project_slug}}.metrics import init_metrics
+from {{cookiecutter.project_slug}}.profiling import init_profiling
+from {{cookiecutter.project_slug}}.queries import init_query_tracking
+from {{cookiecutter.project_slug}}.tracing import init_tracing
 
 PKG_NAME = os.path.dirname(os.path.realpath(__file__)).split("/")[-1]
 
@@ -26,7 +30,42 @@ def create_app():
 
     init_jwt(app)
 
+    # first, so that the other hooks run within the request span
+    init_tracing(app)
+
+    init_profiling(app)
+
+    init_metrics(app)
+
+    init_query_tracking(app)
+
     from {{cookiecutter.project_slug}}.api import api_blueprint
 
     app.register_blueprint(api_blueprint)
+
+    from {{cookiecutter.project_slug}}.outbox import outbox_cli
+    from {{cookiecutter.project_slug}}.user_import import users_cli
+
+    app.cli.add_command(outbox_cli)
+    app.cli.add_command(users_cli)
+    return app
+
+
+def create_worker_app():
+    """
+    The app of the celery workers: the database and celery, without the
+    web extensions (swagger, JWT, bcrypt), views and request hooks, which
+    the worker and its pool processes would load for nothing.
+    """
+    app = Flask(PKG_NAME)
+
+    init_db(app)
+
+    init_celery(app)
+
+    init_query_tracking(app)
+
+    # the worker signals (and remote control commands) of these modules
+    from {{cookiecutter.project_slug}} import memory, preload  # noqa: F401
+
     return app
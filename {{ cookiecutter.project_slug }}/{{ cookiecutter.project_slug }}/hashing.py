@@ -0,0 +1,316 @@
+"""
+Password hashing executor.
+
+bcrypt is CPU bound and holds the GIL, so hashing on the gunicorn request
+threads stalls every other request on that worker. Here the hashing runs on a
+small per-worker process pool instead, with a bounded number of pending jobs:
+when the pool is saturated new jobs are rejected right away (HTTP 429), and
+jobs that take too long are given up on (HTTP 503).
+
+The bcrypt cost (rounds) is calibrated at startup for the current hardware,
+see ``calibrate_rounds``.
+"""
+
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from statistics import median
+from time import perf_counter
+from typing import List, Optional
+
+import bcrypt as bcrypt_lib
+
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.exceptions import PasswordHashingUnavailable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROUNDS = 12  # same default as flask_bcrypt
+MIN_ROUNDS = 4  # bcrypt limits
+MAX_ROUNDS = 31
+CALIBRATION_ROUNDS = 8
+
+
+# NOTE: the functions below run on the pool processes,
+#       so they must be importable module level functions.
+def _hash_password(password: bytes, rounds: int) -> str:
+    return bcrypt_lib.hashpw(password, bcrypt_lib.gensalt(rounds)).decode('utf-8')
+
+
+def _hash_passwords(passwords: List[bytes], rounds: int) -> List[str]:
+    return [_hash_password(password, rounds) for password in passwords]
+
+
+def _check_password(pw_hash: bytes, password: bytes) -> bool:
+    return bcrypt_lib.checkpw(password, pw_hash)
+
+
+def _release_when_done(slots: threading.BoundedSemaphore, futures: list):
+    """
+    Release a job slot once every one of the futures is done (finished,
+    failed or cancelled), not when we stop waiting for them.
+    """
+    if not futures:
+        slots.release()
+        return
+
+    pending = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            pending[0] -= 1
+            if pending[0]:
+                return
+        slots.release()
+
+    for future in futures:
+        future.add_done_callback(on_done)
+
+
+def get_hash_rounds(pw_hash: str) -> int:
+    """
+    Return the cost a bcrypt hash was generated with.
+
+    bcrypt hashes record it themselves: they look like
+    "$2b$12$<salt><checksum>", where 12 is the cost.
+    """
+    return int(pw_hash.split('$')[2])
+
+
+@lru_cache(maxsize=None)
+def calibrate_rounds(target_ms: float, floor: int) -> int:
+    """
+    Return the highest bcrypt cost whose hashing time fits in target_ms
+    on this machine, but never less than floor.
+
+    Each extra round doubles the hashing time, so we only time a cheap cost
+    and extrapolate from it instead of hashing at the expensive ones.
+    """
+    timings = []
+    for _ in range(3):
+        started_at = perf_counter()
+        _hash_password(b'calibration', CALIBRATION_ROUNDS)
+        timings.append((perf_counter() - started_at) * 1000)
+
+    rounds = max(floor, MIN_ROUNDS)
+    elapsed_ms = median(timings) * 2 ** (rounds - CALIBRATION_ROUNDS)
+    while rounds < MAX_ROUNDS and elapsed_ms * 2 <= target_ms:
+        rounds += 1
+        elapsed_ms *= 2
+
+    logger.info(
+        f'Calibrated bcrypt cost: rounds={rounds}, '
+        f'estimated hashing time={elapsed_ms:.0f}ms (target={target_ms}ms).'
+    )
+    return rounds
+
+
+class PasswordHasher:
+    """
+    Flask extension that hashes and checks passwords with bcrypt.
+
+    With ``PASSWORD_HASHING_WORKERS=0`` the hashing runs inline
+    (on the calling thread), which is handy for development.
+    With ``BCRYPT_FAST_MODE`` the cost is set to the bcrypt minimum,
+    which is meant for the test suite.
+    """
+
+    def __init__(self, app=None):
+        self.rounds = DEFAULT_ROUNDS
+        self.workers = 0
+        self.max_pending = 0
+        self.timeout = None
+        self._executor = None
+        self._executor_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if settings.BCRYPT_FAST_MODE:
+            self.rounds = MIN_ROUNDS
+        else:
+            self.rounds = calibrate_rounds(
+                settings.BCRYPT_TARGET_HASH_MS, settings.BCRYPT_MIN_ROUNDS
+            )
+        # so that flask_bcrypt, if used directly, hashes with the same cost
+        app.config['BCRYPT_LOG_ROUNDS'] = self.rounds
+
+        self.configure(
+            workers=settings.PASSWORD_HASHING_WORKERS,
+            max_pending=settings.PASSWORD_HASHING_MAX_PENDING,
+            timeout=settings.PASSWORD_HASHING_TIMEOUT,
+        )
+
+        app.extensions = getattr(app, 'extensions', {})
+        app.extensions['password_hasher'] = self
+
+    def configure(self, workers: int, max_pending: int, timeout: float):
+        self.shutdown()
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def generate_password_hash(self, password: str) -> str:
+        return self._run(_hash_password, password.encode('utf-8'), self.rounds)
+
+    def generate_password_hashes(
+        self, passwords: List[str], timeout: Optional[float] = None
+    ) -> List[str]:
+        """
+        Hash many passwords (e.g. for a bulk import) spread across all the
+        pool processes. The whole bulk takes a single pending job slot,
+        until all of its chunks are done. It may take timeout seconds, by
+        default the pool timeout for each hash a process does in a row.
+        """
+        encoded = [password.encode('utf-8') for password in passwords]
+        if not self.workers or not encoded:
+            return [_hash_password(password, self.rounds) for password in encoded]
+
+        # the slot is released on the semaphore it was acquired from, even
+        # if configure() replaces it in the meantime
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise PasswordHashingUnavailable(
+                429, 'Too many authentication requests, try again later.'
+            )
+        size = max(1, len(encoded) // (self.workers * 4))
+        futures = []
+        try:
+            executor = self._get_executor()
+            for start in range(0, len(encoded), size):
+                futures.append(
+                    executor.submit(_hash_passwords, encoded[start:start + size], self.rounds)
+                )
+        except BrokenProcessPool:
+            for future in futures:
+                future.cancel()
+            _release_when_done(slots, futures)
+            logger.exception('Password hashing pool is broken, restarting it.')
+            self.shutdown()
+            raise PasswordHashingUnavailable(
+                503, 'Authentication is temporarily unavailable.'
+            )
+        _release_when_done(slots, futures)
+
+        # each pool process hashes its share of the bulk one after the other
+        if timeout is None and self.timeout is not None:
+            timeout = self.timeout * math.ceil(len(encoded) / self.workers)
+        deadline = None if timeout is None else perf_counter() + timeout
+        try:
+            hashes = []
+            for future in futures:
+                remaining = None if deadline is None else max(0, deadline - perf_counter())
+                hashes.extend(future.result(timeout=remaining))
+            return hashes
+        except FutureTimeoutError:
+            for future in futures:
+                future.cancel()  # only the chunks that did not start yet
+            logger.warning(
+                f'Hashing {len(encoded)} passwords did not finish in {timeout} seconds.'
+            )
+            raise PasswordHashingUnavailable(
+                503, 'Authentication is temporarily unavailable.'
+            )
+        except BrokenProcessPool:
+            logger.exception('Password hashing pool is broken, restarting it.')
+            self.shutdown()
+            raise PasswordHashingUnavailable(
+                503, 'Authentication is temporarily unavailable.'
+            )
+
+    def check_password_hash(self, pw_hash: str, password: str) -> bool:
+        return self._run(
+            _check_password, pw_hash.encode('utf-8'), password.encode('utf-8')
+        )
+
+    def warm_up(self):
+        """
+        Start the pool processes (and load bcrypt on them) before the
+        first requests need them, with a hash at the minimum cost on each.
+        """
+        if not self.workers:
+            _hash_password(b'warm-up', MIN_ROUNDS)
+            return
+        executor = self._get_executor()
+        futures = [
+            executor.submit(_hash_password, b'warm-up', MIN_ROUNDS)
+            for _ in range(self.workers)
+        ]
+        for future in futures:
+            future.result(timeout=self.timeout)
+
+    def needs_rehash(self, pw_hash: str) -> bool:
+        return get_hash_rounds(pw_hash) < self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._executor_pid = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            # A pool inherited from a parent process (e.g. the gunicorn
+            # master) can not be used after the fork: start a new one.
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('fork'),
+                )
+                self._executor_pid = os.getpid()
+                logger.info(
+                    f'Started password hashing pool with {self.workers} '
+                    f'process(es) (pid={self._executor_pid}).'
+                )
+            return self._executor
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+
+        slots = self._slots  # see generate_password_hashes
+        if not slots.acquire(blocking=False):
+            raise PasswordHashingUnavailable(
+                429, 'Too many authentication requests, try again later.'
+            )
+        try:
+            future = self._get_executor().submit(function, *args)
+        except BrokenProcessPool:
+            slots.release()
+            logger.exception('Password hashing pool is broken, restarting it.')
+            self.shutdown()
+            raise PasswordHashingUnavailable(
+                503, 'Authentication is temporarily unavailable.'
+            )
+        # Released when the job is done, not when we stop waiting for it: a
+        # job that timed out keeps its pool process busy until it finishes.
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # only if it did not start yet
+            logger.warning(
+                f'Password hashing did not finish in {self.timeout} seconds.'
+            )
+            raise PasswordHashingUnavailable(
+                503, 'Authentication is temporarily unavailable.'
+            )
+        except BrokenProcessPool:
+            logger.exception('Password hashing pool is broken, restarting it.')
+            self.shutdown()
+            raise PasswordHashingUnavailable(
+                503, 'Authentication is temporarily unavailable.'
+            )
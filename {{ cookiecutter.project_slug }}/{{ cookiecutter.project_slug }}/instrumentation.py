@@ -0,0 +1,64 @@
+"""
+In-process latency statistics.
+
+Each gunicorn worker / celery process keeps its own numbers, which are
+exposed (for that process) on the /stats endpoint.
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Dict
+
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyStats:
+    """
+    Thread-safe summary of the latencies of an operation: count, total,
+    max, how many were slower than slow_ms, how many failed and a
+    histogram (cumulative counts per upper bound, in milliseconds).
+    """
+
+    def __init__(self, name: str, slow_ms: float):
+        self.name = name
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total_ms = 0.0
+            self.max_ms = 0.0
+            self.slow = 0
+            self.errors = 0
+            self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def observe(self, elapsed_ms: float):
+        with self._lock:
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            if elapsed_ms > self.slow_ms:
+                self.slow += 1
+            self.buckets[bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            histogram, cumulative = {}, 0
+            for bound, bucket_count in zip(BUCKETS_MS + ('+Inf',), self.buckets):
+                cumulative += bucket_count
+                histogram[str(bound)] = cumulative
+            return {
+                'count': self.count,
+                'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0,
+                'max_ms': round(self.max_ms, 3),
+                'slow_ms': self.slow_ms,
+                'slow': self.slow,
+                'errors': self.errors,
+                'histogram_ms': histogram,
+            }
@@ -0,0 +1,289 @@
+"""
+Memory growth of the web and worker processes, with tracemalloc.
+
+Each process snapshots the memory allocated by Python (per allocation
+site, its file and line) and compares it with its first snapshot (the
+baseline) or with the previous one, so the sites that keep growing (the
+leaks) come first on the report.
+
+Snapshots are taken:
+
+- on demand, on the gunicorn worker that answers POST /memory/snapshot
+  (see api.py), which starts tracemalloc if needed;
+- every MEMORY_SNAPSHOT_INTERVAL seconds on every process, with
+  MEMORY_TRACING_ENABLED. The celery pool processes write their last
+  report to MEMORY_REPORTS_DIR, since the `memory` remote control command
+  (python celery_worker.py inspect memory) is answered by the worker main
+  process, which returns them together with its own.
+"""
+
+import glob
+import json
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from typing import List, Optional, Union
+
+from celery.signals import worker_init, worker_process_init
+from celery.worker.control import inspect_command
+
+from {{ cookiecutter.project_slug }} import settings
+
+logger = logging.getLogger(__name__)
+
+COMPARE_TO = ('baseline', 'previous')
+
+# allocations of the tracing itself and of the import machinery
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def get_rss_bytes() -> Optional[int]:
+    """
+    Current resident set size, None when /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm', encoding='ascii') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_memory_usage(pid: Union[int, str] = 'self') -> Optional[dict]:
+    """
+    rss, pss (the shared pages split between the processes that share
+    them) and uss (the private pages, what the process would free on
+    exit) in bytes, from /proc/<pid>/smaps_rollup. None when it is not
+    available.
+    """
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='ascii') as smaps:
+            for line in smaps:
+                name, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[name] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        return None
+    return {
+        'rss_bytes': fields.get('Rss', 0),
+        'pss_bytes': fields.get('Pss', 0),
+        'uss_bytes': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def get_process_group_memory(parent_pid: int) -> List[dict]:
+    """
+    The memory usage of parent_pid and of its children (e.g. the gunicorn
+    master and its workers), with shared_bytes: the part of the rss that
+    is shared with other processes (rss - uss).
+    """
+    pids = [parent_pid]
+    for stat_path in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            with open(stat_path, encoding='ascii', errors='replace') as stat:
+                # the process name, in parenthesis, may have spaces
+                ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == parent_pid:
+            pids.append(int(stat_path.split('/')[2]))
+
+    group = []
+    for pid in pids:
+        usage = get_memory_usage(pid)
+        if usage is not None:  # exited, or not ours
+            usage['shared_bytes'] = usage['rss_bytes'] - usage['uss_bytes']
+            group.append({'pid': pid, 'parent': pid == parent_pid, **usage})
+    return group
+
+
+class MemoryTracker:
+    """
+    Snapshots of the current process. After a fork, the snapshots of the
+    parent process are discarded.
+    """
+
+    def __init__(self):
+        self.baseline = None
+        self.previous = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def start(self, frames: int = settings.MEMORY_TRACE_FRAMES):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info(f'Tracing memory allocations ({frames} frame(s)).')
+
+    def stop(self):
+        tracemalloc.stop()
+        with self._lock:
+            self.baseline = self.previous = None
+
+    def snapshot(
+        self,
+        compare_to: str = 'baseline',
+        limit: int = settings.MEMORY_TOP_STATS,
+        reset: bool = False,
+    ) -> dict:
+        """
+        Take a snapshot and return the allocation sites that grew the
+        most since the baseline (or the previous snapshot). With reset,
+        the snapshot becomes the new baseline.
+        """
+        if compare_to not in COMPARE_TO:
+            raise ValueError(f'compare_to must be one of {", ".join(COMPARE_TO)}.')
+        self.start()
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        taken_at = time.time()
+        with self._lock:
+            if self._pid != os.getpid():  # forked
+                self._pid = os.getpid()
+                self.baseline = self.previous = None
+
+            reference = self.baseline if compare_to == 'baseline' else self.previous
+            if self.baseline is None or reset:
+                self.baseline = (snapshot, taken_at)
+            self.previous = (snapshot, taken_at)
+
+        current, peak = tracemalloc.get_traced_memory()
+        report = {
+            'pid': os.getpid(),
+            'taken_at': taken_at,
+            'traced_memory_bytes': current,
+            'traced_memory_peak_bytes': peak,
+            'rss_bytes': get_rss_bytes(),
+            'compared_to': compare_to,
+            'seconds_since': None,
+            'top': [],
+        }
+        if reference is None:
+            return report
+
+        reference_snapshot, reference_taken_at = reference
+        report['seconds_since'] = round(taken_at - reference_taken_at, 3)
+        for stat in snapshot.compare_to(reference_snapshot, 'lineno')[:limit]:
+            frame = stat.traceback[0]
+            report['top'].append(
+                {
+                    'location': f'{frame.filename}:{frame.lineno}',
+                    'size_diff_bytes': stat.size_diff,
+                    'count_diff': stat.count_diff,
+                    'size_bytes': stat.size,
+                    'count': stat.count,
+                }
+            )
+        return report
+
+    def write_report(self, directory: str, report: dict):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{report["pid"]}.json')
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file)
+        os.replace(f'{path}.tmp', path)
+
+    def start_periodic_snapshots(self, interval: int, directory: Optional[str] = None):
+        """
+        Snapshot every interval seconds on a background thread, logging the
+        top growth (and writing the report to directory, if given).
+        """
+        self.start()
+        if interval <= 0 or self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    report = self.snapshot(compare_to='baseline')
+                    if directory is not None:
+                        self.write_report(directory, report)
+                    log_report(report, limit=5)
+                except Exception:
+                    logger.exception('Could not take a memory snapshot.')
+
+        threading.Thread(target=run, name='memory-snapshots', daemon=True).start()
+
+
+memory_tracker = MemoryTracker()
+
+
+def log_report(report: dict, limit: int):
+    growth = ', '.join(
+        f'{stat["location"]} {stat["size_diff_bytes"] / 1024:+.1f}KiB'
+        for stat in report['top'][:limit]
+    )
+    logger.info(
+        f'Memory of {report["pid"]}: {report["traced_memory_bytes"] / 1024:.0f}KiB '
+        f'traced, {(report["rss_bytes"] or 0) / 1024:.0f}KiB rss. '
+        f'Top growth since the {report["compared_to"]}: {growth or "-"}'
+    )
+
+
+def read_reports(directory: str) -> List[dict]:
+    """
+    The last reports of the processes that are still running (the ones
+    of the processes that exited are removed).
+    """
+    reports = []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        pid = int(os.path.basename(path).split('.')[0])
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            os.remove(path)
+            continue
+        except PermissionError:  # running, as another user
+            pass
+        try:
+            with open(path, encoding='utf-8') as report_file:
+                reports.append(json.load(report_file))
+        except (OSError, ValueError):
+            continue
+    return sorted(reports, key=lambda report: report['pid'])
+
+
+def start_memory_tracing(directory: Optional[str] = None):
+    """
+    On process start, with MEMORY_TRACING_ENABLED.
+    """
+    if settings.MEMORY_TRACING_ENABLED:
+        memory_tracker.start_periodic_snapshots(
+            settings.MEMORY_SNAPSHOT_INTERVAL, directory
+        )
+
+
+@worker_init.connect
+def _on_worker_init(**kwargs):
+    start_memory_tracing()
+
+
+@worker_process_init.connect
+def _on_worker_process_init(**kwargs):
+    start_memory_tracing(settings.MEMORY_REPORTS_DIR)
+
+
+@inspect_command(
+    args=[('compare_to', str), ('limit', int)],
+    signature='[compare_to=baseline|previous] [limit=20]',
+)
+def memory(state, compare_to='baseline', limit=settings.MEMORY_TOP_STATS):
+    """Memory growth of the worker process (and its pool processes)."""
+    try:
+        report = memory_tracker.snapshot(compare_to=compare_to, limit=limit)
+    except ValueError as error:
+        return {'error': str(error)}
+    return {
+        'worker': report,
+        'pool': read_reports(settings.MEMORY_REPORTS_DIR),
+    }
@@ -0,0 +1,344 @@
+"""
+Prometheus metrics, aggregated across processes.
+
+Every gunicorn worker (and celery process) writes its samples to its own
+memory-mapped files on METRICS_DIR (prometheus_client multiprocess mode),
+and /metrics merges the files of all of them. Writing a sample is an
+in-process mmap write, there is no IPC on the request path.
+
+METRICS_DIR must be emptied when the server starts (gunicorn on_starting
+hook), and should be on a tmpfs (e.g. /dev/shm) in production.
+
+The celery workers write theirs to CELERY_METRICS_DIR instead: the time
+each task waited on its queue (from the publish time, stamped on the
+message headers) and ran, per task and queue. The worker main process
+serves them on CELERY_METRICS_PORT.
+"""
+
+import glob
+import os
+import time
+from time import perf_counter
+
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.memory import get_process_group_memory
+
+# must be set before prometheus_client is imported
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', settings.METRICS_DIR)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+from celery.signals import (  # noqa: E402
+    after_task_publish,
+    before_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_shutdown,
+    worker_ready,
+)
+from flask import g, request  # noqa: E402
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Request latency, per route.',
+    ['method', 'route'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS = Counter(
+    'http_requests_total',
+    'Requests, per route and status code.',
+    ['method', 'route', 'status'],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress',
+    'Requests being handled, per route.',
+    ['method', 'route'],
+    multiprocess_mode='livesum',
+)
+TASKS_ENQUEUED = Counter(
+    'celery_tasks_enqueued_total', 'Tasks published to the broker.', ['task']
+)
+
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+TASK_QUEUE_WAIT = Histogram(
+    'celery_task_queue_wait_seconds',
+    'Time tasks waited on their queue, from publish to start.',
+    ['task', 'queue'],
+    buckets=TASK_BUCKETS,
+)
+TASK_DURATION = Histogram(
+    'celery_task_duration_seconds',
+    'Time tasks took to run.',
+    ['task', 'queue'],
+    buckets=TASK_BUCKETS,
+)
+TASKS_PROCESSED = Counter(
+    'celery_tasks_processed_total',
+    'Tasks run, per queue and final state.',
+    ['task', 'queue', 'state'],
+)
+TASK_FAILURES = Counter(
+    'celery_task_failures_total',
+    'Tasks that raised, per exception type.',
+    ['task', 'queue', 'exception'],
+)
+
+RECYCLES = Counter(
+    'worker_recycles_total',
+    'Web and celery pool processes recycled, per reason.',
+    ['process', 'reason'],
+)
+RECYCLE_RSS = Histogram(
+    'worker_recycle_rss_bytes',
+    'RSS of the processes when recycled.',
+    ['process'],
+    buckets=tuple(2**power * 1024**2 for power in range(5, 14)),  # 32MiB-8GiB
+)
+
+# message header with the time.time() the task was published
+PUBLISHED_AT_HEADER = 'published_at'
+
+
+def get_route() -> str:
+    # the url rule (e.g. /welcome/<person>), not the path, so that the
+    # number of label values stays bounded
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+# labelled children, per (method, route): .labels() hashes and validates
+# the label values on every call, which is most of the cost of a sample
+_route_metrics = {}
+_status_counters = {}
+
+
+def get_route_metrics(labels: tuple) -> tuple:
+    metrics = _route_metrics.get(labels)
+    if metrics is None:
+        metrics = _route_metrics[labels] = (
+            REQUEST_LATENCY.labels(*labels),
+            REQUESTS_IN_PROGRESS.labels(*labels),
+        )
+    return metrics
+
+
+def get_requests_counter(labels: tuple, status: int):
+    key = (*labels, status)
+    counter = _status_counters.get(key)
+    if counter is None:
+        counter = _status_counters[key] = REQUESTS.labels(*key)
+    return counter
+
+
+def _before_request():
+    labels = (request.method, get_route())
+    latency, in_progress = get_route_metrics(labels)
+    in_progress.inc()
+    # a single attribute on g, each access goes through a context local
+    g.metrics = (labels, latency, in_progress, perf_counter())
+
+
+def _after_request(response):
+    metrics = g.pop('metrics', None)
+    if metrics is not None:
+        labels, latency, in_progress, started_at = metrics
+        latency.observe(perf_counter() - started_at)
+        get_requests_counter(labels, response.status_code).inc()
+        in_progress.dec()
+    return response
+
+
+def _teardown_request(error=None):
+    # after_request is skipped when the request fails with an
+    # unhandled exception
+    metrics = g.pop('metrics', None)
+    if metrics is not None:
+        labels, _, in_progress, _ = metrics
+        get_requests_counter(labels, 500).inc()
+        in_progress.dec()
+
+
+def init_metrics(app):
+    if not settings.METRICS_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+@after_task_publish.connect
+def _on_after_task_publish(sender=None, **kwargs):
+    TASKS_ENQUEUED.labels(sender).inc()
+
+
+def get_task_queue(task_name: str) -> str:
+    return settings.TASKS_QUEUES.get(task_name, {}).get(
+        'queue', settings.DEFAULT_QUEUE_NAME
+    )
+
+
+@before_task_publish.connect
+def _on_before_task_publish(headers=None, **kwargs):
+    # wall clock time, the worker compares it with its own
+    if headers is not None:
+        headers.setdefault(PUBLISHED_AT_HEADER, time.time())
+
+
+# started_at (perf_counter) of the tasks running on this process, by id
+_running_tasks = {}
+
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    _running_tasks[task_id] = perf_counter()
+
+    # the custom message headers (also with task.apply(headers=...))
+    published_at = (task.request.headers or {}).get(PUBLISHED_AT_HEADER)
+    if published_at is not None:
+        TASK_QUEUE_WAIT.labels(task.name, get_task_queue(task.name)).observe(
+            max(time.time() - published_at, 0)
+        )
+
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started_at = _running_tasks.pop(task_id, None)
+    queue = get_task_queue(task.name)
+    if started_at is not None:
+        TASK_DURATION.labels(task.name, queue).observe(perf_counter() - started_at)
+    TASKS_PROCESSED.labels(task.name, queue, state or 'UNKNOWN').inc()
+
+
+@task_failure.connect
+def _on_task_failure(sender=None, exception=None, **kwargs):
+    TASK_FAILURES.labels(
+        sender.name, get_task_queue(sender.name), type(exception).__name__
+    ).inc()
+
+
+@worker_init.connect
+def _on_worker_init(**kwargs):
+    # on the worker main process, before the pool processes are started
+    clear_metrics_dir()
+
+
+@worker_ready.connect
+def _on_worker_ready(**kwargs):
+    # the worker main process and its pool processes
+    track_process_memory(os.getpid())
+    if settings.CELERY_METRICS_PORT:
+        start_metrics_server(settings.CELERY_METRICS_PORT)
+
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(**kwargs):
+    mark_process_dead(os.getpid())
+
+
+def mark_process_dead(pid: int):
+    """
+    Drop the live gauges of a process that exited (its counters and
+    histograms are kept, so that the totals do not go backwards).
+    """
+    multiprocess.mark_process_dead(pid)
+
+
+def set_metrics_dir(directory: str):
+    """
+    Write the metrics of this process (and its children) to directory.
+
+    The files of the labelled metrics are only opened when their first
+    sample is written, so this must be called before that.
+    """
+    os.makedirs(directory, exist_ok=True)
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = directory
+
+
+def clear_metrics_dir():
+    """
+    Remove the files of the previous processes. Only the files (the
+    CELERY_METRICS_DIR may be a subdirectory), and not the ones of this
+    process, which may be open already.
+    """
+    own_suffix = f'_{os.getpid()}.db'
+    for path in glob.glob(
+        os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')
+    ):
+        if not path.endswith(own_suffix):
+            os.remove(path)
+
+
+class ProcessMemoryCollector:
+    """
+    The memory of a parent process and of its children (the gunicorn
+    master and workers, or the celery worker and its pool processes), per
+    kind: rss, pss, uss (private) and shared (rss - uss). Read from /proc
+    when scraped, so only the running processes are on it.
+    """
+
+    def __init__(self, parent_pid: int):
+        self.parent_pid = parent_pid
+
+    def collect(self):
+        metric = GaugeMetricFamily(
+            'process_memory_bytes',
+            'Memory of the processes, per kind (rss, pss, uss and shared).',
+            labels=['pid', 'role', 'kind'],
+        )
+        for usage in get_process_group_memory(self.parent_pid):
+            role = 'parent' if usage['parent'] else 'child'
+            for kind in ('rss', 'pss', 'uss', 'shared'):
+                metric.add_metric(
+                    [str(usage['pid']), role, kind], usage[f'{kind}_bytes']
+                )
+        yield metric
+
+
+# the parent process of the process group on process_memory_bytes
+_memory_parent_pid = None
+
+
+def track_process_memory(parent_pid: int):
+    global _memory_parent_pid
+    _memory_parent_pid = parent_pid
+
+
+def get_registry() -> CollectorRegistry:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _memory_parent_pid is not None:
+        registry.register(ProcessMemoryCollector(_memory_parent_pid))
+    return registry
+
+
+def generate_metrics():
+    """
+    Return the metrics of all the processes, in the Prometheus text format,
+    and its content type.
+    """
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+_metrics_server_started = False
+
+
+def start_metrics_server(port: int):
+    """
+    Serve the metrics of all the processes on port, on a thread.
+    """
+    global _metrics_server_started
+    if _metrics_server_started:
+        return
+    start_http_server(port, registry=get_registry())
+    _metrics_server_started = True
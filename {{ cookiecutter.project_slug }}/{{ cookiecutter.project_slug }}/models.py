@@ -1,12 +1,14 @@
 from datetime import datetime
-from typing import List, Union
+from typing import Iterator, List, Optional, Tuple, Union
 from uuid import uuid4
 
-from sqlalchemy import Enum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Enum, func, insert, select, true, tuple_, update
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 
 from {{cookiecutter.project_slug}}.commons import get_query_raw_sql
-from {{cookiecutter.project_slug}}.extensions import db, bcrypt
+from {{cookiecutter.project_slug}}.extensions import db, password_hasher
+from {{cookiecutter.project_slug}}.tasks import notify_user_registered
+from {{cookiecutter.project_slug}}.tracing import get_trace_headers
 
 """
 Available datatypes:
@@ -14,13 +16,29 @@ https://docs.sqlalchemy.org/en/13/core/type_basics.html
 """
 
 
+def utc_now():
+    """
+    Current UTC time, evaluated by the database. Unlike now(), which is
+    the start of the transaction, clock_timestamp() is the actual time.
+    """
+    return func.timezone("utc", func.clock_timestamp())
+
+
 class User(db.Model):
-    uuid = db.Column(UUID(as_uuid=True), default=uuid4, primary_key=True)
+    # NOTE: the defaults are generated by the database, and returned by the
+    #       INSERT/UPDATE statements themselves (RETURNING), so the writes
+    #       below do not need a refresh (an extra SELECT) afterwards.
+    uuid = db.Column(
+        UUID(as_uuid=True), server_default=func.gen_random_uuid(), primary_key=True
+    )
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    last_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utc_now())
+    last_updated_at = db.Column(db.DateTime, server_default=utc_now())
+
+    # the listing order (and keyset pagination key), see list_page()
+    __table_args__ = (db.Index("ix_user_created_at_uuid", "created_at", "uuid"),)
 
     # NOTE: use backref here to automatically create the reverse side so on the DependantModel model
     #       I can get e.g. "dependant_model_instance.user.email".
@@ -29,35 +47,52 @@ class User(db.Model):
     # dependant_instances = db.relationship("DependantModel", backref="user", lazy=True)
 
     def hash(self, password: str) -> object:
-        return bcrypt.generate_password_hash(password).decode("utf-8")
+        return password_hasher.generate_password_hash(password)
 
     def check_password(self, password: str) -> bool:
-        return bcrypt.check_password_hash(self.password_hash, password)
+        is_valid = password_hasher.check_password_hash(self.password_hash, password)
+
+        # upgrade hashes generated with a lower cost than the current one
+        if is_valid and password_hasher.needs_rehash(self.password_hash):
+            self.password_hash = self.hash(password)
+            db.session.add(self)
+            db.session.commit()
+
+        return is_valid
 
     def register(self, username: str, email: str, password: str) -> "User":
         # TODO: handle existing user
-        new_user = User(
-            username=username, email=email, password_hash=self.hash(password)
+        new_user = db.session.scalars(
+            insert(User)
+            .values(username=username, email=email, password_hash=self.hash(password))
+            .returning(User)
+        ).one()
+
+        # published later by the outbox relay, only if the user is committed
+        OutboxMessage.enqueue(
+            notify_user_registered, kwargs={"user_uuid": str(new_user.uuid)}
         )
-        db.session.add(new_user)
         db.session.commit()
-        db.session.refresh(new_user)
         return new_user
 
     def update(self, email: str = "", password: str = ""):
         if (not email) and (not password):
             return self
 
+        values = {"last_updated_at": utc_now()}
+
         if email:
-            self.email = email
+            values["email"] = email
 
         if password:
-            self.password_hash = self.hash(password)
+            values["password_hash"] = self.hash(password)
 
-        self.last_updated_at = datetime.utcnow()
-        db.session.add(self)
+        # loading the returned row refreshes this instance (it is on the session)
+        db.session.execute(
+            update(User).where(User.uuid == self.uuid).values(**values).returning(User),
+            execution_options={"synchronize_session": False, "populate_existing": True},
+        ).scalar_one()
         db.session.commit()
-        db.session.refresh(self)
 
     @staticmethod
     def get_by(
@@ -70,3 +105,104 @@ class User(db.Model):
         if username:
             return User.query.filter_by(username=username).first()
         return None
+
+    @staticmethod
+    def list_page(
+        limit: int, after: Optional[Tuple[datetime, str]] = None
+    ) -> List["User"]:
+        """
+        Users ordered by (created_at, uuid), starting after the given key
+        (the created_at and uuid of the last user of the previous page).
+
+        Unlike an OFFSET, the key is found on the index, so every page
+        costs the same no matter how deep it is.
+        """
+        query = User.query.filter(User.after(after)).order_by(*User.order())
+        return query.limit(limit).all()
+
+    @staticmethod
+    def iterate(
+        batch_size: int, after: Optional[Tuple[datetime, str]] = None
+    ) -> Iterator[dict]:
+        """
+        All the users (as dicts), in the list_page() order, read with a
+        server-side cursor batch_size rows at a time: only one batch is
+        held in memory, no matter how big the table is.
+        """
+        query = (
+            select(User.uuid, User.username, User.email, User.created_at)
+            .where(User.after(after))
+            .order_by(*User.order())
+            .execution_options(yield_per=batch_size)
+        )
+        for row in db.session.execute(query):
+            yield row._asdict()
+
+    @staticmethod
+    def order():
+        return User.created_at, User.uuid
+
+    @staticmethod
+    def after(key: Optional[Tuple[datetime, str]]):
+        if key is None:
+            return true()
+        return tuple_(User.created_at, User.uuid) > tuple_(*key)
+
+
+class OutboxMessage(db.Model):
+    """
+    A task to be published to the broker by the outbox relay (see outbox.py).
+
+    It is written on the same transaction as the model changes that
+    trigger the task, so the task is published if (and only if) they
+    are committed, and the request does not wait for the broker.
+    """
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    task_id = db.Column(UUID(as_uuid=True), default=uuid4, nullable=False)
+    task_name = db.Column(db.String(255), nullable=False)
+    args = db.Column(JSONB, nullable=False, default=list)
+    kwargs = db.Column(JSONB, nullable=False, default=dict)
+    options = db.Column(JSONB, nullable=False, default=dict)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def enqueue(task, args=None, kwargs=None, **options) -> "OutboxMessage":
+        """
+        Add the task to the outbox on the current session (it is not
+        committed here). The options must be json serializable.
+        """
+        # the relay publishes it within the trace of the current request
+        trace_headers = get_trace_headers()
+        if trace_headers:
+            options.setdefault("headers", trace_headers)
+
+        message = OutboxMessage(
+            task_name=task.name,
+            args=list(args or ()),
+            kwargs=kwargs or {},
+            options=options,
+        )
+        db.session.add(message)
+        return message
+
+    @staticmethod
+    def lock_batch(size: int) -> List["OutboxMessage"]:
+        """
+        The oldest messages, locked until the end of the transaction.
+        Rows locked by other relays are skipped, so that many relays
+        can run at the same time without waiting for each other.
+        """
+        return (
+            OutboxMessage.query.order_by(OutboxMessage.id)
+            .with_for_update(skip_locked=True)
+            .limit(size)
+            .all()
+        )
+
+    @staticmethod
+    def delete_batch(messages: List["OutboxMessage"]):
+        ids = [message.id for message in messages]
+        OutboxMessage.query.filter(OutboxMessage.id.in_(ids)).delete(
+            synchronize_session=False
+        )
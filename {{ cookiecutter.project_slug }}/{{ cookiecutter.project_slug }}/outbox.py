@@ -0,0 +1,115 @@
+"""
+Transactional outbox relay.
+
+Endpoints that change the database and need a task published afterwards
+write an OutboxMessage on the same transaction (see
+OutboxMessage.enqueue()), instead of publishing from the request thread.
+The relay (`flask outbox relay`) reads the outbox in batches, publishes
+each batch through a single producer connection and deletes the published
+messages, all on one transaction.
+
+Messages are locked with SELECT ... FOR UPDATE SKIP LOCKED, so several
+relays can run side by side. A relay that dies before committing leaves its
+messages on the outbox to be published again, so the tasks are delivered
+at least once (the outbox task_id is kept as the celery task id, to help
+the tasks detect duplicates).
+"""
+
+import logging
+import signal
+import threading
+from time import perf_counter
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.extensions import db
+from {{ cookiecutter.project_slug }}.models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+outbox_cli = AppGroup('outbox', help='Transactional outbox commands.')
+
+
+def relay_outbox_batch(celery, batch_size: int) -> int:
+    """
+    Publish (and remove) up to batch_size messages from the outbox.
+    Return how many were published.
+    """
+    try:
+        messages = OutboxMessage.lock_batch(batch_size)
+        if not messages:
+            db.session.rollback()
+            return 0
+
+        with celery.producer_or_acquire() as producer:
+            for message in messages:
+                celery.tasks[message.task_name].apply_async(
+                    message.args,
+                    message.kwargs,
+                    task_id=str(message.task_id),
+                    producer=producer,
+                    **message.options,
+                )
+        OutboxMessage.delete_batch(messages)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(messages)
+
+
+def relay_outbox(
+    celery,
+    batch_size: int,
+    poll_interval: float,
+    stopped: threading.Event,
+):
+    """
+    Relay the outbox until stopped. Full batches are followed by the next
+    one right away, the relay only sleeps when the outbox is drained.
+    """
+    while not stopped.is_set():
+        started_at = perf_counter()
+        try:
+            relayed = relay_outbox_batch(celery, batch_size)
+        except Exception:
+            logger.exception('Could not relay the outbox, will retry.')
+            stopped.wait(timeout=poll_interval)
+            continue
+
+        if relayed:
+            elapsed = perf_counter() - started_at
+            logger.info(
+                f'Relayed {relayed} outbox message(s) in {elapsed * 1000:.1f}ms.'
+            )
+        if relayed < batch_size:
+            stopped.wait(timeout=poll_interval)
+
+
+@outbox_cli.command('relay')
+@click.option(
+    '--batch-size',
+    default=settings.OUTBOX_RELAY_BATCH_SIZE,
+    show_default=True,
+    help='Messages published per transaction.',
+)
+@click.option(
+    '--poll-interval',
+    default=settings.OUTBOX_RELAY_POLL_INTERVAL,
+    show_default=True,
+    help='Seconds to wait when the outbox is empty.',
+)
+def relay_command(batch_size: int, poll_interval: float):
+    """Publish the outbox messages to the broker."""
+    stopped = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stopped.set())
+
+    logger.info(f'Outbox relay started (batch size: {batch_size}).')
+    relay_outbox(
+        current_app.extensions['celery'], batch_size, poll_interval, stopped
+    )
+    logger.info('Outbox relay stopped.')
@@ -0,0 +1,51 @@
+"""
+State shared by the processes forked from a parent (the celery pool
+processes, from the worker main process, and the gunicorn workers, from
+the master with preload_app: see gunicorn_settings.py).
+
+A forked child shares the memory of its parent until either of them
+writes to it (copy-on-write). What is imported and built on the parent,
+before forking, is paid for once instead of on every child. But the
+garbage collector writes to every object it tracks when it runs, which
+copies the pages they are on into each child. So, once the shared state
+is preloaded (before the first fork), the objects of the parent are moved
+out of the collector reach with gc.freeze(): they live as long as the
+parent, so there is little to collect among them anyway.
+
+It is done once, not before every fork (the pool grows, and processes are
+recycled, for as long as the parent lives): what the parent allocates
+afterwards would never be collected otherwise.
+"""
+
+import gc
+import logging
+
+from celery.signals import worker_init
+from sqlalchemy.orm import configure_mappers
+
+from {{ cookiecutter.project_slug }}.tasks import get_numpy
+
+logger = logging.getLogger(__name__)
+
+
+def preload_shared_state():
+    """
+    What each child would otherwise build on its own, on first use.
+    """
+    # the task modules are imported by the worker already
+    configure_mappers()
+    get_numpy()
+
+
+def freeze_shared_state():
+    # the garbage first, or it would never be freed
+    gc.collect()
+    gc.freeze()
+    logger.debug(f'Froze {gc.get_freeze_count()} objects before forking.')
+
+
+@worker_init.connect
+def _on_worker_init(**kwargs):
+    # on the worker main process, before the pool processes are forked
+    preload_shared_state()
+    freeze_shared_state()
@@ -0,0 +1,223 @@
+"""
+On demand profiling of requests and tasks.
+
+A request is run under cProfile when it has the X-Profile header set to
+PROFILING_TOKEN, or when it is sampled (PROFILING_SAMPLE_RATE). The tasks
+it publishes are profiled too (the message gets a profile header), as are
+a PROFILING_SAMPLE_RATE fraction of all tasks (see the celery ContextTask
+on extensions.py).
+
+Each profile is a pstats file on PROFILES_DIR (a tmpfs when available),
+named <timestamp>-<pid>-<request or task>.prof, of which the last
+PROFILES_KEEP are kept. The profile name of a request is returned on the
+X-Profile-Id header, and the profiles can be listed and downloaded from
+/profiles (see api.py), also with the X-Profile header.
+
+A process runs a single profile at a time (cProfile is process wide since
+Python 3.12): a request or task that would be profiled while another one
+is, on another thread, is not.
+"""
+
+import cProfile
+import glob
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+
+from celery.signals import before_task_publish
+from flask import g, request
+
+from {{ cookiecutter.project_slug }} import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+# message header of the tasks published by a profiled request
+TASK_PROFILE_HEADER = 'profile'
+
+PROFILE_NAME_PATTERN = re.compile(r'^[\w.-]+\.prof$')
+
+# whether the current request (or task) is being profiled
+_profiling: ContextVar[bool] = ContextVar('profiling', default=False)
+# held while a profile of this process runs
+_profiler_lock = threading.Lock()
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    if not settings.PROFILING_TOKEN or not token:
+        return False
+    # as bytes: compare_digest only takes ASCII strings
+    return hmac.compare_digest(token.encode(), settings.PROFILING_TOKEN.encode())
+
+
+def is_sampled() -> bool:
+    return random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+def write_profile(profiler: cProfile.Profile, kind: str, name: str) -> str:
+    """
+    Save the profile and return its (file) name. The oldest profiles
+    beyond PROFILES_KEEP are removed.
+    """
+    os.makedirs(settings.PROFILES_DIR, exist_ok=True)
+    timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f')
+    slug = re.sub(r'[^\w.-]+', '_', name).strip('_')[:100]
+    profile_name = f'{timestamp}-{os.getpid()}-{kind}-{slug}.prof'
+    profiler.dump_stats(os.path.join(settings.PROFILES_DIR, profile_name))
+
+    for path in list_profile_paths()[settings.PROFILES_KEEP :]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:  # removed by another process
+            pass
+    return profile_name
+
+
+def list_profile_paths() -> List[str]:
+    """
+    Newest first.
+    """
+    paths = glob.glob(os.path.join(settings.PROFILES_DIR, '*.prof'))
+    return sorted(paths, key=os.path.basename, reverse=True)
+
+
+def list_profiles() -> List[dict]:
+    profiles = []
+    for path in list_profile_paths():
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            continue
+        profiles.append({'name': os.path.basename(path), 'size': size})
+    return profiles
+
+
+def get_profile_path(name: str) -> Optional[str]:
+    """
+    None when there is no such profile (or the name is not valid).
+    """
+    if not PROFILE_NAME_PATTERN.match(name):
+        return None
+    path = os.path.join(settings.PROFILES_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def format_profile(path: str, limit: int = 50) -> str:
+    """
+    The functions with the highest cumulative time, as text.
+    """
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+class Profile:
+    """
+    cProfile of a request or task, written when stopped.
+    """
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        self.profile_name = None
+        self._profiler = cProfile.Profile()
+        self._token = None
+        self._started = False
+
+    def start(self) -> bool:
+        """
+        False when another profile is running (it is not started then).
+        """
+        if not _profiler_lock.acquire(blocking=False):
+            logger.info(f'Not profiling {self.kind} {self.name}: already profiling.')
+            return False
+        try:
+            self._profiler.enable()
+        except ValueError:  # another profiling tool is active (e.g. a debugger)
+            _profiler_lock.release()
+            logger.info(f'Not profiling {self.kind} {self.name}: already profiling.')
+            return False
+        self._token = _profiling.set(True)
+        self._started = True
+        return True
+
+    def stop(self) -> Optional[str]:
+        if not self._started:
+            return None
+        self._profiler.disable()
+        self._started = False
+        _profiler_lock.release()
+        _profiling.reset(self._token)
+        self.profile_name = write_profile(self._profiler, self.kind, self.name)
+        logger.info(f'Profile of {self.kind} {self.name}: {self.profile_name}')
+        return self.profile_name
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+# flask requests
+
+
+def _before_request():
+    if not (is_authorized(request.headers.get(PROFILE_HEADER)) or is_sampled()):
+        return
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    profile = Profile('request', f'{request.method} {route}')
+    if profile.start():
+        g.profile = profile
+
+
+def _after_request(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        response.headers[PROFILE_ID_HEADER] = profile.stop()
+    return response
+
+
+def _teardown_request(error=None):
+    # after_request is skipped on unhandled exceptions
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+
+
+def init_profiling(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+# celery
+
+
+@contextmanager
+def profile_task(task):
+    headers = task.request.headers or {}
+    # tasks run eagerly by a profiled request are on its profile already
+    if _profiling.get() or not (headers.get(TASK_PROFILE_HEADER) or is_sampled()):
+        yield
+        return
+    with Profile('task', task.name):
+        yield
+
+
+@before_task_publish.connect
+def _on_before_task_publish(headers=None, **kwargs):
+    if headers is not None and _profiling.get():
+        headers[TASK_PROFILE_HEADER] = True
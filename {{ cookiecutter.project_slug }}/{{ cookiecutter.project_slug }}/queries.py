@@ -0,0 +1,175 @@
+"""
+Query instrumentation: timing, slow query log and N+1 detection.
+
+Every statement sent to the database is timed by the engine
+before/after_cursor_execute events, into query_stats (shown on /stats).
+Statements slower than QUERIES_SLOW_MS are logged with their SQL, as
+rendered by commons.get_query_raw_sql (only a QUERIES_SLOW_LOG_SAMPLE_RATE
+fraction of them, since rendering is not free).
+
+Each request and each celery task also counts its own queries, on a
+QueryTracker. When it finishes, any statement it ran
+QUERIES_REPEATED_THRESHOLD times or more (the same SQL, with different
+parameters) is logged as a likely N+1 query pattern. In debug mode, the
+responses have the count of queries of the request on X-Query-Count.
+The queries are recorded as spans of the current trace (see tracing.py).
+"""
+
+import logging
+import random
+import re
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Optional
+
+from celery.signals import task_postrun, task_prerun
+from flask import current_app, request
+from sqlalchemy import event
+
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.commons import get_query_raw_sql
+from {{ cookiecutter.project_slug }}.extensions import db
+from {{ cookiecutter.project_slug }}.instrumentation import LatencyStats
+from {{ cookiecutter.project_slug }}.tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+
+query_stats = LatencyStats('db_query', slow_ms=settings.QUERIES_SLOW_MS)
+
+
+class QueryTracker:
+    """
+    Queries run by a unit of work (a request or a task).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total_ms = 0.0
+        self.statements = Counter()
+
+    def add(self, statement: str, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.statements[statement] += 1
+
+    def get_repeated_statements(self, threshold: int) -> list:
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def finish(self):
+        for statement, count in self.get_repeated_statements(
+            settings.QUERIES_REPEATED_THRESHOLD
+        ):
+            logger.warning(
+                f'Possible N+1 queries on {self.name}: statement run '
+                f'{count} times: {" ".join(statement.split())}'
+            )
+        logger.debug(
+            f'{self.name}: {self.count} queries in {self.total_ms:.1f}ms.'
+        )
+
+
+_tracker: ContextVar[Optional[QueryTracker]] = ContextVar(
+    'query_tracker', default=None
+)
+
+
+def get_query_tracker() -> Optional[QueryTracker]:
+    return _tracker.get()
+
+
+def render_statement(statement: str, parameters, context) -> str:
+    if context.compiled is not None and not context.executemany:
+        return get_query_raw_sql(
+            context.compiled.statement, context.compiled_parameters[0]
+        )
+    raw_query = f'{statement} [params: {parameters}]'
+    return re.sub(r'\s+', ' ', raw_query).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_started_at = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (perf_counter() - context.query_started_at) * 1000
+    query_stats.observe(elapsed_ms)
+
+    tracker = _tracker.get()
+    if tracker is not None:
+        tracker.add(statement, elapsed_ms)
+    record_span(
+        'db.query', elapsed_ms / 1000, kind='client', **{'db.statement': statement}
+    )
+
+    if (
+        elapsed_ms > query_stats.slow_ms
+        and random.random() < settings.QUERIES_SLOW_LOG_SAMPLE_RATE
+    ):
+        logger.warning(
+            f'Slow query ({elapsed_ms:.1f}ms'
+            f'{f" on {tracker.name}" if tracker else ""}): '
+            f'{render_statement(statement, parameters, context)}'
+        )
+
+
+def _handle_error(exception_context):
+    query_stats.record_error()
+
+
+def _before_request():
+    _tracker.set(QueryTracker(f'{request.method} {request.path}'))
+
+
+def _after_request(response):
+    tracker = _tracker.get()
+    if tracker is not None and (current_app.debug or settings.IS_DEV_APP):
+        response.headers[QUERY_COUNT_HEADER] = str(tracker.count)
+    return response
+
+
+def _teardown_request(error=None):
+    tracker = _tracker.get()
+    if tracker is not None:
+        _tracker.set(None)
+        tracker.finish()
+
+
+def init_query_tracking(app):
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+# tasks run eagerly (IS_DEV_APP) within a request have their own tracker,
+# and the request one is restored when they finish
+_task_tokens = {}
+
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    _task_tokens[task_id] = _tracker.set(QueryTracker(f'task {task.name}'))
+
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, **kwargs):
+    token = _task_tokens.pop(task_id, None)
+    if token is None:
+        return
+    tracker = _tracker.get()
+    _tracker.reset(token)
+    if tracker is not None:
+        tracker.finish()
@@ -0,0 +1,122 @@
+"""
+Graceful recycling of the web and worker processes, so that a leak is
+bounded by a restart instead of by the OOM killer.
+
+A gunicorn worker is recycled after a jittered number of requests
+(max_requests and max_requests_jitter, see gunicorn_settings.py) or when
+its RSS passes WEB_MAX_RSS_MB, checked every WEB_RSS_CHECK_EVERY requests
+by the post_request hook. Either way it stops accepting connections,
+finishes the requests it has in progress and exits, and the arbiter
+starts a new one.
+
+A celery pool process is recycled, by billiard, after the task that took
+its RSS above CELERY_MAX_RSS_MB (worker_max_memory_per_child) or after
+CELERY_MAX_TASKS_PER_CHILD tasks, plus a random jitter of up to
+CELERY_MAX_TASKS_PER_CHILD_JITTER drawn for each process (see TaskPool),
+so that the processes started together are not all recycled together.
+The result of the last task is sent before the process exits.
+
+Each recycle is logged, and counted on the worker_recycles_total metric
+(per reason), with the RSS of the process on worker_recycle_rss_bytes.
+"""
+
+import logging
+import random
+from typing import Optional
+
+from billiard.compat import mem_rss
+from billiard.pool import EX_RECYCLE, Pool
+from celery.concurrency.asynpool import AsynPool
+from celery.concurrency.prefork import TaskPool as PreforkTaskPool
+from celery.signals import worker_process_shutdown
+
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.memory import get_rss_bytes
+from {{ cookiecutter.project_slug }}.metrics import RECYCLE_RSS, RECYCLES
+
+logger = logging.getLogger(__name__)
+
+
+def record_recycle(process: str, reason: str, rss_bytes: Optional[int]):
+    logger.warning(
+        f'Recycling the {process} process ({reason}), '
+        f'rss {(rss_bytes or 0) / 1024 ** 2:.0f}MiB.'
+    )
+    RECYCLES.labels(process, reason).inc()
+    if rss_bytes is not None:
+        RECYCLE_RSS.labels(process).observe(rss_bytes)
+
+
+def jitter(value: Optional[int], maximum: int) -> Optional[int]:
+    if not value:
+        return value
+    return value + random.randint(0, max(maximum, 0))
+
+
+# gunicorn
+
+
+def check_web_worker(worker):
+    """
+    On the gunicorn post_request hook, on the worker process.
+    """
+    if worker.nr == worker.max_requests:
+        # gunicorn stops the worker itself (on this very request), it is
+        # only recorded
+        record_recycle('web', 'requests', get_rss_bytes())
+        return
+
+    if not settings.WEB_MAX_RSS_MB or worker.nr % settings.WEB_RSS_CHECK_EVERY:
+        return
+    rss_bytes = get_rss_bytes()
+    if worker.alive and rss_bytes and rss_bytes > settings.WEB_MAX_RSS_MB * 1024 ** 2:
+        record_recycle('web', 'memory', rss_bytes)
+        # the same as max_requests: the requests in progress are finished
+        worker.alive = False
+
+
+# celery
+
+
+class JitteredMaxTasksMixin:
+    """
+    The pool reads the maximum number of tasks once for each process it
+    starts, and each one gets a different jitter.
+    """
+
+    @property
+    def _maxtasksperchild(self) -> Optional[int]:
+        return jitter(self._max_tasks, settings.CELERY_MAX_TASKS_PER_CHILD_JITTER)
+
+    @_maxtasksperchild.setter
+    def _maxtasksperchild(self, value: Optional[int]):
+        self._max_tasks = value
+
+
+class JitteredAsynPool(JitteredMaxTasksMixin, AsynPool):
+    pass
+
+
+class JitteredPool(JitteredMaxTasksMixin, Pool):
+    pass
+
+
+class TaskPool(PreforkTaskPool):
+    """
+    The prefork pool (the worker_pool), with the jittered pools.
+    """
+
+    Pool = JitteredAsynPool
+    # without the event loop
+    BlockingPool = JitteredPool
+
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(exitcode=None, **kwargs):
+    # on the pool process, after its last task
+    if exitcode != EX_RECYCLE:
+        return
+    max_rss_kb = settings.CELERY_MAX_RSS_MB * 1024
+    # billiard compares the peak rss (what mem_rss returns) with the limit
+    reason = 'memory' if max_rss_kb and mem_rss() > max_rss_kb else 'tasks'
+    record_recycle('celery', reason, get_rss_bytes())
@@ -1,9 +1,13 @@
 import logging
 import logging.config
+import math
+import os
+import tempfile
 
 from decouple import config
 
 from {{ cookiecutter.project_slug }}.commons import get_app_version
+from {{ cookiecutter.project_slug }}.sizing import get_web_sizing
 
 IS_DEV_APP = config('IS_DEV_APP', cast=bool)  # Queues
 
@@ -88,16 +92,271 @@ DATABASE_URI = (
 )
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 
+# The CPUs and memory of the container (CPU_LIMIT and MEMORY_LIMIT_MB, its
+# cgroup limits unless set), and the gunicorn workers, threads per worker
+# and backlog, sized from them for the WEB_PROFILE workload (io or cpu)
+# and WEB_WORKER_MEMORY_MB per worker, unless set (see sizing.py). The
+# same as gunicorn_settings.py, which reads them on its own. The
+# connection pools shared by the request threads are sized from
+# WEB_THREADS.
+web_sizing = get_web_sizing(config)
+CPU_LIMIT = web_sizing['cpu_limit']
+MEMORY_LIMIT_MB = web_sizing['memory_limit_mb']
+WEB_PROFILE = web_sizing['profile']
+WEB_WORKER_MEMORY_MB = web_sizing['worker_memory_mb']
+WEB_WORKERS = web_sizing['workers']
+WEB_THREADS = web_sizing['threads']
+WEB_BACKLOG = web_sizing['backlog']
+
+# Recycling (see recycling.py). A gunicorn worker is recycled when its RSS
+# passes WEB_MAX_RSS_MB (checked every WEB_RSS_CHECK_EVERY requests), a
+# celery pool process when it passes CELERY_MAX_RSS_MB or after
+# CELERY_MAX_TASKS_PER_CHILD tasks (plus up to the jitter). 0 disables each.
+# By default the workers are recycled at the memory they are sized for,
+# so that they keep fitting in the memory limit.
+WEB_MAX_RSS_MB = config('WEB_MAX_RSS_MB', default=WEB_WORKER_MEMORY_MB, cast=int)
+WEB_RSS_CHECK_EVERY = config('WEB_RSS_CHECK_EVERY', default=10, cast=int)
+CELERY_MAX_RSS_MB = config('CELERY_MAX_RSS_MB', default=1024, cast=int)
+CELERY_MAX_TASKS_PER_CHILD = config('CELERY_MAX_TASKS_PER_CHILD', default=10000, cast=int)
+CELERY_MAX_TASKS_PER_CHILD_JITTER = config(
+    'CELERY_MAX_TASKS_PER_CHILD_JITTER', default=1000, cast=int
+)
+
+# Warm-up of each gunicorn worker before it takes traffic (see warmup.py).
+# The readiness check fails until the worker answering it is warmed up.
+WARMUP_ENABLED = config('WARMUP_ENABLED', default=True, cast=bool)
+
+# Prometheus metrics (see metrics.py), shared by the processes through
+# files on METRICS_DIR, which should be on a tmpfs (e.g. /dev/shm).
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = config(
+    'METRICS_DIR',
+    default=os.path.join(
+        tempfile.gettempdir(), '{{ cookiecutter.project_slug }}-metrics'
+    ),
+    cast=str,
+)
+# The celery workers keep theirs apart (gunicorn empties METRICS_DIR when
+# it starts), and serve them on CELERY_METRICS_PORT (0 disables it).
+CELERY_METRICS_DIR = config(
+    'CELERY_METRICS_DIR', default=os.path.join(METRICS_DIR, 'celery'), cast=str
+)
+CELERY_METRICS_PORT = config('CELERY_METRICS_PORT', default=0, cast=int)
+
+# Tracing (see tracing.py). The trace ids are always propagated and added
+# to the log records, the spans are only exported with TRACING_EXPORTER
+# "file" (NDJSON, one span per line, on TRACING_FILE) or "otlp" (OTLP/HTTP
+# json, to TRACING_OTLP_ENDPOINT), every TRACING_EXPORT_INTERVAL seconds.
+# Spans are dropped when more than TRACING_QUEUE_SIZE are waiting.
+TRACING_EXPORTER = config('TRACING_EXPORTER', default='none', cast=str)
+TRACING_SERVICE_NAME = config(
+    'TRACING_SERVICE_NAME', default='{{ cookiecutter.project_slug }}', cast=str
+)
+TRACING_FILE = config(
+    'TRACING_FILE',
+    default=os.path.join(
+        tempfile.gettempdir(), '{{ cookiecutter.project_slug }}-spans.ndjson'
+    ),
+    cast=str,
+)
+TRACING_OTLP_ENDPOINT = config(
+    'TRACING_OTLP_ENDPOINT', default='http://localhost:4318/v1/traces', cast=str
+)
+TRACING_EXPORT_INTERVAL = config('TRACING_EXPORT_INTERVAL', default=2.0, cast=float)
+TRACING_QUEUE_SIZE = config('TRACING_QUEUE_SIZE', default=10000, cast=int)
+
+# On demand profiling (see profiling.py): requests with the X-Profile
+# header set to PROFILING_TOKEN (empty disables it), and a
+# PROFILING_SAMPLE_RATE fraction of all requests and tasks, are run under
+# cProfile. The last PROFILES_KEEP profiles are kept on PROFILES_DIR, on
+# /dev/shm (as the gunicorn --worker-tmp-dir) when available.
+PROFILING_TOKEN = config('PROFILING_TOKEN', default='', cast=str)
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PROFILES_DIR = config(
+    'PROFILES_DIR',
+    default=os.path.join(
+        '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+        '{{ cookiecutter.project_slug }}-profiles',
+    ),
+    cast=str,
+)
+PROFILES_KEEP = config('PROFILES_KEEP', default=50, cast=int)
+
+# Memory growth (see memory.py). With MEMORY_TRACING_ENABLED, tracemalloc
+# runs on every gunicorn worker and celery process from the start (it
+# makes allocations slower, and uses memory itself), keeping
+# MEMORY_TRACE_FRAMES frames per allocation, and a snapshot is taken every
+# MEMORY_SNAPSHOT_INTERVAL seconds (0: only on demand). The reports show
+# the top MEMORY_TOP_STATS allocation sites by growth.
+MEMORY_TRACING_ENABLED = config('MEMORY_TRACING_ENABLED', default=False, cast=bool)
+MEMORY_TRACE_FRAMES = config('MEMORY_TRACE_FRAMES', default=1, cast=int)
+MEMORY_SNAPSHOT_INTERVAL = config('MEMORY_SNAPSHOT_INTERVAL', default=300, cast=int)
+MEMORY_TOP_STATS = config('MEMORY_TOP_STATS', default=20, cast=int)
+# the celery pool processes write their last report here
+MEMORY_REPORTS_DIR = config(
+    'MEMORY_REPORTS_DIR',
+    default=os.path.join(
+        '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+        '{{ cookiecutter.project_slug }}-memory',
+    ),
+    cast=str,
+)
+
+# Database connection pool, per process (see database.py). By default one
+# connection per request thread, plus a few extra (overflow) ones that
+# are closed when returned. Threads wait up to DATABASE_POOL_TIMEOUT
+# seconds for a connection when all of them are checked out.
+DATABASE_POOL_SIZE = config('DATABASE_POOL_SIZE', default=WEB_THREADS, cast=int)
+DATABASE_MAX_OVERFLOW = config('DATABASE_MAX_OVERFLOW', default=2, cast=int)
+DATABASE_POOL_TIMEOUT = config('DATABASE_POOL_TIMEOUT', default=5.0, cast=float)
+# Seconds to wait for a new connection to be established, so that an
+# unreachable database fails fast (e.g. the warm-up of a gunicorn worker,
+# see warmup.py) instead of hanging on the TCP connect.
+DATABASE_CONNECT_TIMEOUT = config('DATABASE_CONNECT_TIMEOUT', default=5, cast=int)
+# Seconds after which connections are replaced (before any server or
+# proxy side idle timeout closes them)
+DATABASE_POOL_RECYCLE = config('DATABASE_POOL_RECYCLE', default=1800, cast=int)
+# Check connections with a "SELECT 1" when they are checked out
+DATABASE_POOL_PRE_PING = config('DATABASE_POOL_PRE_PING', default=True, cast=bool)
+# Waits for a connection longer than this are logged
+DATABASE_POOL_SLOW_WAIT_MS = config(
+    'DATABASE_POOL_SLOW_WAIT_MS', default=50, cast=float
+)
+# Queries slower than this are logged with their SQL (see queries.py), a
+# QUERIES_SLOW_LOG_SAMPLE_RATE fraction of them, and counted on /stats.
+QUERIES_SLOW_MS = config('QUERIES_SLOW_MS', default=100, cast=float)
+QUERIES_SLOW_LOG_SAMPLE_RATE = config(
+    'QUERIES_SLOW_LOG_SAMPLE_RATE', default=1.0, cast=float
+)
+# A statement run this many times by a single request or task is logged
+# as a likely N+1 query pattern.
+QUERIES_REPEATED_THRESHOLD = config(
+    'QUERIES_REPEATED_THRESHOLD', default=10, cast=int
+)
+
 QUEUE_HOST = config('QUEUE_HOST', cast=str)
 QUEUE_PORT = config('QUEUE_PORT', cast=int, default=5672)
 QUEUE_USER = config('QUEUE_USER', cast=str)
 QUEUE_PASSWORD = config('QUEUE_PASSWORD', cast=str)
 DEFAULT_QUEUE_NAME = config('DEFAULT_QUEUE_NAME', cast=str)
+# Producers (each with its own broker connection) per process. Publishing
+# blocks while the pool is exhausted, so by default there is one for each
+# request thread.
+BROKER_POOL_LIMIT = config('BROKER_POOL_LIMIT', default=WEB_THREADS, cast=int)
+# Broker connections opened by the warm-up of a gunicorn worker.
+BROKER_WARM_CONNECTIONS = config('BROKER_WARM_CONNECTIONS', default=1, cast=int)
+BROKER_CONNECTION_TIMEOUT = config(
+    'BROKER_CONNECTION_TIMEOUT', default=4.0, cast=float
+)
+# Publishes slower than this are logged and counted as slow on /stats.
+BROKER_PUBLISH_SLOW_MS = config('BROKER_PUBLISH_SLOW_MS', default=100, cast=float)
+# Seconds a publish may block writing to the broker. Messages that can
+# not be published in time are written to the local spool (see spool.py).
+BROKER_PUBLISH_TIMEOUT = config('BROKER_PUBLISH_TIMEOUT', default=2.0, cast=float)
+SPOOL_DIR = config(
+    'SPOOL_DIR',
+    default=os.path.join(tempfile.gettempdir(), '{{ cookiecutter.project_slug }}-spool'),
+    cast=str,
+)
+SPOOL_SIZE_BYTES = config('SPOOL_SIZE_BYTES', default=64 * 1024 * 1024, cast=int)
+# msync the spool file on every write: slower, but survives a host crash
+SPOOL_FSYNC = config('SPOOL_FSYNC', default=True, cast=bool)
+# Seconds between replay attempts (doubled on each failure, up to 60)
+SPOOL_REPLAY_INTERVAL = config('SPOOL_REPLAY_INTERVAL', default=1.0, cast=float)
+# Default serializer for the task messages. Each route below can override it
+# with a "serializer" option, e.g. "fastpack" (see serializers.py).
+TASK_SERIALIZER = config('TASK_SERIALIZER', default='json', cast=str)
+# "fastpack" messages bigger than this (in bytes) are compressed with zlib.
+TASK_COMPRESSION_THRESHOLD = config(
+    'TASK_COMPRESSION_THRESHOLD', default=1024, cast=int
+)
 TASKS_QUEUES = {
-    '{{ cookiecutter.project_slug }}.tasks.compute': {'queue': 'compute'},
+    '{{ cookiecutter.project_slug }}.tasks.compute': {
+        'queue': 'compute',
+        'serializer': 'fastpack',
+    },
+    '{{ cookiecutter.project_slug }}.tasks.compute_batched': {
+        'queue': 'compute_batched',
+        'serializer': 'fastpack',
+    },
     '{{ cookiecutter.project_slug }}.tasks.generate_random_string': {
-        'queue': 'generate_random_string'
+        'queue': 'generate_random_string',
+        'serializer': 'fastpack',
+    },
+    '{{ cookiecutter.project_slug }}.tasks.export_users': {
+        'queue': 'export_users',
+        'serializer': 'fastpack',
+    },
+    '{{ cookiecutter.project_slug }}.tasks.notify_user_registered': {
+        'queue': 'notify_user_registered',
+        'serializer': 'fastpack',
     },
 }
+# GET /users: default and maximum users per page, and rows fetched per
+# round-trip from the server-side cursor when streaming (format=ndjson).
+USERS_PAGE_SIZE = config('USERS_PAGE_SIZE', default=100, cast=int)
+USERS_PAGE_MAX_SIZE = config('USERS_PAGE_MAX_SIZE', default=1000, cast=int)
+USERS_STREAM_BATCH_SIZE = config('USERS_STREAM_BATCH_SIZE', default=1000, cast=int)
+# User exports (see exports.py): directory, and users per (gzip) file
+EXPORTS_DIR = config(
+    'EXPORTS_DIR',
+    default=os.path.join(
+        tempfile.gettempdir(), '{{ cookiecutter.project_slug }}-exports'
+    ),
+    cast=str,
+)
+EXPORT_ROWS_PER_FILE = config('EXPORT_ROWS_PER_FILE', default=100000, cast=int)
+# Bulk user import (see user_import.py): rows per transaction, rows
+# accepted per POST /users/bulk request (bigger imports should use the
+# `flask users import` command), errors detailed on the report and
+# password hashing processes used by the command.
+USERS_IMPORT_BATCH_SIZE = config('USERS_IMPORT_BATCH_SIZE', default=1000, cast=int)
+USERS_IMPORT_MAX_ROWS = config('USERS_IMPORT_MAX_ROWS', default=100, cast=int)
+USERS_IMPORT_MAX_ERRORS = config('USERS_IMPORT_MAX_ERRORS', default=100, cast=int)
+# Seconds a POST /users/bulk request may spend hashing the passwords (on a
+# gunicorn request thread) before giving up with HTTP 503.
+USERS_IMPORT_REQUEST_TIMEOUT = config(
+    'USERS_IMPORT_REQUEST_TIMEOUT', default=10.0, cast=float
+)
+USERS_IMPORT_HASHING_WORKERS = config(
+    'USERS_IMPORT_HASHING_WORKERS', default=math.ceil(CPU_LIMIT), cast=int
+)
+# Transactional outbox relay (see outbox.py): messages published per
+# transaction, and seconds to wait when the outbox is empty.
+OUTBOX_RELAY_BATCH_SIZE = config('OUTBOX_RELAY_BATCH_SIZE', default=500, cast=int)
+OUTBOX_RELAY_POLL_INTERVAL = config(
+    'OUTBOX_RELAY_POLL_INTERVAL', default=1.0, cast=float
+)
+# Maximum amount of numbers accepted by POST /compute/batch
+COMPUTE_BATCH_MAX_SIZE = config('COMPUTE_BATCH_MAX_SIZE', default=10000, cast=int)
+# Opt-in worker side micro-batching of the compute task (see
+# tasks.compute_batched): up to COMPUTE_BATCH_FLUSH_EVERY messages are
+# processed together, or whatever arrived in COMPUTE_BATCH_FLUSH_INTERVAL_MS.
+COMPUTE_BATCHING_ENABLED = config(
+    'COMPUTE_BATCHING_ENABLED', default=False, cast=bool
+)
+COMPUTE_BATCH_FLUSH_EVERY = config('COMPUTE_BATCH_FLUSH_EVERY', default=100, cast=int)
+COMPUTE_BATCH_FLUSH_INTERVAL_MS = config(
+    'COMPUTE_BATCH_FLUSH_INTERVAL_MS', default=50, cast=int
+)
 
 JWT_SECRET_KEY = config('JWT_SECRET_KEY', cast=str)
+
+# Password hashing (bcrypt) process pool, per gunicorn worker.
+# 0 workers runs the hashing inline, on the request thread.
+PASSWORD_HASHING_WORKERS = config('PASSWORD_HASHING_WORKERS', default=2, cast=int)
+# How many hashing jobs may wait for a free process before new ones
+# are rejected with HTTP 429.
+PASSWORD_HASHING_MAX_PENDING = config(
+    'PASSWORD_HASHING_MAX_PENDING', default=8, cast=int
+)
+# Seconds to wait for a hashing job before giving up with HTTP 503.
+PASSWORD_HASHING_TIMEOUT = config('PASSWORD_HASHING_TIMEOUT', default=5.0, cast=float)
+
+# bcrypt cost: calibrated at startup to the highest cost that hashes within
+# BCRYPT_TARGET_HASH_MS on the current hardware, but never below
+# BCRYPT_MIN_ROUNDS. BCRYPT_FAST_MODE uses the bcrypt minimum (4) instead,
+# it must only be used on the test suite.
+BCRYPT_TARGET_HASH_MS = config('BCRYPT_TARGET_HASH_MS', default=250, cast=float)
+BCRYPT_MIN_ROUNDS = config('BCRYPT_MIN_ROUNDS', default=12, cast=int)
+BCRYPT_FAST_MODE = config('BCRYPT_FAST_MODE', default=False, cast=bool)
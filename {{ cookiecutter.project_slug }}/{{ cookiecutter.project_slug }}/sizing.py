@@ -0,0 +1,143 @@
+"""
+Sizing of the gunicorn workers from the resources of the container: the
+CPU quota and the memory limit of its cgroup (v2, or v1), instead of the
+CPUs and the memory of the host, which is what os.cpu_count() reports
+(e.g. 64 CPUs on a container limited to 2).
+
+The workload profile sets how the CPUs are used:
+
+- io (the default): the requests mostly wait on the database and the
+  broker, so there are two workers per CPU (plus one) with IO_THREADS
+  threads each;
+- cpu: the requests mostly compute, so there is a worker per CPU (plus
+  one, for the time each waits on I/O) with a single thread, since the
+  GIL would run the others one at a time anyway.
+
+The workers are then capped by the memory limit, at worker_memory_mb
+each (one of them for the master), and the backlog (the connections
+waiting to be accepted) follows the number of request threads.
+
+Each value can be set instead (see the WEB_* settings). This module only
+depends on the standard library: the gunicorn config file loads it on its
+own, without importing the package (and the app settings) on the master.
+"""
+
+import math
+import os
+from typing import Optional
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+PROFILES = ('io', 'cpu')
+IO_THREADS = 4
+# pending connections per request thread, within the usual backlog range
+BACKLOG_PER_THREAD = 32
+MIN_BACKLOG = 64
+MAX_BACKLOG = 2048
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding='ascii') as cgroup_file:
+            return cgroup_file.read().strip()
+    except OSError:
+        return None
+
+
+def get_cpu_quota(root: str = CGROUP_ROOT) -> Optional[float]:
+    """
+    The CPUs of the cgroup quota, None when there is none.
+    """
+    cpu_max = _read(f'{root}/cpu.max')  # v2: "<quota> <period>", or "max <period>"
+    if cpu_max is not None:
+        quota, _, period = cpu_max.partition(' ')
+    else:  # v1: a quota of -1 when there is none
+        quota = _read(f'{root}/cpu/cpu.cfs_quota_us')
+        period = _read(f'{root}/cpu/cpu.cfs_period_us')
+    try:
+        quota, period = int(quota), int(period)
+    except (TypeError, ValueError):
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return quota / period
+
+
+def get_cpu_limit(root: str = CGROUP_ROOT) -> float:
+    """
+    The CPUs the process can use: the ones it may run on, or fewer with a
+    cgroup quota (e.g. 1.5 for 150ms every 100ms).
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = float(len(os.sched_getaffinity(0)))
+    else:
+        cpus = float(os.cpu_count() or 1)
+    quota = get_cpu_quota(root)
+    return cpus if quota is None else min(cpus, quota)
+
+
+def get_memory_limit(root: str = CGROUP_ROOT) -> Optional[int]:
+    """
+    The cgroup memory limit in bytes, None when there is none (or it is
+    above the memory of the host).
+    """
+    limit = _read(f'{root}/memory.max')  # v2: "max" when there is none
+    if limit is None:  # v1: a huge number when there is none
+        limit = _read(f'{root}/memory/memory.limit_in_bytes')
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return None
+    host_memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    return limit if 0 < limit < host_memory else None
+
+
+def size_web_workers(
+    cpus: float,
+    memory_limit_bytes: Optional[int],
+    profile: str = 'io',
+    worker_memory_mb: int = 256,
+) -> dict:
+    """
+    The gunicorn workers, threads per worker and backlog for cpus (which
+    may be a fraction) and memory_limit_bytes (None for no limit).
+    """
+    if profile not in PROFILES:
+        raise ValueError(f'The profile must be one of {", ".join(PROFILES)}.')
+
+    cores = max(1, math.ceil(cpus))
+    if profile == 'cpu':
+        workers, threads = cores + 1, 1
+    else:
+        workers, threads = 2 * cores + 1, IO_THREADS
+
+    if memory_limit_bytes and worker_memory_mb > 0:
+        fitting = memory_limit_bytes // (worker_memory_mb * 1024 ** 2) - 1
+        workers = max(1, min(workers, fitting))
+
+    backlog = min(max(workers * threads * BACKLOG_PER_THREAD, MIN_BACKLOG), MAX_BACKLOG)
+    return {'workers': workers, 'threads': threads, 'backlog': backlog}
+
+
+def get_web_sizing(config) -> dict:
+    """
+    The limits, the profile and the resulting sizing of the gunicorn
+    workers, each read with config (decouple's) when it is set.
+    """
+    cpu_limit = config('CPU_LIMIT', default=get_cpu_limit(), cast=float)
+    memory_limit_mb = config(
+        'MEMORY_LIMIT_MB', default=(get_memory_limit() or 0) // 1024 ** 2, cast=int
+    )
+    profile = config('WEB_PROFILE', default='io', cast=str)
+    worker_memory_mb = config('WEB_WORKER_MEMORY_MB', default=256, cast=int)
+    sizing = size_web_workers(
+        cpu_limit, memory_limit_mb * 1024 ** 2, profile, worker_memory_mb
+    )
+    return {
+        'cpu_limit': cpu_limit,
+        'memory_limit_mb': memory_limit_mb,
+        'profile': profile,
+        'worker_memory_mb': worker_memory_mb,
+        'workers': config('WEB_WORKERS', default=sizing['workers'], cast=int),
+        'threads': config('WEB_THREADS', default=sizing['threads'], cast=int),
+        'backlog': config('WEB_BACKLOG', default=sizing['backlog'], cast=int),
+    }
@@ -0,0 +1,379 @@
+"""
+Durable local spool for task publishes.
+
+When the broker stalls, a publish blocks the request thread until kombu
+gives up, which can exhaust the gunicorn threads. publish_task() publishes
+with a strict timeout instead (BROKER_PUBLISH_TIMEOUT, without retries) and
+when that fails it appends the message to an append-only, memory-mapped
+spool file. A background thread replays the spool to the broker, in order,
+once it is reachable again. Groups of tasks are not spooled (their tasks
+share a group id and result): publish_group() publishes them the same way,
+but answers 503 when that fails.
+
+Each process has its own spool file (spool-<pid>.bin on SPOOL_DIR), locked
+while the process is alive. Spool files left behind by dead processes
+(e.g. a recycled gunicorn worker) are adopted and drained by the replayers
+of the live ones.
+"""
+
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Callable, Optional
+
+from kombu.exceptions import OperationalError
+from kombu.utils.uuid import uuid
+
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.exceptions import TaskQueueUnavailable, TaskSpoolFull
+from {{ cookiecutter.project_slug }}.tracing import get_trace_headers
+
+logger = logging.getLogger(__name__)
+
+# header: magic, read offset, write offset (the write offset is only
+# updated after a record is fully written, so it is the commit point)
+HEADER = struct.Struct('<4sQQ')
+HEADER_SIZE = 32
+MAGIC = b'SPL1'
+# record: payload length, payload crc32, payload (json)
+RECORD = struct.Struct('<II')
+
+PUBLISH_ERRORS = (OperationalError, OSError)
+MAX_REPLAY_BACKOFF = 60  # seconds
+
+
+class TaskSpool:
+    """
+    Append-only FIFO of task messages on a memory-mapped file.
+    """
+
+    def __init__(self, path: str, size: int, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+
+        self._file = open(path, 'a+b')
+        try:
+            # raises BlockingIOError when another live process owns it
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            raise
+
+        self._mmap = None
+        try:
+            is_new = os.fstat(self._file.fileno()).st_size == 0
+            if is_new:
+                self._file.truncate(size)
+            # raises ValueError on an empty file (with size=0)
+            self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+            if is_new:
+                self._write_header(HEADER_SIZE, HEADER_SIZE)
+            else:
+                magic, self.read_offset, self.write_offset = HEADER.unpack_from(
+                    self._mmap
+                )
+                if magic != MAGIC:
+                    raise ValueError(f'{path} is not a task spool file.')
+        except Exception:
+            # closing the file releases the lock too
+            if self._mmap is not None:
+                self._mmap.close()
+            self._file.close()
+            raise
+
+    @property
+    def pending(self) -> bool:
+        return self.read_offset < self.write_offset
+
+    def append(self, message: dict):
+        payload = json.dumps(message).encode('utf-8')
+        record_size = RECORD.size + len(payload)
+
+        with self._lock:
+            if self.write_offset + record_size > len(self._mmap):
+                self._compact()
+            if self.write_offset + record_size > len(self._mmap):
+                raise TaskSpoolFull()
+
+            RECORD.pack_into(
+                self._mmap, self.write_offset, len(payload), zlib.crc32(payload)
+            )
+            payload_offset = self.write_offset + RECORD.size
+            self._mmap[payload_offset : payload_offset + len(payload)] = payload
+            self._write_header(self.read_offset, self.write_offset + record_size)
+
+    def peek(self) -> Optional[dict]:
+        """
+        Return the oldest message, without removing it.
+        """
+        with self._lock:
+            while self.pending:
+                size, crc = RECORD.unpack_from(self._mmap, self.read_offset)
+                payload_offset = self.read_offset + RECORD.size
+                payload = self._mmap[payload_offset : payload_offset + size]
+                if zlib.crc32(payload) == crc:
+                    return json.loads(payload)
+
+                logger.error(
+                    f'Skipping corrupted record on {self.path} '
+                    f'at offset {self.read_offset}.'
+                )
+                self._advance(RECORD.size + size)
+            return None
+
+    def pop(self):
+        """
+        Remove the oldest message (after it was published).
+        """
+        with self._lock:
+            size, _ = RECORD.unpack_from(self._mmap, self.read_offset)
+            self._advance(RECORD.size + size)
+
+    def close(self):
+        with self._lock:
+            self._mmap.close()
+            self._file.close()
+
+    def _advance(self, record_size: int):
+        read_offset = self.read_offset + record_size
+        if read_offset >= self.write_offset:
+            # empty: start over from the beginning of the file
+            self._write_header(HEADER_SIZE, HEADER_SIZE)
+        else:
+            self._write_header(read_offset, self.write_offset)
+
+    def _compact(self):
+        pending_size = self.write_offset - self.read_offset
+        if self.read_offset == HEADER_SIZE:
+            return
+        self._mmap.move(HEADER_SIZE, self.read_offset, pending_size)
+        self._write_header(HEADER_SIZE, HEADER_SIZE + pending_size)
+
+    def _write_header(self, read_offset: int, write_offset: int):
+        if self.fsync:
+            self._mmap.flush()
+        HEADER.pack_into(self._mmap, 0, MAGIC, read_offset, write_offset)
+        if self.fsync:
+            self._mmap.flush()
+        self.read_offset = read_offset
+        self.write_offset = write_offset
+
+
+def send_to_broker(celery, message: dict):
+    task = celery.tasks[message['name']]
+    task.apply_async(
+        message['args'],
+        message['kwargs'],
+        task_id=message['id'],
+        retry=False,
+        **message['options'],
+    )
+
+
+def remove_invalid_spool(path: str):
+    try:
+        spool_file = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with spool_file:
+        try:
+            fcntl.flock(spool_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # taken by a live process in the meantime
+        os.remove(path)
+    logger.warning(f'Removed the invalid task spool {path}.')
+
+
+class SpoolReplayer(threading.Thread):
+    """
+    Background thread that drains the spool (and the ones left behind by
+    dead processes) to the broker, retrying with a backoff while it fails.
+    """
+
+    def __init__(self, publisher: 'SpoolingPublisher', interval: float):
+        super().__init__(name='task-spool-replayer', daemon=True)
+        self.publisher = publisher
+        self.interval = interval
+        self.wake_up = threading.Event()
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake_up.set()
+
+    def run(self):
+        retry_in = self.interval
+        while not self.stopped.is_set():
+            try:
+                drained = self.publisher.replay(
+                    self.publisher.spool
+                ) and self.publisher.adopt_orphan_spools()
+            except Exception:
+                logger.exception('Task spool replay failed.')
+                drained = False
+
+            if drained:
+                # nothing to do until something is spooled, but look for
+                # orphan spools every now and then
+                retry_in = self.interval
+                timeout = self.interval * 30
+            else:
+                timeout = retry_in
+                retry_in = min(retry_in * 2, MAX_REPLAY_BACKOFF)
+
+            self.wake_up.wait(timeout=timeout)
+            self.wake_up.clear()
+
+
+class SpoolingPublisher:
+    def __init__(
+        self,
+        spool: TaskSpool,
+        send: Callable[[dict], None],
+        replay_interval: float = 1.0,
+    ):
+        self.spool = spool
+        self.send = send
+        self.replayer = SpoolReplayer(self, interval=replay_interval)
+        self.replayer.start()
+
+    def publish(self, name: str, args=None, kwargs=None, **options) -> str:
+        # a replayed message is sent by the replayer thread, out of the
+        # trace of the request (or task) that published it
+        trace_headers = get_trace_headers()
+        if trace_headers:
+            options.setdefault('headers', trace_headers)
+
+        message = {
+            'id': options.pop('task_id', None) or uuid(),
+            'name': name,
+            'args': list(args or ()),
+            'kwargs': kwargs or {},
+            'options': options,
+        }
+
+        # while there are spooled messages, new ones go after them,
+        # so that the broker gets them in order
+        if self.spool.pending:
+            self.spool.append(message)
+            # without waiting for the backoff: the broker may be back (the
+            # wake ups while a replay runs only make one more attempt)
+            self.replayer.wake_up.set()
+            return message['id']
+
+        try:
+            self.send(message)
+        except PUBLISH_ERRORS as error:  # counted on the publish stats
+            logger.warning(
+                f'Could not publish {name} ({error!r}), spooling it to '
+                f'{self.spool.path}.'
+            )
+            self.spool.append(message)
+            self.replayer.wake_up.set()
+        return message['id']
+
+    def replay(self, spool: TaskSpool) -> bool:
+        """
+        Publish the spooled messages, oldest first. Return whether the
+        spool was fully drained.
+        """
+        while True:
+            message = spool.peek()
+            if message is None:
+                return True
+            try:
+                self.send(message)
+            except PUBLISH_ERRORS as error:
+                logger.info(f'Broker still unavailable ({error!r}), will retry.')
+                return False
+            spool.pop()
+            logger.info(f'Replayed spooled task {message["name"]}[{message["id"]}].')
+
+    def adopt_orphan_spools(self) -> bool:
+        directory = os.path.dirname(self.spool.path)
+        for file_name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, file_name)
+            if path == self.spool.path or not file_name.startswith('spool-'):
+                continue
+            try:
+                orphan = TaskSpool(path, size=0, fsync=self.spool.fsync)
+            except BlockingIOError:
+                continue  # owned by a live process
+            except ValueError:
+                # not owned, but empty (its process died before sizing it)
+                # or not a spool: nothing to replay
+                remove_invalid_spool(path)
+                continue
+
+            logger.info(f'Adopted the task spool {path}.')
+            try:
+                if not self.replay(orphan):
+                    return False
+                os.remove(path)
+            finally:
+                orphan.close()
+        return True
+
+    def stop(self):
+        self.replayer.stop()
+        self.replayer.join()
+        self.spool.close()
+
+
+_publisher = None
+_publisher_pid = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher(celery) -> SpoolingPublisher:
+    global _publisher, _publisher_pid
+
+    with _publisher_lock:
+        # threads (the replayer) do not survive a fork: start a new one
+        if _publisher is None or _publisher_pid != os.getpid():
+            os.makedirs(settings.SPOOL_DIR, exist_ok=True)
+            spool = TaskSpool(
+                os.path.join(settings.SPOOL_DIR, f'spool-{os.getpid()}.bin'),
+                size=settings.SPOOL_SIZE_BYTES,
+                fsync=settings.SPOOL_FSYNC,
+            )
+            _publisher = SpoolingPublisher(
+                spool,
+                send=lambda message: send_to_broker(celery, message),
+                replay_interval=settings.SPOOL_REPLAY_INTERVAL,
+            )
+            _publisher_pid = os.getpid()
+        return _publisher
+
+
+def publish_task(task, args=None, kwargs=None, **options) -> str:
+    """
+    Publish a task, falling back to the spool when the broker is not
+    available. Return the task id.
+
+    NOTE: the options are stored as json on the spool, so only pass json
+          serializable ones (e.g. countdown instead of eta).
+    """
+    if task.app.conf.task_always_eager:
+        return task.apply_async(args, kwargs, **options).id
+    return get_publisher(task.app).publish(task.name, args, kwargs, **options)
+
+
+def publish_group(tasks):
+    """
+    Publish a group of tasks (e.g. chunks) without retries, raising
+    TaskQueueUnavailable when the broker is not available. Return the
+    group result.
+    """
+    try:
+        return tasks.apply_async(retry=False)
+    except PUBLISH_ERRORS as error:  # counted on the publish stats
+        logger.warning(f'Could not publish a group of {len(tasks.tasks)} tasks ({error!r}).')
+        raise TaskQueueUnavailable()
@@ -1,17 +1,31 @@
 import logging
 import string
+from datetime import datetime
 from random import SystemRandom, randint
+from typing import List
 
 from celery import shared_task
+from celery_batches import Batches
+
+from {{ cookiecutter.project_slug }} import settings
+
+# numpy is optional (see double_numbers), and imported on first use:
+# it takes longer to import than the rest of the app
+NOT_IMPORTED = object()
+numpy = NOT_IMPORTED
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task()
 def compute(random_number: int, now_timestamp: str) -> None:
+    # now_timestamp is when the request was received, so this is the lag
+    # through the API, broker and queue (see metrics.py for the queue wait)
+    lag = datetime.now() - datetime.fromisoformat(now_timestamp)
     logger.info(
         f'Received random_number={random_number}, '
-        f'now_timestamp={now_timestamp}....'
+        f'now_timestamp={now_timestamp} '
+        f'(lag: {lag.total_seconds() * 1000:.1f}ms)....'
     )
     random_number *= 2
     logger.info(
@@ -19,6 +33,83 @@ def compute(random_number: int, now_timestamp: str) -> None:
     )
 
 
+# the numbers that can be doubled as an int64
+INT64_HALF_MIN = -(2 ** 62)
+INT64_HALF_MAX = 2 ** 62 - 1
+
+
+def get_numpy():
+    global numpy
+    if numpy is NOT_IMPORTED:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+def double_numbers(numbers: List[int]) -> List[int]:
+    """
+    Vectorized version of the computation done by compute(). The numbers
+    whose double does not fit in an int64 are doubled in Python instead,
+    as compute() does.
+    """
+    numpy = get_numpy()
+    fits = INT64_HALF_MIN <= min(numbers) and max(numbers) <= INT64_HALF_MAX
+    if numpy is not None and fits:
+        return (numpy.asarray(numbers, dtype=numpy.int64) * 2).tolist()
+    return [number * 2 for number in numbers]
+
+
+@shared_task(
+    base=Batches,
+    flush_every=settings.COMPUTE_BATCH_FLUSH_EVERY,
+    flush_interval=settings.COMPUTE_BATCH_FLUSH_INTERVAL_MS / 1000,
+    acks_late=True,
+)
+def compute_batched(requests) -> None:
+    """
+    Batched variant of compute(), enabled with COMPUTE_BATCHING_ENABLED.
+
+    The worker buffers up to COMPUTE_BATCH_FLUSH_EVERY messages (or waits
+    COMPUTE_BATCH_FLUSH_INTERVAL_MS), computes all their numbers in one
+    call and then acknowledges all the messages together.
+
+    NOTE: the worker prefetch count (concurrency * prefetch multiplier)
+          must be at least COMPUTE_BATCH_FLUSH_EVERY, otherwise the
+          buffer never fills up and every flush waits for the interval.
+    """
+    numbers = [request.kwargs['random_number'] for request in requests]
+    logger.info(f'Received a batch of {len(numbers)} random numbers....')
+    results = double_numbers(numbers)
+    logger.info(f'Batch computation finished, {len(results)} numbers doubled.')
+
+
+@shared_task(bind=True)
+def export_users(self) -> dict:
+    """
+    Export all the users as gzip compressed NDJSON files on EXPORTS_DIR,
+    see exports.py. The task id is the export id.
+    """
+    # models (used by exports) import this module
+    # pylint: disable=import-outside-toplevel
+    from {{ cookiecutter.project_slug }}.exports import export_users as export
+
+    def log_progress(manifest: dict):
+        logger.info(
+            f'Export {manifest["id"]}: {manifest["rows"]} users exported '
+            f'({manifest["status"]}).'
+        )
+
+    return export(
+        export_id=self.request.id,
+        directory=settings.EXPORTS_DIR,
+        rows_per_chunk=settings.EXPORT_ROWS_PER_FILE,
+        batch_size=settings.USERS_STREAM_BATCH_SIZE,
+        on_progress=log_progress,
+    )
+
+
 @shared_task()
 def generate_random_string() -> None:
     logger.info('Generating random string...')
@@ -26,3 +117,11 @@ def generate_random_string() -> None:
         string.ascii_lowercase + string.digits) for _ in
         range(randint(10, 20)))
     logger.info(f'Random string successfully generated: {random_string}')
+
+
+@shared_task()
+def notify_user_registered(user_uuid: str) -> None:
+    """
+    Enqueued by User.register() through the transactional outbox.
+    """
+    logger.info(f'Sending the welcome notification to the user {user_uuid}...')
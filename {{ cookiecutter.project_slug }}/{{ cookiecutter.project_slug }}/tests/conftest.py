@@ -1,7 +1,14 @@
 import pytest
 
+from {{cookiecutter.project_slug}} import settings
 from {{cookiecutter.project_slug}}.factory import create_app
 from {{cookiecutter.project_slug}}.extensions import db
+from {{cookiecutter.project_slug}}.tests.utils import create_multi_users
+
+# hash passwords with the minimum bcrypt cost, so that the tests run fast.
+# On the settings: the package (and so the settings) is imported before
+# this conftest, setting the environment variable here would be too late.
+settings.BCRYPT_FAST_MODE = True
 
 
 @pytest.fixture
@@ -34,7 +41,15 @@ def db_session(app):
 
         from sqlalchemy.orm import scoped_session, sessionmaker
 
-        session = scoped_session(sessionmaker(bind=connection))
+        # commit()/rollback() on the code under test only release/roll back
+        # a savepoint, never the outer transaction
+        session = scoped_session(
+            sessionmaker(
+                bind=connection,
+                join_transaction_mode='create_savepoint',
+                expire_on_commit=False,  # as on the db extension
+            )
+        )
         db.session = session
 
         yield session
@@ -42,3 +57,15 @@ def db_session(app):
         transaction.rollback()
         connection.close()
         session.remove()
+
+
+@pytest.fixture
+def auth_headers(test_client, db_session):
+    """
+    The Authorization header of one of the users of create_multi_users().
+    """
+    create_multi_users()
+    response = test_client.post(
+        '/login', json={'email': 'jlp@startrek.com', 'password': '12345678'}
+    )
+    return {'Authorization': f'Bearer {response.json["access_token"]}'}
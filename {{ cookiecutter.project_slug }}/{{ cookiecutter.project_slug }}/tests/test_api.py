@@ -1,37 +1,78 @@
+import json
 from unittest import mock
 
-from {{cookiecutter.project_slug}} import app
+from celery import group
+from kombu.exceptions import OperationalError
+
 from {{cookiecutter.project_slug}}.models import User
 
 
-client = app.test_client()
+def test_compute_sent_to_queue(test_client):
+    response = test_client.get('/compute')
+    assert response.status_code == 200
+    assert response.json == {'message': 'Successfully sent to queue.'}
 
 
-def test_compute_sent_to_queue():
-    response = client.get('/compute')
+def test_compute_batch_sent_to_queue_as_one_group(test_client):
+    response = test_client.post('/compute/batch', json={'numbers': [1, 2, 3]})
     assert response.status_code == 200
-    assert response.json == {'message': 'Successfully sent to queue.'}
+    assert response.json['group_id']
+    assert response.json['count'] == 3
+    assert response.json['metadata']['messages'] == 3
+    assert response.json['metadata']['messages_per_second'] > 0
+
+
+def test_compute_batch_with_chunks_sent_to_queue(test_client):
+    response = test_client.post(
+        '/compute/batch', json={'numbers': [1, 2, 3, 4, 5], 'chunk_size': 2}
+    )
+    assert response.status_code == 200
+    assert response.json['count'] == 5
+    assert response.json['metadata']['messages'] == 3
+
+
+def test_compute_batch_with_the_broker_down(test_client, monkeypatch):
+    def apply_async(self, *args, **kwargs):
+        assert kwargs['retry'] is False
+        raise OperationalError('broker is down')
 
+    monkeypatch.setattr(group, 'apply_async', apply_async)
+    response = test_client.post('/compute/batch', json={'numbers': [1, 2, 3]})
+    assert response.status_code == 503
 
-def test_404():
-    response = client.get('/api/echoes')
+
+def test_compute_batch_with_invalid_numbers(test_client):
+    response = test_client.post('/compute/batch', json={'numbers': ['1', 2]})
+    assert response.status_code == 400
+
+
+def test_404(test_client):
+    response = test_client.get('/api/echoes')
     assert response.status_code == 404
 
 
 @mock.patch('{{cookiecutter.project_slug}}.commons.get_app_version', return_value='1.0')
-def test_healthcheck_readiness(_mocked_version):
-    response = client.get('/health-check/readiness')
+def test_healthcheck_readiness(_mocked_version, test_client, db_session):
+    response = test_client.get('/health-check/readiness')
     assert response.status_code == 200
     assert set(response.json.keys()) == {'ready', 'app_version', 'app_type'}
 
 
 @mock.patch('{{cookiecutter.project_slug}}.commons.get_app_version', return_value='1.0')
-def test_healthcheck_liveness(_mocked_version):
-    response = client.get('/health-check/liveness')
+def test_healthcheck_liveness(_mocked_version, test_client):
+    response = test_client.get('/health-check/liveness')
     assert response.status_code == 200
     assert set(response.json.keys()) == {'live', 'version', 'timestamp'}
 
 
+def test_stats(test_client):
+    response = test_client.get('/stats')
+    assert response.status_code == 200
+    assert set(response.json.keys()) == {'pid', 'broker', 'database', 'queries'}
+    assert response.json['broker']['pool_limit'] > 0
+    assert response.json['database']['pool_size'] > 0
+
+
 class TestUserAPI:
     def submit_create_user_request(self, test_client):
         payload = {
@@ -139,3 +180,43 @@ class TestUserAPI:
         new_access_token = new_login_response.json['access_token']
         assert new_access_token is not None
         assert new_access_token != access_token
+
+
+class TestListUsersAPI:
+    def test_list_users_by_pages(self, test_client, auth_headers):
+        first_page = test_client.get('/users?limit=2', headers=auth_headers)
+        assert first_page.status_code == 200
+        assert [user['username'] for user in first_page.json['users']] == [
+            'jean_luc_picard',
+            'william_riker',
+        ]
+        assert first_page.json['next_cursor']
+
+        cursor = first_page.json['next_cursor']
+        last_page = test_client.get(f'/users?limit=2&cursor={cursor}', headers=auth_headers)
+        assert last_page.status_code == 200
+        assert [user['username'] for user in last_page.json['users']] == [
+            'deanna_troy'
+        ]
+        assert last_page.json['next_cursor'] is None
+
+    def test_list_users_as_ndjson_stream(self, test_client, auth_headers):
+        response = test_client.get('/users?format=ndjson', headers=auth_headers)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+
+        users = [json.loads(line) for line in response.data.splitlines()]
+        assert [user['username'] for user in users] == [
+            'jean_luc_picard',
+            'william_riker',
+            'deanna_troy',
+        ]
+        assert set(users[0].keys()) == {'uuid', 'username', 'email', 'created_at'}
+
+    def test_list_users_with_invalid_cursor(self, test_client, auth_headers):
+        response = test_client.get('/users?cursor=not-a-cursor', headers=auth_headers)
+        assert response.status_code == 400
+
+    def test_list_users_with_invalid_limit(self, test_client, auth_headers):
+        response = test_client.get('/users?limit=0', headers=auth_headers)
+        assert response.status_code == 400
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+from celery.app.task import Task
+from kombu.exceptions import OperationalError
+
+from {{cookiecutter.project_slug}}.broker import publish_stats
+from {{cookiecutter.project_slug}}.tasks import generate_random_string
+
+
+@pytest.fixture
+def published(app, monkeypatch):
+    monkeypatch.setattr(app.extensions['celery'].conf, 'task_always_eager', False)
+    publish_stats.reset()
+    yield
+    publish_stats.reset()
+
+
+def test_publish_is_timed_from_waiting_for_a_producer(published, monkeypatch):
+    def apply_async(self, *args, **kwargs):
+        time.sleep(0.02)  # e.g. waiting for a producer of an exhausted pool
+
+    monkeypatch.setattr(Task, 'apply_async', apply_async)
+
+    generate_random_string.apply_async()
+
+    snapshot = publish_stats.snapshot()
+    assert snapshot['count'] == 1
+    assert snapshot['max_ms'] >= 20
+    assert snapshot['errors'] == 0
+
+
+def test_failed_publishes_are_counted(published, monkeypatch):
+    def apply_async(self, *args, **kwargs):
+        raise OperationalError('broker is down')
+
+    monkeypatch.setattr(Task, 'apply_async', apply_async)
+
+    with pytest.raises(OperationalError):
+        generate_random_string.apply_async()
+
+    snapshot = publish_stats.snapshot()
+    assert (snapshot['count'], snapshot['errors']) == (0, 1)
+
+
+def test_eager_tasks_are_not_timed(app):
+    publish_stats.reset()
+    generate_random_string.apply_async()
+    assert publish_stats.snapshot()['count'] == 0
@@ -0,0 +1,44 @@
+from {{cookiecutter.project_slug}} import settings
+from {{cookiecutter.project_slug}}.database import (
+    TimedQueuePool,
+    dispose_engine,
+    get_database_pool_stats,
+    pool_wait_stats,
+)
+from {{cookiecutter.project_slug}}.extensions import db
+
+
+def test_engine_pool_is_sized_from_settings(app):
+    pool = db.engine.pool
+    assert isinstance(pool, TimedQueuePool)
+    assert pool.size() == settings.DATABASE_POOL_SIZE
+    assert pool._max_overflow == settings.DATABASE_MAX_OVERFLOW
+    assert pool._pre_ping == settings.DATABASE_POOL_PRE_PING
+
+
+def test_connections_are_opened_with_a_timeout(app):
+    with db.engine.connect() as connection:
+        parameters = connection.connection.dbapi_connection.get_dsn_parameters()
+    assert parameters['connect_timeout'] == str(settings.DATABASE_CONNECT_TIMEOUT)
+
+
+def test_pool_checkout_is_timed(app):
+    pool_wait_stats.reset()
+    with db.engine.connect() as connection:
+        stats = get_database_pool_stats(db.engine)
+        assert stats['checked_out'] == 1
+        assert connection.exec_driver_sql('SELECT 1').scalar() == 1
+
+    stats = get_database_pool_stats(db.engine)
+    assert stats['checked_out'] == 0
+    assert stats['wait']['count'] == 1
+
+
+def test_dispose_engine_drops_inherited_connections(app):
+    with db.engine.connect():
+        pass
+    assert db.engine.pool.checkedin() == 1
+
+    dispose_engine(app)
+    assert db.engine.pool.checkedin() == 0
+    assert isinstance(db.engine.pool, TimedQueuePool)
@@ -0,0 +1,119 @@
+import gzip
+import json
+import os
+import tracemalloc
+
+from sqlalchemy import insert
+
+from {{cookiecutter.project_slug}}.exports import export_users, read_manifest
+from {{cookiecutter.project_slug}}.extensions import db
+from {{cookiecutter.project_slug}}.models import User
+from {{cookiecutter.project_slug}}.tests.utils import create_multi_users
+
+
+def read_export(directory, manifest) -> list:
+    users = []
+    for file_name in manifest['files']:
+        with gzip.open(os.path.join(directory, file_name), 'rt') as export_file:
+            users.extend(json.loads(line) for line in export_file)
+    return users
+
+
+def insert_users(first: int, count: int):
+    db.session.execute(
+        insert(User),
+        [
+            {
+                'username': f'user-{number}',
+                'email': f'user-{number}@example.com',
+                'password_hash': '$2b$04$' + 'x' * 53,
+            }
+            for number in range(first, first + count)
+        ],
+    )
+    db.session.commit()
+
+
+def get_export_peak_memory(directory) -> int:
+    tracemalloc.start()
+    try:
+        export_users(
+            '00000000-0000-4000-8000-000000000000',
+            str(directory),
+            rows_per_chunk=1000,
+            batch_size=100,
+        )
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class TestExportUsers:
+    def test_export_writes_chunks_and_manifest(self, db_session, tmp_path):
+        create_multi_users()
+        progress = []
+
+        manifest = export_users(
+            '11111111-1111-4111-8111-111111111111',
+            str(tmp_path),
+            rows_per_chunk=2,
+            batch_size=2,
+            on_progress=lambda manifest: progress.append(manifest['rows']),
+        )
+
+        assert manifest['status'] == 'done'
+        assert manifest['rows'] == 3
+        assert manifest['files'] == [
+            'users-11111111-1111-4111-8111-111111111111-00001.ndjson.gz',
+            'users-11111111-1111-4111-8111-111111111111-00002.ndjson.gz',
+        ]
+        assert progress == [2, 3]
+
+        users = read_export(tmp_path, manifest)
+        assert [user['username'] for user in users] == [
+            'jean_luc_picard',
+            'william_riker',
+            'deanna_troy',
+        ]
+        assert read_manifest(str(tmp_path), manifest['id']) == manifest
+
+    def test_read_manifest_of_unknown_or_invalid_export(self, tmp_path):
+        unknown_id = '22222222-2222-4222-8222-222222222222'
+        assert read_manifest(str(tmp_path), unknown_id) is None
+        assert read_manifest(str(tmp_path), '../../etc/passwd') is None
+
+    def test_export_peak_memory_does_not_grow_with_the_users(
+        self, db_session, tmp_path
+    ):
+        insert_users(0, 1000)
+        small_export_peak = get_export_peak_memory(tmp_path / 'small')
+
+        insert_users(1000, 9000)
+        large_export_peak = get_export_peak_memory(tmp_path / 'large')
+
+        # 10x the users, but (about) the same memory: one cursor batch
+        assert large_export_peak < small_export_peak * 1.5
+
+
+class TestExportUsersAPI:
+    def test_start_export_and_follow_it(
+        self, test_client, auth_headers, monkeypatch, tmp_path
+    ):
+        for module in ('settings', 'api'):
+            monkeypatch.setattr(
+                f'{{cookiecutter.project_slug}}.{module}.EXPORTS_DIR', str(tmp_path)
+            )
+
+        response = test_client.post('/users/export', headers=auth_headers)
+        assert response.status_code == 202
+        task_id = response.json['task_id']
+
+        # the tasks run eagerly on the test suite
+        response = test_client.get(f'/users/export/{task_id}', headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json['status'] == 'done'
+        assert response.json['rows'] == 3
+
+    def test_unknown_export(self, test_client, auth_headers):
+        response = test_client.get('/users/export/not-an-export', headers=auth_headers)
+        assert response.status_code == 404
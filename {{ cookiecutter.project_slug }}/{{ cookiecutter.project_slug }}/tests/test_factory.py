@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+
+from click.testing import CliRunner
+from flask.cli import FlaskGroup
+
+import {{cookiecutter.project_slug}}
+from {{cookiecutter.project_slug}}.factory import create_app, create_worker_app
+from {{cookiecutter.project_slug}}.tasks import generate_random_string
+
+PROJECT_DIR = os.path.dirname(os.path.dirname({{cookiecutter.project_slug}}.__file__))
+
+
+def run_python(code: str) -> str:
+    """
+    The last line printed by code (the app logs to stdout too).
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', code],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return output.splitlines()[-1] if output else ''
+
+
+def test_the_app_is_created_on_first_use():
+    output = run_python(
+        'import {{cookiecutter.project_slug}} as package\n'
+        'created = "app" in vars(package)\n'
+        'print(created, package.app is package.app)\n'
+    )
+    assert output == 'False True'
+
+
+def test_slow_imports_are_deferred():
+    output = run_python(
+        'import sys\n'
+        'from {{cookiecutter.project_slug}}.factory import create_app\n'
+        'create_app()\n'
+        'print(sorted({"alembic", "numpy"} & set(sys.modules)))\n'
+    )
+    assert output == '[]'
+
+
+def test_the_migrations_commands_are_on_the_flask_cli():
+    cli = FlaskGroup(create_app=create_app)
+    result = CliRunner().invoke(cli, ['db', '--help'])
+    assert result.exit_code == 0, result.output
+    assert 'upgrade' in result.output
+
+
+def test_the_migrations_are_not_set_up_outside_the_flask_cli(app):
+    assert 'migrate' not in app.extensions
+
+
+class TestWorkerApp:
+    def test_has_no_web_extensions(self):
+        app = create_worker_app()
+        assert {'celery', 'sqlalchemy'} <= set(app.extensions)
+        assert not {'flask-jwt-extended', 'password_hasher', 'bcrypt'} & set(
+            app.extensions
+        )
+        assert app.blueprints == {}
+
+    def test_runs_the_tasks(self):
+        app = create_worker_app()
+        with app.app_context():
+            assert generate_random_string.apply().successful()
+
+    def test_does_not_import_the_web_modules(self):
+        output = run_python(
+            'import sys\n'
+            'from {{cookiecutter.project_slug}}.factory import create_worker_app\n'
+            'create_worker_app()\n'
+            'print(sorted({"flasgger", "{{cookiecutter.project_slug}}.api"} & set(sys.modules)))\n'
+        )
+        assert output == '[]'
@@ -0,0 +1,160 @@
+import time
+
+import pytest
+
+from {{cookiecutter.project_slug}}.exceptions import PasswordHashingUnavailable
+from {{cookiecutter.project_slug}}.hashing import (
+    MIN_ROUNDS,
+    PasswordHasher,
+    calibrate_rounds,
+    get_hash_rounds,
+)
+
+
+def create_hasher(workers: int, max_pending: int = 0, timeout: float = 5.0):
+    hasher = PasswordHasher()
+    hasher.rounds = 4  # bcrypt minimum, to keep the tests fast
+    hasher.configure(workers=workers, max_pending=max_pending, timeout=timeout)
+    return hasher
+
+
+class TestPasswordHasher:
+    def test_inline_hash_and_check_must_be_successful(self):
+        hasher = create_hasher(workers=0)
+
+        password_hash = hasher.generate_password_hash('12345678')
+        assert password_hash != '12345678'
+        assert hasher.check_password_hash(password_hash, '12345678') is True
+        assert hasher.check_password_hash(password_hash, '87654321') is False
+
+    def test_pool_hash_and_check_must_be_successful(self):
+        hasher = create_hasher(workers=1)
+
+        password_hash = hasher.generate_password_hash('12345678')
+        assert hasher.check_password_hash(password_hash, '12345678') is True
+        assert hasher.check_password_hash(password_hash, '87654321') is False
+
+        hasher.shutdown()
+
+    def test_warm_up_must_start_the_pool(self):
+        hasher = create_hasher(workers=2)
+
+        hasher.warm_up()
+        assert len(hasher._executor._processes) == 2
+
+        hasher.shutdown()
+
+    def test_full_pool_must_reject_with_429(self):
+        hasher = create_hasher(workers=1)
+        hasher._slots.acquire()  # simulate a job already running
+
+        with pytest.raises(PasswordHashingUnavailable) as error:
+            hasher.generate_password_hash('12345678')
+        assert error.value.status_code == 429
+
+        hasher._slots.release()
+        hasher.shutdown()
+
+    def test_slow_pool_must_reject_with_503(self):
+        hasher = create_hasher(workers=1, timeout=0.1)
+
+        with pytest.raises(PasswordHashingUnavailable) as error:
+            hasher._run(time.sleep, 1)
+        assert error.value.status_code == 503
+
+        hasher.shutdown()
+
+    def test_timed_out_jobs_must_keep_their_slot_until_done(self):
+        hasher = create_hasher(workers=1, timeout=0.1)
+
+        with pytest.raises(PasswordHashingUnavailable):
+            hasher._run(time.sleep, 1)
+        # the sleep is still running on the only pool process
+        with pytest.raises(PasswordHashingUnavailable) as error:
+            hasher.generate_password_hash('12345678')
+        assert error.value.status_code == 429
+
+        time.sleep(1.5)
+        assert hasher.generate_password_hash('12345678')
+
+        hasher.shutdown()
+
+    def test_jobs_release_the_slot_they_took_after_reconfiguring(self):
+        hasher = create_hasher(workers=1, timeout=0.1)
+
+        with pytest.raises(PasswordHashingUnavailable):
+            hasher._run(time.sleep, 1)
+        slots = hasher._slots
+        hasher.configure(workers=1, max_pending=0, timeout=5.0)
+
+        # the sleep, done on the old pool, must not release the new slots
+        time.sleep(1.5)
+        assert slots._value == 1
+        assert hasher.generate_password_hash('12345678')
+
+        hasher.shutdown()
+
+    def test_slow_bulk_must_reject_with_503(self):
+        hasher = create_hasher(workers=1, timeout=0.001)
+        hasher.rounds = 12  # far slower than the timeout, for each hash
+
+        with pytest.raises(PasswordHashingUnavailable) as error:
+            hasher.generate_password_hashes(['12345678'] * 3)
+        assert error.value.status_code == 503
+
+        hasher.shutdown()
+
+    def test_bulk_hashes_are_in_order(self):
+        hasher = create_hasher(workers=2)
+        passwords = [f'password-{number}' for number in range(10)]
+
+        password_hashes = hasher.generate_password_hashes(passwords)
+        assert len(password_hashes) == 10
+        for password, password_hash in zip(passwords, password_hashes):
+            assert hasher.check_password_hash(password_hash, password) is True
+
+        hasher.shutdown()
+
+    def test_timed_out_bulks_must_keep_their_slot_until_done(self):
+        hasher = create_hasher(workers=1, timeout=0.05)
+        hasher.warm_up()  # so that the first chunk starts right away
+        hasher.rounds = 12
+
+        with pytest.raises(PasswordHashingUnavailable):
+            hasher.generate_password_hashes(['12345678'] * 4)
+        # the running chunk keeps the slot, the others are cancelled
+        with pytest.raises(PasswordHashingUnavailable) as error:
+            hasher.generate_password_hashes(['12345678'])
+        assert error.value.status_code == 429
+
+        hasher.rounds = 4
+        deadline = time.monotonic() + 10
+        while not hasher._slots.acquire(blocking=False):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        hasher._slots.release()
+        assert hasher.generate_password_hashes(['12345678'])
+
+        hasher.shutdown()
+
+    def test_needs_rehash_must_detect_hashes_below_current_cost(self):
+        hasher = create_hasher(workers=0)
+        password_hash = hasher.generate_password_hash('12345678')
+        assert get_hash_rounds(password_hash) == 4
+        assert hasher.needs_rehash(password_hash) is False
+
+        hasher.rounds = 5
+        assert hasher.needs_rehash(password_hash) is True
+
+
+def test_calibrate_rounds_must_respect_floor():
+    assert calibrate_rounds(target_ms=0.001, floor=6) == 6
+
+
+def test_calibrate_rounds_must_raise_cost_for_higher_target():
+    assert calibrate_rounds(target_ms=10_000, floor=4) > 4
+
+
+def test_the_tests_hash_with_the_minimum_cost(app):
+    assert app.extensions['password_hasher'].rounds == MIN_ROUNDS
+    assert app.config['BCRYPT_LOG_ROUNDS'] == MIN_ROUNDS
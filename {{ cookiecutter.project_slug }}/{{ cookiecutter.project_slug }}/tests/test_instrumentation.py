@@ -0,0 +1,17 @@
+from {{cookiecutter.project_slug}}.instrumentation import LatencyStats
+
+
+def test_latency_stats_snapshot():
+    stats = LatencyStats('test', slow_ms=100)
+    for elapsed_ms in (0.5, 20, 150):
+        stats.observe(elapsed_ms)
+    stats.record_error()
+
+    snapshot = stats.snapshot()
+    assert snapshot['count'] == 3
+    assert snapshot['max_ms'] == 150
+    assert snapshot['slow'] == 1
+    assert snapshot['errors'] == 1
+    assert snapshot['histogram_ms']['1'] == 1
+    assert snapshot['histogram_ms']['25'] == 2
+    assert snapshot['histogram_ms']['+Inf'] == 3
@@ -0,0 +1,159 @@
+import os
+import subprocess
+import sys
+import tracemalloc
+
+import pytest
+
+from {{cookiecutter.project_slug}} import settings
+from {{cookiecutter.project_slug}}.memory import (
+    MemoryTracker,
+    get_process_group_memory,
+    memory,
+    memory_tracker,
+    read_reports,
+)
+from {{cookiecutter.project_slug}}.profiling import PROFILE_HEADER
+
+TOKEN = 'some-profiling-token'
+
+leaked = []
+
+
+def leak(count: int):
+    leaked.extend(bytearray(1024) for _ in range(count))
+
+
+@pytest.fixture(autouse=True)
+def stop_tracing():
+    yield
+    leaked.clear()
+    memory_tracker.stop()  # it makes every allocation slower
+
+
+def test_snapshots_report_the_growth_since_the_baseline():
+    tracker = MemoryTracker()
+    baseline = tracker.snapshot()
+    assert baseline['top'] == []
+    assert baseline['seconds_since'] is None
+
+    leak(1000)
+    report = tracker.snapshot()
+
+    assert report['compared_to'] == 'baseline'
+    assert report['seconds_since'] >= 0
+    assert report['traced_memory_bytes'] > 1000 * 1024
+    top = report['top'][0]
+    assert top['location'].startswith(f'{__file__}:')
+    assert top['size_diff_bytes'] >= 1000 * 1024
+    assert top['count_diff'] >= 1000
+
+
+def test_snapshots_compared_to_the_previous_one():
+    tracker = MemoryTracker()
+    tracker.snapshot()
+    leak(1000)
+    tracker.snapshot()
+
+    report = tracker.snapshot(compare_to='previous')
+    assert all(stat['size_diff_bytes'] < 1000 * 1024 for stat in report['top'])
+    # still there since the baseline
+    assert tracker.snapshot()['top'][0]['size_diff_bytes'] >= 1000 * 1024
+
+
+def test_reset_makes_a_new_baseline():
+    tracker = MemoryTracker()
+    tracker.snapshot()
+    leak(1000)
+    tracker.snapshot(reset=True)
+
+    report = tracker.snapshot()
+    assert all(stat['size_diff_bytes'] < 1000 * 1024 for stat in report['top'])
+
+
+def test_snapshots_compared_to_something_else():
+    with pytest.raises(ValueError):
+        MemoryTracker().snapshot(compare_to='yesterday')
+
+
+def test_reports_of_exited_processes_are_removed(tmp_path):
+    tracker = MemoryTracker()
+    report = tracker.snapshot()
+    tracker.write_report(str(tmp_path), report)
+    # above the maximum pid
+    tracker.write_report(str(tmp_path), {**report, 'pid': 2**22 + 1})
+
+    assert read_reports(str(tmp_path)) == [report]
+    assert os.listdir(tmp_path) == [f'{os.getpid()}.json']
+
+
+def test_worker_inspect_command(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'MEMORY_REPORTS_DIR', str(tmp_path))
+    pool_report = MemoryTracker().snapshot()
+    MemoryTracker().write_report(str(tmp_path), pool_report)
+
+    reply = memory(state=None, compare_to='previous', limit=5)
+
+    assert reply['worker']['pid'] == os.getpid()
+    assert reply['worker']['compared_to'] == 'previous'
+    assert reply['pool'] == [pool_report]
+    assert 'error' in memory(state=None, compare_to='yesterday')
+
+
+class TestMemoryEndpoint:
+    @pytest.fixture(autouse=True)
+    def profiling_token(self, monkeypatch):
+        monkeypatch.setattr(settings, 'PROFILING_TOKEN', TOKEN)
+
+    def test_requires_the_token(self, test_client):
+        assert test_client.post('/memory/snapshot').status_code == 403
+
+    def test_reports_the_growth(self, test_client):
+        response = test_client.post(
+            '/memory/snapshot?reset=true', headers={PROFILE_HEADER: TOKEN}
+        )
+        assert response.status_code == 200
+        assert response.json['pid'] == os.getpid()
+
+        leak(1000)
+        response = test_client.post(
+            '/memory/snapshot?limit=3', headers={PROFILE_HEADER: TOKEN}
+        )
+        assert len(response.json['top']) == 3
+        assert response.json['top'][0]['location'].startswith(f'{__file__}:')
+
+    def test_stop_tracing(self, test_client):
+        response = test_client.post('/memory/snapshot', headers={PROFILE_HEADER: TOKEN})
+        assert response.json['tracing']
+        assert tracemalloc.is_tracing()
+
+        response = test_client.post(
+            '/memory/snapshot?stop=true', headers={PROFILE_HEADER: TOKEN}
+        )
+        assert response.json['seconds_since'] is not None  # compared first
+        assert not response.json['tracing']
+        assert not tracemalloc.is_tracing()
+        assert memory_tracker.baseline is None
+
+    @pytest.mark.parametrize('query', ['compare_to=yesterday', 'limit=0'])
+    def test_invalid_parameters(self, test_client, query):
+        response = test_client.post(
+            f'/memory/snapshot?{query}', headers={PROFILE_HEADER: TOKEN}
+        )
+        assert response.status_code == 400
+
+
+def test_process_group_memory():
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(10)'])
+    try:
+        group = {
+            usage['pid']: usage for usage in get_process_group_memory(os.getpid())
+        }
+    finally:
+        child.kill()
+        child.wait()
+
+    assert group[os.getpid()]['parent']
+    assert not group[child.pid]['parent']
+    for usage in group.values():
+        assert usage['shared_bytes'] == usage['rss_bytes'] - usage['uss_bytes'] >= 0
@@ -0,0 +1,158 @@
+import os
+import time
+
+import pytest
+from celery.signals import after_task_publish, before_task_publish
+from prometheus_client.parser import text_string_to_metric_families
+
+from {{cookiecutter.project_slug}} import metrics
+from {{cookiecutter.project_slug}}.metrics import (
+    PUBLISHED_AT_HEADER,
+    track_process_memory,
+)
+from {{cookiecutter.project_slug}}.tasks import compute, generate_random_string
+
+
+def get_samples(test_client, name: str) -> list:
+    """
+    The samples of name on a single scrape.
+    """
+    response = test_client.get('/metrics')
+    assert response.status_code == 200
+
+    return [
+        sample
+        for family in text_string_to_metric_families(response.get_data(as_text=True))
+        for sample in family.samples
+        if sample.name == name
+    ]
+
+
+def get_sample(test_client, name: str, **labels) -> float:
+    for sample in get_samples(test_client, name):
+        if sample.labels == labels:
+            return sample.value
+    return 0
+
+
+def test_metrics_count_requests_per_route_and_status(test_client):
+    labels = {'method': 'GET', 'route': '/welcome/<person>'}
+    requests_before = get_sample(
+        test_client, 'http_requests_total', status='200', **labels
+    )
+    latency_before = get_sample(
+        test_client, 'http_request_duration_seconds_count', **labels
+    )
+
+    test_client.get('/welcome/picard')
+    test_client.get('/welcome/riker')
+
+    assert (
+        get_sample(test_client, 'http_requests_total', status='200', **labels)
+        == requests_before + 2
+    )
+    assert (
+        get_sample(test_client, 'http_request_duration_seconds_count', **labels)
+        == latency_before + 2
+    )
+    assert get_sample(test_client, 'http_requests_in_progress', **labels) == 0
+
+
+def test_metrics_count_unmatched_routes_together(test_client):
+    labels = {'method': 'GET', 'route': 'unmatched', 'status': '404'}
+    before = get_sample(test_client, 'http_requests_total', **labels)
+
+    test_client.get('/not/a/route')
+    test_client.get('/not/a/route/either')
+
+    assert get_sample(test_client, 'http_requests_total', **labels) == before + 2
+
+
+def test_metrics_count_enqueued_tasks(test_client):
+    labels = {'task': 'some.task'}
+    before = get_sample(test_client, 'celery_tasks_enqueued_total', **labels)
+
+    after_task_publish.send(sender='some.task', body=None, exchange='', routing_key='')
+
+    assert (
+        get_sample(test_client, 'celery_tasks_enqueued_total', **labels)
+        == before + 1
+    )
+
+
+def test_task_publish_stamps_the_publish_time():
+    headers = {}
+    before_task_publish.send(sender='some.task', headers=headers, body=None)
+    assert time.time() - headers[PUBLISHED_AT_HEADER] < 1
+
+
+def test_metrics_measure_tasks_per_queue(test_client):
+    labels = {'task': generate_random_string.name, 'queue': 'generate_random_string'}
+    processed_before = get_sample(
+        test_client, 'celery_tasks_processed_total', state='SUCCESS', **labels
+    )
+    wait_before = get_sample(test_client, 'celery_task_queue_wait_seconds_sum', **labels)
+    duration_before = get_sample(
+        test_client, 'celery_task_duration_seconds_count', **labels
+    )
+
+    generate_random_string.apply(headers={PUBLISHED_AT_HEADER: time.time() - 2})
+
+    assert (
+        get_sample(test_client, 'celery_tasks_processed_total', state='SUCCESS', **labels)
+        == processed_before + 1
+    )
+    assert (
+        get_sample(test_client, 'celery_task_queue_wait_seconds_sum', **labels)
+        >= wait_before + 2
+    )
+    assert (
+        get_sample(test_client, 'celery_task_duration_seconds_count', **labels)
+        == duration_before + 1
+    )
+
+
+def test_metrics_count_task_failures(test_client):
+    labels = {'task': compute.name, 'queue': 'compute'}
+    before = get_sample(
+        test_client, 'celery_task_failures_total', exception='ValueError', **labels
+    )
+
+    result = compute.apply(
+        kwargs={'random_number': 1, 'now_timestamp': 'not a timestamp'}
+    )
+
+    assert result.failed()
+    assert (
+        get_sample(
+            test_client, 'celery_task_failures_total', exception='ValueError', **labels
+        )
+        == before + 1
+    )
+    assert get_sample(
+        test_client, 'celery_tasks_processed_total', state='FAILURE', **labels
+    )
+
+
+@pytest.fixture
+def untrack_process_memory():
+    yield
+    metrics._memory_parent_pid = None
+
+
+def test_metrics_report_the_memory_of_the_process_group(
+    test_client, untrack_process_memory
+):
+    labels = {'pid': str(os.getpid()), 'role': 'parent'}
+    assert get_sample(test_client, 'process_memory_bytes', kind='uss', **labels) == 0
+
+    track_process_memory(os.getpid())
+
+    # from a single scrape: the memory changes from one to the next
+    usage = {
+        sample.labels['kind']: sample.value
+        for sample in get_samples(test_client, 'process_memory_bytes')
+        if sample.labels['pid'] == labels['pid']
+    }
+    assert 0 < usage['uss'] <= usage['rss']
+    assert usage['shared'] == usage['rss'] - usage['uss']
@@ -1,4 +1,11 @@
-from {{cookiecutter.project_slug}}.models import User
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from {{cookiecutter.project_slug}}.extensions import db, password_hasher
+from {{cookiecutter.project_slug}}.hashing import get_hash_rounds
+from {{cookiecutter.project_slug}}.models import OutboxMessage, User
+from {{cookiecutter.project_slug}}.tasks import notify_user_registered
 
 
 # TODO: the functions below could be fixtures on conftest.py
@@ -12,6 +19,25 @@ def create_user():
     return new_user
 
 
+@contextmanager
+def record_statements():
+    """
+    Record the SQL statements sent to the database (but the savepoints
+    the test session uses to isolate the tests).
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        if not statement.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT')):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
 class TestUserModel:
     def test_register_user_with_hashed_password_must_be_successful(self, db_session):
         new_user = create_user()
@@ -21,6 +47,54 @@ class TestUserModel:
         is_same_password = new_user.check_password(password='12345678')
         assert is_same_password is True
 
+    def test_register_user_must_take_one_statement_per_row(self, db_session):
+        with record_statements() as statements:
+            new_user = create_user()
+            assert new_user.uuid
+            assert new_user.created_at
+
+        # the user (with its generated values returned) and the outbox message
+        assert len(statements) == 2
+        assert statements[0].startswith('INSERT INTO "user"')
+        assert 'RETURNING' in statements[0]
+
+    def test_update_user_must_take_one_statement(self, db_session):
+        new_user = create_user()
+        old_last_updated_at = new_user.last_updated_at
+
+        with record_statements() as statements:
+            new_user.update(email='jlp2@startrek.com')
+            assert new_user.email == 'jlp2@startrek.com'
+            assert new_user.last_updated_at > old_last_updated_at
+
+        assert len(statements) == 1
+        assert statements[0].startswith('UPDATE "user"')
+        assert 'RETURNING' in statements[0]
+
+    def test_register_user_must_write_the_notification_to_the_outbox(
+        self, db_session
+    ):
+        new_user = create_user()
+
+        message = OutboxMessage.query.one()
+        assert message.task_name == notify_user_registered.name
+        assert message.kwargs == {'user_uuid': str(new_user.uuid)}
+
+    def test_check_password_must_rehash_when_cost_is_below_current(
+        self, db_session, monkeypatch
+    ):
+        new_user = create_user()
+        old_password = new_user.password_hash
+
+        monkeypatch.setattr(password_hasher, 'rounds', get_hash_rounds(old_password) + 1)
+        is_same_password = new_user.check_password(password='12345678')
+        assert is_same_password is True
+
+        existing_user = User.get_by(uuid=str(new_user.uuid))
+        assert existing_user.password_hash != old_password
+        assert get_hash_rounds(existing_user.password_hash) == password_hasher.rounds
+        assert existing_user.check_password(password='12345678') is True
+
     def test_get_by_uuid_must_be_successful(self, db_session):
         new_user = create_user()
         assert new_user.uuid
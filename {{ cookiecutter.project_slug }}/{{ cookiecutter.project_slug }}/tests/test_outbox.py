@@ -0,0 +1,63 @@
+from unittest import mock
+
+import pytest
+
+from {{cookiecutter.project_slug}}.extensions import db
+from {{cookiecutter.project_slug}}.models import OutboxMessage
+from {{cookiecutter.project_slug}}.outbox import relay_outbox_batch
+from {{cookiecutter.project_slug}}.tasks import compute
+
+
+def enqueue_compute(number: int) -> OutboxMessage:
+    return OutboxMessage.enqueue(
+        compute, kwargs={'random_number': number, 'now_timestamp': '2025-01-01'}
+    )
+
+
+@pytest.fixture
+def celery(app):
+    return app.extensions['celery']
+
+
+class TestOutboxRelay:
+    def test_relay_publishes_the_oldest_messages_first(self, db_session, celery):
+        for number in range(3):
+            enqueue_compute(number)
+        db.session.commit()
+
+        with mock.patch.object(compute, 'apply_async') as apply_async:
+            assert relay_outbox_batch(celery, batch_size=2) == 2
+            assert relay_outbox_batch(celery, batch_size=2) == 1
+            assert relay_outbox_batch(celery, batch_size=2) == 0
+
+        numbers = [call.args[1]['random_number'] for call in apply_async.call_args_list]
+        assert numbers == [0, 1, 2]
+        assert OutboxMessage.query.count() == 0
+
+    def test_relay_keeps_the_outbox_task_id(self, db_session, celery):
+        message = enqueue_compute(1)
+        db.session.commit()
+        task_id = str(message.task_id)
+
+        with mock.patch.object(compute, 'apply_async') as apply_async:
+            relay_outbox_batch(celery, batch_size=10)
+
+        assert apply_async.call_args.kwargs['task_id'] == task_id
+
+    def test_messages_stay_on_the_outbox_when_publishing_fails(
+        self, db_session, celery
+    ):
+        enqueue_compute(1)
+        db.session.commit()
+
+        with mock.patch.object(compute, 'apply_async', side_effect=OSError):
+            with pytest.raises(OSError):
+                relay_outbox_batch(celery, batch_size=10)
+
+        assert OutboxMessage.query.count() == 1
+
+    def test_uncommitted_messages_are_not_relayed(self, db_session, celery):
+        enqueue_compute(1)
+        db.session.rollback()
+
+        assert relay_outbox_batch(celery, batch_size=10) == 0
@@ -0,0 +1,55 @@
+import gc
+
+import pytest
+from celery.signals import worker_before_create_process, worker_init
+
+from {{cookiecutter.project_slug}} import tasks
+from {{cookiecutter.project_slug}}.broker import reset_broker_connections
+from {{cookiecutter.project_slug}}.memory import get_memory_usage
+from {{cookiecutter.project_slug}}.models import User
+from {{cookiecutter.project_slug}}.preload import preload_shared_state
+
+
+@pytest.fixture
+def unfreeze():
+    yield
+    gc.unfreeze()
+
+
+def test_objects_are_frozen_before_forking(unfreeze):
+    garbage = []
+    garbage.append(garbage)  # a reference cycle, only the collector frees it
+    del garbage
+
+    worker_init.send(sender=None)
+
+    assert gc.get_freeze_count() > 0
+    assert gc.collect() == 0  # collected before freezing, not frozen
+
+
+def test_objects_are_not_frozen_before_each_fork(unfreeze):
+    worker_before_create_process.send(sender=None)
+
+    assert gc.get_freeze_count() == 0
+
+
+def test_preload_shared_state():
+    preload_shared_state()
+
+    assert User.__mapper__.configured
+    assert tasks.numpy is not tasks.NOT_IMPORTED
+
+
+def test_memory_usage():
+    usage = get_memory_usage()
+    assert 0 < usage['uss_bytes'] <= usage['pss_bytes'] <= usage['rss_bytes']
+    assert get_memory_usage(pid=2**22 + 1) is None
+
+
+def test_broker_connections_are_reset_after_forking(app):
+    celery = app.extensions['celery']
+    pool = celery.pool
+
+    reset_broker_connections(celery)
+
+    assert celery.pool is not pool
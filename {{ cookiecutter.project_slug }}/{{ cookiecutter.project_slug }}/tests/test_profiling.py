@@ -0,0 +1,134 @@
+import os
+import pstats
+
+import pytest
+from celery.signals import before_task_publish
+
+from {{cookiecutter.project_slug}} import profiling, settings
+from {{cookiecutter.project_slug}}.profiling import (
+    PROFILE_HEADER,
+    PROFILE_ID_HEADER,
+    TASK_PROFILE_HEADER,
+    Profile,
+    list_profiles,
+)
+from {{cookiecutter.project_slug}}.tasks import generate_random_string
+
+TOKEN = 'some-profiling-token'
+
+
+@pytest.fixture(autouse=True)
+def profiling_settings(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'PROFILING_TOKEN', TOKEN)
+    monkeypatch.setattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+    monkeypatch.setattr(settings, 'PROFILES_DIR', str(tmp_path))
+
+
+def test_requests_are_not_profiled_by_default(test_client):
+    response = test_client.get('/welcome/picard')
+    assert PROFILE_ID_HEADER not in response.headers
+    assert list_profiles() == []
+
+
+def test_requests_with_the_token_are_profiled(test_client):
+    response = test_client.get('/welcome/picard', headers={PROFILE_HEADER: TOKEN})
+
+    profile_name = response.headers[PROFILE_ID_HEADER]
+    assert profile_name.endswith('-request-GET_welcome_person.prof')
+    assert [profile['name'] for profile in list_profiles()] == [profile_name]
+
+    stats = pstats.Stats(os.path.join(settings.PROFILES_DIR, profile_name))
+    assert any(function[2] == 'welcome' for function in stats.stats)
+
+
+@pytest.mark.parametrize('token', ['wrong-token', ''])
+def test_requests_with_an_invalid_token_are_not_profiled(test_client, token):
+    response = test_client.get('/welcome/picard', headers={PROFILE_HEADER: token})
+    assert PROFILE_ID_HEADER not in response.headers
+
+
+def test_requests_with_a_non_ascii_token_are_not_profiled(test_client):
+    response = test_client.get('/welcome/picard', headers={PROFILE_HEADER: 'café'})
+    assert response.status_code == 200
+    assert PROFILE_ID_HEADER not in response.headers
+
+
+def test_a_single_request_is_profiled_at_a_time(test_client):
+    # as if another thread was profiling its request
+    with profiling._profiler_lock:
+        response = test_client.get('/welcome/picard', headers={PROFILE_HEADER: TOKEN})
+    assert response.status_code == 200
+    assert PROFILE_ID_HEADER not in response.headers
+
+    response = test_client.get('/welcome/picard', headers={PROFILE_HEADER: TOKEN})
+    assert PROFILE_ID_HEADER in response.headers
+
+
+def test_the_header_is_ignored_without_a_token(test_client, monkeypatch):
+    monkeypatch.setattr(settings, 'PROFILING_TOKEN', '')
+    response = test_client.get('/welcome/picard', headers={PROFILE_HEADER: ''})
+    assert PROFILE_ID_HEADER not in response.headers
+
+
+def test_requests_are_sampled(test_client, monkeypatch):
+    monkeypatch.setattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+    response = test_client.get('/welcome/picard')
+    assert PROFILE_ID_HEADER in response.headers
+
+
+def test_only_the_last_profiles_are_kept(test_client, monkeypatch):
+    monkeypatch.setattr(settings, 'PROFILES_KEEP', 2)
+    names = [
+        test_client.get(
+            '/welcome/picard', headers={PROFILE_HEADER: TOKEN}
+        ).headers[PROFILE_ID_HEADER]
+        for _ in range(3)
+    ]
+    assert [profile['name'] for profile in list_profiles()] == names[:0:-1]
+
+
+def test_tasks_published_by_profiled_requests_are_profiled():
+    headers = {}
+    with Profile('request', 'test'):
+        before_task_publish.send(sender='some.task', headers=headers, body=None)
+    assert headers[TASK_PROFILE_HEADER] is True
+
+
+def test_tasks_with_the_profile_header_are_profiled(app):
+    generate_random_string.apply(headers={TASK_PROFILE_HEADER: True})
+    [profile] = list_profiles()
+    assert profile['name'].endswith(f'-task-{generate_random_string.name}.prof')
+
+
+def test_list_and_download_profiles(test_client):
+    profile_name = test_client.get(
+        '/welcome/picard', headers={PROFILE_HEADER: TOKEN}
+    ).headers[PROFILE_ID_HEADER]
+
+    response = test_client.get('/profiles', headers={PROFILE_HEADER: TOKEN})
+    assert response.status_code == 200
+    assert [profile['name'] for profile in response.json['profiles']] == [profile_name]
+
+    response = test_client.get(
+        f'/profiles/{profile_name}', headers={PROFILE_HEADER: TOKEN}
+    )
+    assert response.status_code == 200
+    with open(os.path.join(settings.PROFILES_DIR, profile_name), 'rb') as file:
+        assert response.data == file.read()
+
+    response = test_client.get(
+        f'/profiles/{profile_name}?format=text', headers={PROFILE_HEADER: TOKEN}
+    )
+    assert 'function calls' in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('url', ['/profiles', '/profiles/some.prof'])
+def test_profiles_require_the_token(test_client, url):
+    assert test_client.get(url).status_code == 403
+    assert test_client.get(url, headers={PROFILE_HEADER: 'wrong'}).status_code == 403
+
+
+@pytest.mark.parametrize('name', ['missing.prof', '..', 'profile.txt'])
+def test_unknown_profiles(test_client, name):
+    response = test_client.get(f'/profiles/{name}', headers={PROFILE_HEADER: TOKEN})
+    assert response.status_code == 404
@@ -0,0 +1,91 @@
+import logging
+
+from celery.signals import task_postrun, task_prerun
+from sqlalchemy import select
+
+from {{cookiecutter.project_slug}} import queries, settings
+from {{cookiecutter.project_slug}}.extensions import db
+from {{cookiecutter.project_slug}}.models import User
+from {{cookiecutter.project_slug}}.queries import (
+    QUERY_COUNT_HEADER,
+    get_query_tracker,
+    query_stats,
+)
+from {{cookiecutter.project_slug}}.tasks import export_users
+
+
+def begin_transaction():
+    # so that the SAVEPOINT of the db_session fixture is not counted
+    db.session.connection()
+
+
+def find_users(count: int):
+    # one query per user, the N+1 pattern
+    for index in range(count):
+        db.session.execute(
+            select(User).where(User.username == f'user-{index}')
+        ).all()
+
+
+def test_requests_count_their_queries(app, db_session, caplog, monkeypatch):
+    monkeypatch.setattr(settings, 'QUERIES_REPEATED_THRESHOLD', 3)
+
+    def repeated_queries():
+        find_users(3)
+        return 'ok'
+
+    app.add_url_rule('/repeated-queries', view_func=repeated_queries)
+    begin_transaction()
+
+    with caplog.at_level(logging.WARNING, logger=queries.__name__):
+        response = app.test_client().get('/repeated-queries')
+
+    assert response.headers[QUERY_COUNT_HEADER] == '3'
+    assert 'Possible N+1 queries on GET /repeated-queries' in caplog.text
+    assert 'statement run 3 times: SELECT "user".uuid' in caplog.text
+    assert get_query_tracker() is None
+
+
+def test_distinct_queries_are_not_flagged(app, db_session, caplog, monkeypatch):
+    monkeypatch.setattr(settings, 'QUERIES_REPEATED_THRESHOLD', 2)
+
+    with caplog.at_level(logging.WARNING, logger=queries.__name__):
+        app.test_client().get('/welcome/picard')
+    assert 'N+1' not in caplog.text
+
+
+def test_slow_queries_are_logged_with_their_sql(app, db_session, caplog, monkeypatch):
+    monkeypatch.setattr(query_stats, 'slow_ms', 0)
+    monkeypatch.setattr(settings, 'QUERIES_SLOW_LOG_SAMPLE_RATE', 1.0)
+    begin_transaction()
+    query_stats.reset()
+
+    with caplog.at_level(logging.WARNING, logger=queries.__name__):
+        db.session.execute(select(User).where(User.username == 'picard')).all()
+
+    assert 'Slow query' in caplog.text
+    assert """WHERE "user".username = 'picard'""" in caplog.text
+    assert query_stats.snapshot()['slow'] == 1
+
+
+def test_slow_queries_log_is_sampled(app, db_session, caplog, monkeypatch):
+    monkeypatch.setattr(query_stats, 'slow_ms', 0)
+    monkeypatch.setattr(settings, 'QUERIES_SLOW_LOG_SAMPLE_RATE', 0)
+
+    with caplog.at_level(logging.WARNING, logger=queries.__name__):
+        find_users(1)
+    assert 'Slow query' not in caplog.text
+
+
+def test_tasks_count_their_queries(app, db_session, caplog, monkeypatch):
+    monkeypatch.setattr(settings, 'QUERIES_REPEATED_THRESHOLD', 2)
+
+    begin_transaction()
+    with caplog.at_level(logging.WARNING, logger=queries.__name__):
+        task_prerun.send(sender=export_users, task_id='some-task', task=export_users)
+        find_users(2)
+        assert get_query_tracker().count == 2
+        task_postrun.send(sender=export_users, task_id='some-task', task=export_users)
+
+    assert f'Possible N+1 queries on task {export_users.name}' in caplog.text
+    assert get_query_tracker() is None
@@ -0,0 +1,105 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+from billiard.pool import EX_OK, EX_RECYCLE
+from celery.signals import worker_process_shutdown
+from kombu.utils.imports import symbol_by_name
+
+from {{cookiecutter.project_slug}} import recycling, settings
+from {{cookiecutter.project_slug}}.metrics import get_registry
+from {{cookiecutter.project_slug}}.recycling import JitteredAsynPool, TaskPool, check_web_worker
+
+MiB = 1024**2
+
+
+def get_recycles(process: str, reason: str) -> float:
+    return get_registry().get_sample_value(
+        'worker_recycles_total', {'process': process, 'reason': reason}
+    ) or 0
+
+
+def make_worker(nr: int, max_requests: int = sys.maxsize):
+    return SimpleNamespace(alive=True, nr=nr, max_requests=max_requests)
+
+
+@pytest.fixture(autouse=True)
+def recycling_settings(monkeypatch):
+    monkeypatch.setattr(settings, 'WEB_MAX_RSS_MB', 100)
+    monkeypatch.setattr(settings, 'WEB_RSS_CHECK_EVERY', 10)
+    monkeypatch.setattr(settings, 'CELERY_MAX_RSS_MB', 100)
+
+
+class TestWebWorkers:
+    def test_recycled_above_the_rss_ceiling(self, monkeypatch):
+        monkeypatch.setattr(recycling, 'get_rss_bytes', lambda: 101 * MiB)
+        before = get_recycles('web', 'memory')
+
+        worker = make_worker(nr=10)
+        check_web_worker(worker)
+
+        assert worker.alive is False
+        assert get_recycles('web', 'memory') == before + 1
+
+    def test_rss_is_only_checked_every_some_requests(self, monkeypatch):
+        monkeypatch.setattr(recycling, 'get_rss_bytes', lambda: 101 * MiB)
+        worker = make_worker(nr=11)
+        check_web_worker(worker)
+        assert worker.alive is True
+
+    def test_not_recycled_below_the_rss_ceiling(self, monkeypatch):
+        monkeypatch.setattr(recycling, 'get_rss_bytes', lambda: 99 * MiB)
+        worker = make_worker(nr=10)
+        check_web_worker(worker)
+        assert worker.alive is True
+
+    def test_the_rss_ceiling_can_be_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, 'WEB_MAX_RSS_MB', 0)
+        monkeypatch.setattr(recycling, 'get_rss_bytes', lambda: 101 * MiB)
+        worker = make_worker(nr=10)
+        check_web_worker(worker)
+        assert worker.alive is True
+
+    def test_recycles_after_max_requests_are_recorded(self):
+        before = get_recycles('web', 'requests')
+        # gunicorn stops the worker before the hook is called
+        worker = make_worker(nr=1050, max_requests=1050)
+        worker.alive = False
+
+        check_web_worker(worker)
+        assert get_recycles('web', 'requests') == before + 1
+
+
+class TestCeleryPool:
+    def test_each_pool_process_gets_a_jittered_max_tasks(self, monkeypatch):
+        monkeypatch.setattr(settings, 'CELERY_MAX_TASKS_PER_CHILD_JITTER', 100)
+        pool = JitteredAsynPool.__new__(JitteredAsynPool)
+        pool._maxtasksperchild = 1000
+
+        max_tasks = {pool._maxtasksperchild for _ in range(50)}
+        assert len(max_tasks) > 1
+        assert all(1000 <= value <= 1100 for value in max_tasks)
+
+    def test_no_max_tasks(self):
+        pool = JitteredAsynPool.__new__(JitteredAsynPool)
+        pool._maxtasksperchild = None
+        assert pool._maxtasksperchild is None
+
+    def test_is_the_worker_pool(self, app):
+        celery = app.extensions['celery']
+        assert symbol_by_name(celery.conf.worker_pool) is TaskPool
+        assert celery.conf.worker_max_memory_per_child == (
+            settings.CELERY_MAX_RSS_MB * 1024
+        )
+
+    @pytest.mark.parametrize(
+        'peak_rss_kb, reason', [(101 * 1024, 'memory'), (99 * 1024, 'tasks')]
+    )
+    def test_recycles_are_recorded(self, monkeypatch, peak_rss_kb, reason):
+        monkeypatch.setattr(recycling, 'mem_rss', lambda: peak_rss_kb)
+        before = get_recycles('celery', reason)
+
+        worker_process_shutdown.send(sender=None, pid=1, exitcode=EX_RECYCLE)
+        worker_process_shutdown.send(sender=None, pid=1, exitcode=EX_OK)
+
+        assert get_recycles('celery', reason) == before + 1
@@ -0,0 +1,42 @@
+from datetime import datetime
+from unittest import mock
+
+from kombu import serialization
+
+from {{cookiecutter.project_slug}} import serializers
+from {{cookiecutter.project_slug}}.serializers import SERIALIZER_NAME, dumps, loads
+
+BODY = [[], {'random_number': 1234, 'now_timestamp': '2025-01-01T00:00:00'}, {}]
+
+
+def test_small_payload_is_not_compressed():
+    payload = dumps(BODY)
+    assert payload[:1] == serializers.MSGPACK
+    assert loads(payload) == BODY
+
+
+def test_big_payload_is_compressed():
+    body = [[[number, '2025-01-01T00:00:00'] for number in range(1000)], {}, {}]
+    payload = dumps(body)
+    assert payload[:1] == serializers.COMPRESSED[serializers.MSGPACK]
+    assert loads(payload) == body
+
+
+def test_orjson_is_the_fallback_without_msgpack():
+    with mock.patch.object(serializers, 'msgpack', None):
+        payload = dumps(BODY)
+    assert payload[:1] == serializers.ORJSON
+    assert loads(payload) == BODY
+
+
+def test_datetimes_are_encoded_as_iso_strings():
+    now = datetime(2025, 1, 1)
+    assert loads(dumps({'now': now})) == {'now': '2025-01-01T00:00:00'}
+
+
+def test_serializer_is_registered_on_kombu(app):
+    content_type, content_encoding, data = serialization.dumps(
+        BODY, serializer=SERIALIZER_NAME
+    )
+    assert content_type == serializers.CONTENT_TYPE
+    assert serialization.loads(data, content_type, content_encoding) == BODY
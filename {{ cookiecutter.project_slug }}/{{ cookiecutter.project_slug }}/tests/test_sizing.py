@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+from {{cookiecutter.project_slug}}.sizing import (
+    MAX_BACKLOG,
+    get_cpu_limit,
+    get_cpu_quota,
+    get_memory_limit,
+    get_web_sizing,
+    size_web_workers,
+)
+
+GIB = 1024 ** 3
+
+
+def write_cgroup(root, files: dict):
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f'{content}\n')
+    return str(root)
+
+
+class TestCgroupLimits:
+    def test_cgroup_v2(self, tmp_path):
+        root = write_cgroup(tmp_path, {'cpu.max': '150000 100000', 'memory.max': GIB})
+        assert get_cpu_quota(root) == 1.5
+        assert get_memory_limit(root) == GIB
+
+    def test_cgroup_v2_without_limits(self, tmp_path):
+        root = write_cgroup(tmp_path, {'cpu.max': 'max 100000', 'memory.max': 'max'})
+        assert get_cpu_quota(root) is None
+        assert get_memory_limit(root) is None
+
+    def test_cgroup_v1(self, tmp_path):
+        root = write_cgroup(
+            tmp_path,
+            {
+                'cpu/cpu.cfs_quota_us': 200000,
+                'cpu/cpu.cfs_period_us': 100000,
+                'memory/memory.limit_in_bytes': 2 * GIB,
+            },
+        )
+        assert get_cpu_quota(root) == 2
+        assert get_memory_limit(root) == 2 * GIB
+
+    def test_cgroup_v1_without_limits(self, tmp_path):
+        root = write_cgroup(
+            tmp_path,
+            {
+                'cpu/cpu.cfs_quota_us': -1,
+                'cpu/cpu.cfs_period_us': 100000,
+                'memory/memory.limit_in_bytes': 2 ** 63 - 4096,
+            },
+        )
+        assert get_cpu_quota(root) is None
+        assert get_memory_limit(root) is None
+
+    def test_no_cgroup(self, tmp_path):
+        assert get_cpu_quota(str(tmp_path)) is None
+        assert get_memory_limit(str(tmp_path)) is None
+        assert get_cpu_limit(str(tmp_path)) == len(os.sched_getaffinity(0))
+
+    def test_the_quota_is_below_the_host_cpus(self, tmp_path):
+        root = write_cgroup(tmp_path, {'cpu.max': '50000 100000'})
+        assert get_cpu_limit(root) == 0.5
+
+
+class TestSizeWebWorkers:
+    def test_io_bound(self):
+        sizing = size_web_workers(cpus=2, memory_limit_bytes=None, profile='io')
+        assert sizing == {'workers': 5, 'threads': 4, 'backlog': 640}
+
+    def test_cpu_bound(self):
+        sizing = size_web_workers(cpus=2, memory_limit_bytes=None, profile='cpu')
+        assert sizing == {'workers': 3, 'threads': 1, 'backlog': 96}
+
+    def test_a_fraction_of_a_cpu(self):
+        assert size_web_workers(cpus=0.5, memory_limit_bytes=None)['workers'] == 3
+
+    def test_the_workers_fit_in_the_memory_limit(self):
+        # one of the 4 workers that fit is left for the master
+        sizing = size_web_workers(
+            cpus=8, memory_limit_bytes=GIB, profile='io', worker_memory_mb=256
+        )
+        assert sizing['workers'] == 3
+
+    def test_there_is_always_a_worker(self):
+        sizing = size_web_workers(cpus=8, memory_limit_bytes=GIB, worker_memory_mb=1024)
+        assert sizing['workers'] == 1
+
+    def test_the_backlog_is_bounded(self):
+        sizing = size_web_workers(cpus=64, memory_limit_bytes=None, profile='io')
+        assert sizing['backlog'] == MAX_BACKLOG
+
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            size_web_workers(cpus=2, memory_limit_bytes=None, profile='gpu')
+
+
+def make_config(values: dict):
+    # decouple's config, with values for the settings that are set
+    def config(name, default, cast):
+        return cast(values[name]) if name in values else default
+
+    return config
+
+
+class TestGetWebSizing:
+    def test_sized_from_the_limits(self):
+        config = make_config({'CPU_LIMIT': '2', 'MEMORY_LIMIT_MB': '1024'})
+        sizing = get_web_sizing(config)
+        assert sizing == {
+            'cpu_limit': 2.0,
+            'memory_limit_mb': 1024,
+            'profile': 'io',
+            'worker_memory_mb': 256,
+            'workers': 3,
+            'threads': 4,
+            'backlog': 384,
+        }
+
+    def test_each_value_can_be_set(self):
+        config = make_config({'CPU_LIMIT': '2', 'WEB_WORKERS': '7', 'WEB_BACKLOG': '100'})
+        sizing = get_web_sizing(config)
+        assert (sizing['workers'], sizing['threads'], sizing['backlog']) == (7, 4, 100)
@@ -0,0 +1,202 @@
+import fcntl
+import os
+import threading
+import time
+
+import pytest
+from kombu.exceptions import OperationalError
+
+from {{cookiecutter.project_slug}}.exceptions import TaskSpoolFull
+from {{cookiecutter.project_slug}}.spool import SpoolingPublisher, TaskSpool
+
+
+class PausableBroker:
+    """
+    Stand-in for the broker: while paused, publishing fails the way
+    kombu does when the broker is down or the publish times out.
+    """
+
+    def __init__(self):
+        self.paused = False
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def send(self, message: dict):
+        if self.paused:
+            raise OperationalError('broker is paused')
+        with self._lock:
+            self.messages.append(message)
+
+    @property
+    def received_numbers(self):
+        return [message['kwargs']['random_number'] for message in self.messages]
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met in time')
+        time.sleep(0.01)
+
+
+def create_message(number: int) -> dict:
+    return {
+        'id': str(number),
+        'name': 'compute',
+        'args': [],
+        'kwargs': {'random_number': number},
+        'options': {},
+    }
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return os.path.join(tmp_path, 'spool-test.bin')
+
+
+@pytest.fixture
+def broker():
+    return PausableBroker()
+
+
+@pytest.fixture
+def publisher(spool_path, broker):
+    publisher = SpoolingPublisher(
+        TaskSpool(spool_path, size=64 * 1024, fsync=False),
+        send=broker.send,
+        replay_interval=0.01,
+    )
+    yield publisher
+    publisher.stop()
+
+
+class TestTaskSpool:
+    def test_messages_are_read_in_order(self, spool_path):
+        spool = TaskSpool(spool_path, size=64 * 1024)
+        for number in range(3):
+            spool.append(create_message(number))
+
+        numbers = []
+        while spool.pending:
+            numbers.append(spool.peek()['kwargs']['random_number'])
+            spool.pop()
+        assert numbers == [0, 1, 2]
+        assert spool.peek() is None
+
+    def test_messages_survive_reopening_the_spool(self, spool_path):
+        spool = TaskSpool(spool_path, size=64 * 1024)
+        spool.append(create_message(1))
+        spool.append(create_message(2))
+        spool.pop()
+        spool.close()
+
+        reopened_spool = TaskSpool(spool_path, size=64 * 1024)
+        assert reopened_spool.peek() == create_message(2)
+
+    def test_spool_is_locked_by_its_owner(self, spool_path):
+        _ = TaskSpool(spool_path, size=64 * 1024)
+        with pytest.raises(BlockingIOError):
+            TaskSpool(spool_path, size=64 * 1024)
+
+    @pytest.mark.parametrize('content', [b'', b'not a spool' * 10])
+    def test_invalid_spool_is_closed_and_unlocked(self, spool_path, content):
+        with open(spool_path, 'wb') as spool_file:
+            spool_file.write(content)
+
+        with pytest.raises(ValueError):
+            TaskSpool(spool_path, size=0)
+        # not locked anymore
+        with open(spool_path, 'rb') as spool_file:
+            fcntl.flock(spool_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_full_spool_is_compacted_then_rejects_messages(self, spool_path):
+        spool = TaskSpool(spool_path, size=1024, fsync=False)
+        while True:
+            try:
+                spool.append(create_message(1))
+            except TaskSpoolFull:
+                break
+
+        # room freed at the beginning of the file is reused
+        spool.pop()
+        spool.append(create_message(2))
+        with pytest.raises(TaskSpoolFull):
+            spool.append(create_message(3))
+
+
+class TestSpoolingPublisher:
+    def test_publish_goes_straight_to_the_broker_when_it_is_up(
+        self, publisher, broker
+    ):
+        publisher.publish('compute', kwargs={'random_number': 1})
+        assert broker.received_numbers == [1]
+        assert not publisher.spool.pending
+
+    def test_publish_is_spooled_and_replayed_in_order(self, publisher, broker):
+        broker.paused = True
+        for number in range(5):
+            publisher.publish('compute', kwargs={'random_number': number})
+        assert broker.messages == []
+        assert publisher.spool.pending
+
+        broker.paused = False
+        wait_for(lambda: not publisher.spool.pending)
+        assert broker.received_numbers == [0, 1, 2, 3, 4]
+
+    def test_publish_keeps_order_while_spool_is_being_drained(
+        self, publisher, broker
+    ):
+        broker.paused = True
+        publisher.publish('compute', kwargs={'random_number': 0})
+
+        # the broker is back, but the spooled message must be published first
+        broker.paused = False
+        publisher.publish('compute', kwargs={'random_number': 1})
+
+        wait_for(lambda: len(broker.messages) == 2)
+        assert broker.received_numbers == [0, 1]
+
+    def test_new_messages_wake_up_the_replayer(self, spool_path, broker):
+        # a retry would only come after a long backoff
+        publisher = SpoolingPublisher(
+            TaskSpool(spool_path, size=64 * 1024, fsync=False),
+            send=broker.send,
+            replay_interval=60,
+        )
+        try:
+            broker.paused = True
+            publisher.publish('compute', kwargs={'random_number': 0})
+            time.sleep(0.1)  # the replayer failed, and backs off
+
+            broker.paused = False
+            publisher.publish('compute', kwargs={'random_number': 1})
+            wait_for(lambda: len(broker.messages) == 2)
+            assert broker.received_numbers == [0, 1]
+        finally:
+            publisher.stop()
+
+    def test_orphan_spool_is_adopted_and_removed(self, publisher, broker, tmp_path):
+        orphan_path = os.path.join(tmp_path, 'spool-12345.bin')
+        orphan = TaskSpool(orphan_path, size=64 * 1024)
+        orphan.append(create_message(7))
+        orphan.close()  # its owner process is gone
+
+        publisher.replayer.wake_up.set()
+        wait_for(lambda: not os.path.exists(orphan_path))
+        assert broker.received_numbers == [7]
+
+    @pytest.mark.parametrize('content', [b'', b'not a spool' * 10])
+    def test_invalid_orphan_spool_is_removed(self, publisher, broker, tmp_path, content):
+        invalid_path = os.path.join(tmp_path, 'spool-12345.bin')
+        with open(invalid_path, 'wb') as spool_file:
+            spool_file.write(content)
+        orphan_path = os.path.join(tmp_path, 'spool-12346.bin')
+        orphan = TaskSpool(orphan_path, size=64 * 1024)
+        orphan.append(create_message(7))
+        orphan.close()
+
+        publisher.replayer.wake_up.set()
+        wait_for(lambda: not os.path.exists(invalid_path))
+        wait_for(lambda: not os.path.exists(orphan_path))
+        assert broker.received_numbers == [7]
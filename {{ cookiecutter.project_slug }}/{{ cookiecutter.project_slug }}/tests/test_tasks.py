@@ -0,0 +1,35 @@
+from unittest import mock
+
+from {{cookiecutter.project_slug}} import tasks
+from {{cookiecutter.project_slug}}.tasks import (
+    INT64_HALF_MAX,
+    INT64_HALF_MIN,
+    compute_batched,
+    double_numbers,
+)
+
+
+def test_double_numbers():
+    assert double_numbers([1, 2, 3]) == [2, 4, 6]
+
+
+def test_double_numbers_beyond_int64():
+    assert double_numbers([INT64_HALF_MAX, INT64_HALF_MIN]) == [
+        2 * INT64_HALF_MAX,
+        2 * INT64_HALF_MIN,
+    ]
+    assert double_numbers([1, INT64_HALF_MAX + 1]) == [2, 2 ** 63]
+    assert double_numbers([INT64_HALF_MIN - 1]) == [-(2 ** 63) - 2]
+    assert double_numbers([2 ** 64]) == [2 ** 65]
+
+
+def test_double_numbers_without_numpy():
+    with mock.patch.object(tasks, 'numpy', None):
+        assert double_numbers([1, 2, 3]) == [2, 4, 6]
+
+
+def test_compute_batched_runs_as_a_batch(app):
+    result = compute_batched.apply_async(
+        kwargs={'random_number': 21, 'now_timestamp': '2025-01-01T00:00:00'}
+    )
+    assert result.successful()
@@ -0,0 +1,182 @@
+import json
+import logging
+
+import pytest
+from celery.signals import after_task_publish, before_task_publish
+from kombu.exceptions import OperationalError
+from sqlalchemy import text
+
+from {{cookiecutter.project_slug}}.extensions import db
+from {{cookiecutter.project_slug}}.models import OutboxMessage
+from {{cookiecutter.project_slug}}.spool import SpoolingPublisher, TaskSpool
+from {{cookiecutter.project_slug}}.tasks import generate_random_string, notify_user_registered
+from {{cookiecutter.project_slug}}.tracing import (
+    TRACE_ID_HEADER,
+    TRACEPARENT_HEADER,
+    FileSpanExporter,
+    get_current_span,
+    parse_traceparent,
+    span_processor,
+    start_span,
+    to_otlp,
+)
+
+TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+PARENT_ID = '00f067aa0ba902b7'
+TRACEPARENT = f'00-{TRACE_ID}-{PARENT_ID}-01'
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+@pytest.fixture
+def exported_spans(monkeypatch):
+    exporter = ListExporter()
+    span_processor.flush()  # spans of previous tests
+    monkeypatch.setattr(span_processor, 'exporter', exporter)
+
+    def get_spans():
+        span_processor.flush()
+        return exporter.spans
+
+    return get_spans
+
+
+@pytest.mark.parametrize(
+    'value, expected',
+    [
+        (TRACEPARENT, (TRACE_ID, PARENT_ID)),
+        (None, None),
+        ('', None),
+        (f'01-{TRACE_ID}-{PARENT_ID}-01', None),
+        (f'00-{TRACE_ID[:-1]}-{PARENT_ID}-01', None),
+        (f'00-{TRACE_ID}-{"x" * 16}-01', None),
+    ],
+)
+def test_parse_traceparent(value, expected):
+    assert parse_traceparent(value) == expected
+
+
+def test_requests_continue_the_incoming_trace(test_client, exported_spans):
+    response = test_client.get(
+        '/welcome/picard', headers={TRACEPARENT_HEADER: TRACEPARENT}
+    )
+
+    assert response.headers[TRACE_ID_HEADER] == TRACE_ID
+    [span] = [span for span in exported_spans() if span['kind'] == 'server']
+    assert span['name'] == 'GET /welcome/<person>'
+    assert span['trace_id'] == TRACE_ID
+    assert span['parent_id'] == PARENT_ID
+    assert span['attributes']['http.status_code'] == 200
+    assert get_current_span() is None
+
+
+def test_requests_without_a_trace_start_one(test_client):
+    first = test_client.get('/welcome/picard').headers[TRACE_ID_HEADER]
+    second = test_client.get('/welcome/picard').headers[TRACE_ID_HEADER]
+    assert len(first) == 32
+    assert first != second
+
+
+def test_published_tasks_carry_the_trace(exported_spans):
+    headers = {}
+    with start_span('request') as request_span:
+        before_task_publish.send(sender='some.task', headers=headers, body=None)
+        after_task_publish.send(sender='some.task', body=None, exchange='')
+
+    [publish_span] = [span for span in exported_spans() if span['kind'] == 'producer']
+    assert publish_span['trace_id'] == request_span.trace_id
+    assert publish_span['parent_id'] == request_span.span_id
+    assert headers[TRACEPARENT_HEADER] == (
+        f'00-{request_span.trace_id}-{publish_span["span_id"]}-01'
+    )
+
+
+def test_tasks_continue_the_trace_of_the_message(app, exported_spans):
+    generate_random_string.apply(headers={TRACEPARENT_HEADER: TRACEPARENT})
+
+    [span] = [span for span in exported_spans() if span['kind'] == 'consumer']
+    assert span['name'] == f'task {generate_random_string.name}'
+    assert span['trace_id'] == TRACE_ID
+    assert span['parent_id'] == PARENT_ID
+
+
+def test_outbox_messages_carry_the_trace(app, db_session):
+    with start_span('request') as span:
+        message = OutboxMessage.enqueue(
+            notify_user_registered, kwargs={'user_uuid': 'some-uuid'}
+        )
+    assert message.options['headers'] == {TRACEPARENT_HEADER: span.traceparent}
+
+
+def test_spooled_messages_carry_the_trace(tmp_path):
+    def send(message):
+        raise OperationalError('broker is down')
+
+    spool = TaskSpool(str(tmp_path / 'spool-test.bin'), size=64 * 1024, fsync=False)
+    publisher = SpoolingPublisher(spool, send=send, replay_interval=60)
+    try:
+        with start_span('request') as span:
+            publisher.publish('some.task')
+        assert spool.peek()['options']['headers'] == {TRACEPARENT_HEADER: span.traceparent}
+    finally:
+        publisher.stop()
+
+
+def test_queries_are_child_spans(app, db_session, exported_spans):
+    with start_span('request') as span:
+        db.session.execute(text('SELECT 1')).all()
+
+    query_spans = [span for span in exported_spans() if span['name'] == 'db.query']
+    assert query_spans[-1]['parent_id'] == span.span_id
+    assert query_spans[-1]['attributes']['db.statement'] == 'SELECT 1'
+
+
+def test_log_records_have_the_trace_ids(caplog):
+    logger = logging.getLogger(__name__)
+    with caplog.at_level(logging.INFO):
+        with start_span('request') as span:
+            logger.info('traced')
+        logger.info('not traced')
+
+    traced, not_traced = caplog.records
+    assert (traced.trace_id, traced.span_id) == (span.trace_id, span.span_id)
+    assert not_traced.trace_id == '-'
+
+
+def test_failed_spans_record_the_error(exported_spans):
+    with pytest.raises(ValueError):
+        with start_span('failing'):
+            raise ValueError('boom')
+
+    [span] = exported_spans()
+    assert span['error'] == "ValueError('boom')"
+
+
+def test_file_exporter_writes_ndjson(tmp_path, exported_spans):
+    with start_span('request'):
+        pass
+    path = tmp_path / 'spans.ndjson'
+    FileSpanExporter(str(path)).export(exported_spans())
+
+    [line] = path.read_text().splitlines()
+    assert json.loads(line)['name'] == 'request'
+
+
+def test_otlp_format(exported_spans):
+    with start_span('request', kind='server', **{'http.status_code': 200}):
+        pass
+
+    [resource_spans] = to_otlp(exported_spans())['resourceSpans']
+    [span] = resource_spans['scopeSpans'][0]['spans']
+    assert span['kind'] == 2
+    assert span['attributes'] == [
+        {'key': 'http.status_code', 'value': {'intValue': '200'}}
+    ]
+    assert int(span['endTimeUnixNano']) >= int(span['startTimeUnixNano'])
+    assert 'parentSpanId' not in span
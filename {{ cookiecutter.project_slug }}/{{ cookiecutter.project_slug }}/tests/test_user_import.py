@@ -0,0 +1,163 @@
+import io
+
+import pytest
+
+from {{cookiecutter.project_slug}}.exceptions import PasswordHashingUnavailable
+from {{cookiecutter.project_slug}}.extensions import password_hasher
+from {{cookiecutter.project_slug}}.models import User
+from {{cookiecutter.project_slug}}.user_import import import_users, read_rows
+from {{cookiecutter.project_slug}}.tests.utils import create_multi_users
+
+CSV_USERS = """username,email,password
+worf,worf@startrek.com,12345678
+data,data@startrek.com,12345678
+"""
+
+
+def import_csv(content: str, **kwargs):
+    return import_users(read_rows(io.StringIO(content), 'csv'), **kwargs)
+
+
+class TestReadRows:
+    def test_read_csv_rows_with_line_numbers(self):
+        rows = list(read_rows(io.StringIO(CSV_USERS), 'csv'))
+        assert [line for line, _, _ in rows] == [2, 3]
+        assert rows[0][1]['username'] == 'worf'
+
+    def test_read_ndjson_rows_reports_invalid_lines(self):
+        content = '{"username": "worf"}\n\nnot json\n[1, 2]\n'
+        rows = list(read_rows(io.StringIO(content), 'ndjson'))
+        assert rows == [
+            (1, {'username': 'worf'}, None),
+            (3, None, 'invalid json'),
+            (4, None, 'expected a json object'),
+        ]
+
+
+class TestImportUsers:
+    def test_import_creates_users_with_hashed_passwords(self, db_session):
+        report = import_csv(CSV_USERS)
+        assert report.as_dict() == {
+            'created': 2,
+            'updated': 0,
+            'failed': 0,
+            'errors': [],
+        }
+
+        user = User.get_by(username='worf')
+        assert user.email == 'worf@startrek.com'
+        assert user.check_password('12345678') is True
+
+    def test_import_reports_errors_per_line(self, db_session):
+        create_multi_users()
+        content = (
+            'username,email,password\n'
+            'worf,worf@startrek.com,12345678\n'  # ok
+            'worf,worf2@startrek.com,12345678\n'  # same username as line 2
+            'data,worf@startrek.com,12345678\n'  # same email as line 2
+            'jean_luc_picard,jlp@startrek.com,12345678\n'  # existing user
+            'q,wk@startrek.com,12345678\n'  # email of another user
+            'lwaxana,not-an-email,12345678\n'
+            'tasha,tasha@startrek.com,\n'
+        )
+        report = import_csv(content, batch_size=4)
+
+        assert report.created == 1
+        assert report.failed == 6
+        assert sorted(report.errors, key=lambda error: error['line']) == [
+            {'line': 3, 'error': 'duplicated username on the import'},
+            {'line': 4, 'error': 'duplicated email on the import'},
+            {'line': 5, 'error': 'username already exists'},
+            {'line': 6, 'error': 'email already in use'},
+            {'line': 7, 'error': 'invalid email'},
+            {'line': 8, 'error': 'password is required'},
+        ]
+
+    def test_import_with_update_merges_existing_users(self, db_session):
+        create_multi_users()
+        content = (
+            'username,email,password\n'
+            'jean_luc_picard,picard@startrek.com,make-it-so\n'
+            'worf,worf@startrek.com,12345678\n'
+        )
+        report = import_csv(content, on_conflict='update')
+        assert (report.created, report.updated, report.failed) == (1, 1, 0)
+
+        user = User.get_by(username='jean_luc_picard')
+        assert user.email == 'picard@startrek.com'
+        assert user.check_password('make-it-so') is True
+
+    def test_import_details_only_the_first_errors(self, db_session):
+        content = 'username,email,password\n' + 'worf,,\n' * 5
+        report = import_csv(content, max_errors=2)
+        assert report.failed == 5
+        assert len(report.errors) == 2
+
+
+class TestImportUsersAPI:
+    def test_import_ndjson(self, test_client, auth_headers):
+        content = (
+            '{"username": "worf", "email": "worf@startrek.com", "password": "1234"}\n'
+            '{"username": "worf", "email": "worf2@startrek.com", "password": "1234"}\n'
+        )
+        response = test_client.post(
+            '/users/bulk',
+            data=content,
+            headers={**auth_headers, 'Content-Type': 'application/x-ndjson'},
+        )
+        assert response.status_code == 200
+        assert response.json['created'] == 1
+        assert response.json['errors'] == [
+            {'line': 2, 'error': 'duplicated username on the import'}
+        ]
+
+    def test_import_requires_authentication(self, test_client, db_session):
+        response = test_client.post(
+            '/users/bulk', data=CSV_USERS, headers={'Content-Type': 'text/csv'}
+        )
+        assert response.status_code == 401
+
+    def test_import_can_not_update_existing_users(self, test_client, auth_headers):
+        response = test_client.post(
+            '/users/bulk?on_conflict=update',
+            data='username,email,password\njean_luc_picard,q@startrek.com,1234\n',
+            headers={**auth_headers, 'Content-Type': 'text/csv'},
+        )
+        assert response.status_code == 400
+
+        user = User.get_by(username='jean_luc_picard')
+        assert user.email == 'jlp@startrek.com'
+        assert user.check_password('12345678') is True
+
+    def test_import_with_unknown_content_type(self, test_client, auth_headers):
+        response = test_client.post('/users/bulk', json={}, headers=auth_headers)
+        assert response.status_code == 400
+
+    def test_import_hashing_has_a_fixed_deadline(self, test_client, auth_headers, monkeypatch):
+        timeouts = []
+
+        def generate_password_hashes(passwords, timeout=None):
+            timeouts.append(timeout)
+            raise PasswordHashingUnavailable(503, 'Authentication is temporarily unavailable.')
+
+        monkeypatch.setattr(
+            '{{cookiecutter.project_slug}}.api.USERS_IMPORT_REQUEST_TIMEOUT', 0.5
+        )
+        monkeypatch.setattr(
+            password_hasher, 'generate_password_hashes', generate_password_hashes
+        )
+        response = test_client.post(
+            '/users/bulk', data=CSV_USERS, headers={**auth_headers, 'Content-Type': 'text/csv'}
+        )
+        assert response.status_code == 503
+        assert 0 < timeouts[0] <= 0.5
+
+    def test_import_with_too_many_rows(self, test_client, auth_headers, monkeypatch):
+        monkeypatch.setattr(
+            '{{cookiecutter.project_slug}}.api.USERS_IMPORT_MAX_ROWS', 1
+        )
+        response = test_client.post(
+            '/users/bulk', data=CSV_USERS, headers={**auth_headers, 'Content-Type': 'text/csv'}
+        )
+        assert response.status_code == 413
+        assert User.get_by(username='worf') is None
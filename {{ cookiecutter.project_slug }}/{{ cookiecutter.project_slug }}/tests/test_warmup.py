@@ -0,0 +1,57 @@
+import pytest
+
+from {{cookiecutter.project_slug}} import settings, warmup
+from {{cookiecutter.project_slug}}.warmup import ensure_warmed_up, is_warmed_up, warm_up
+
+
+@pytest.fixture(autouse=True)
+def cold():
+    warmup._warmed_up_pid = None
+    yield
+    warmup._warmed_up_pid = None
+
+
+@pytest.fixture
+def failing_database(monkeypatch):
+    def fail(app):
+        raise ConnectionError('the database is not reachable')
+
+    monkeypatch.setattr(
+        warmup,
+        'STEPS',
+        tuple((name, fail if name == 'database' else step) for name, step in warmup.STEPS),
+    )
+
+
+def test_warm_up(app, db_session):
+    assert not is_warmed_up()
+    assert warm_up(app)
+    assert is_warmed_up()
+
+
+def test_a_failed_warm_up_is_not_warm(app, failing_database):
+    assert not warm_up(app)
+    assert not is_warmed_up()
+
+
+def test_a_failed_warm_up_is_tried_again(app, db_session, failing_database, monkeypatch):
+    assert not ensure_warmed_up(app)
+
+    monkeypatch.undo()
+    assert ensure_warmed_up(app)
+
+
+def test_warm_up_disabled(monkeypatch):
+    monkeypatch.setattr(settings, 'WARMUP_ENABLED', False)
+    assert is_warmed_up()
+
+
+def test_not_ready_until_warmed_up(test_client, db_session, failing_database, monkeypatch):
+    response = test_client.get('/health-check/readiness')
+    assert response.status_code == 503
+    assert response.json['ready'] == 'warming up'
+
+    monkeypatch.undo()
+    response = test_client.get('/health-check/readiness')
+    assert response.status_code == 200
+    assert response.json['ready'] == 'OK'
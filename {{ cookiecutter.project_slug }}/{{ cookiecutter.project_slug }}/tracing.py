@@ -0,0 +1,437 @@
+"""
+Lightweight tracing, from the HTTP request through the broker to the task.
+
+Every request gets a span (continuing the trace of an incoming W3C
+traceparent header, if any). Publishing a task is a child span of the
+current one, and its traceparent goes on the message headers, so that the
+task span (started by the celery ContextTask, see extensions.py) continues
+the same trace on the worker. Database queries are recorded as child
+spans too (see queries.py), and every log record has the trace_id and
+span_id of the current span (add trace_id to LOG_VARS to show it).
+
+The finished spans are queued and exported on a background thread, every
+TRACING_EXPORT_INTERVAL seconds, to a NDJSON file or to an OTLP/HTTP
+(json) collector, see TRACING_EXPORTER. When nothing is exported, only
+the ids are created.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from celery.signals import after_task_publish, before_task_publish
+from flask import g, request
+
+from {{ cookiecutter.project_slug }} import settings
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = 'traceparent'
+TRACE_ID_HEADER = 'X-Trace-Id'
+
+# OTLP span kinds
+KINDS = {'internal': 1, 'server': 2, 'client': 3, 'producer': 4, 'consumer': 5}
+
+
+def new_trace_id() -> str:
+    return f'{random.getrandbits(128):032x}'
+
+
+def new_span_id() -> str:
+    return f'{random.getrandbits(64):016x}'
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    Return the (trace id, parent span id) of a W3C traceparent header
+    (00-<trace id>-<span id>-<flags>), or None when it is not valid.
+    """
+    try:
+        version, trace_id, span_id, _ = value.split('-')
+        int(trace_id, 16), int(span_id, 16)
+    except (AttributeError, ValueError):
+        return None
+    if version != '00' or len(trace_id) != 32 or len(span_id) != 16:
+        return None
+    return trace_id, span_id
+
+
+class Span:
+    __slots__ = (
+        'name',
+        'kind',
+        'trace_id',
+        'span_id',
+        'parent_id',
+        'attributes',
+        'start_time',
+        'duration',
+        'error',
+        '_started_at',
+    )
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = 'internal',
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        attributes: Optional[dict] = None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id or new_trace_id()
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start_time = time.time()
+        self.duration = None
+        self.error = None
+        self._started_at = time.perf_counter()
+
+    @property
+    def traceparent(self) -> str:
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def end(self):
+        self.duration = time.perf_counter() - self._started_at
+        span_processor.add(self)
+
+    def as_dict(self) -> dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'service': settings.TRACING_SERVICE_NAME,
+            'start_time': self.start_time,
+            'duration_ms': round(self.duration * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+def get_current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def create_span(name: str, kind: str = 'internal', traceparent=None, **attributes):
+    """
+    A span continuing the trace of traceparent (a header), if valid, or
+    a child of the current span otherwise.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is None:
+        current = _current_span.get()
+        parent = (current.trace_id, current.span_id) if current else (None, None)
+    return Span(name, kind, *parent, attributes=attributes)
+
+
+@contextmanager
+def start_span(name: str, kind: str = 'internal', traceparent=None, **attributes):
+    span = create_span(name, kind, traceparent, **attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as error:
+        span.error = repr(error)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def record_span(name: str, duration: float, kind: str = 'internal', **attributes):
+    """
+    Add an already finished child span (of duration seconds) to the
+    current span, if there is one and the spans are exported.
+    """
+    current = _current_span.get()
+    if current is None or not span_processor.enabled:
+        return
+    span = Span(name, kind, current.trace_id, current.span_id, attributes)
+    span.start_time -= duration
+    span.duration = duration
+    span_processor.add(span)
+
+
+def get_trace_headers() -> dict:
+    span = _current_span.get()
+    return {TRACEPARENT_HEADER: span.traceparent} if span else {}
+
+
+# exporters
+
+
+def to_otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans: List[dict]) -> dict:
+    """
+    The spans (as_dict) as an OTLP/HTTP json ExportTraceServiceRequest.
+    """
+    otlp_spans = []
+    for span in spans:
+        start_ns = int(span['start_time'] * 1e9)
+        otlp_span = {
+            'traceId': span['trace_id'],
+            'spanId': span['span_id'],
+            'name': span['name'],
+            'kind': KINDS[span['kind']],
+            'startTimeUnixNano': str(start_ns),
+            'endTimeUnixNano': str(start_ns + int(span['duration_ms'] * 1e6)),
+            'attributes': [
+                {'key': key, 'value': to_otlp_value(value)}
+                for key, value in span['attributes'].items()
+            ],
+            'status': (
+                {'code': 2, 'message': span['error']} if span['error'] else {'code': 1}
+            ),
+        }
+        if span['parent_id']:
+            otlp_span['parentSpanId'] = span['parent_id']
+        otlp_spans.append(otlp_span)
+
+    resource = {'service.name': settings.TRACING_SERVICE_NAME}
+    return {
+        'resourceSpans': [
+            {
+                'resource': {
+                    'attributes': [
+                        {'key': key, 'value': to_otlp_value(value)}
+                        for key, value in resource.items()
+                    ]
+                },
+                'scopeSpans': [{'scope': {'name': __name__}, 'spans': otlp_spans}],
+            }
+        ]
+    }
+
+
+class FileSpanExporter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[dict]):
+        lines = ''.join(json.dumps(span) + '\n' for span in spans)
+        with open(self.path, 'a', encoding='utf-8') as spans_file:
+            spans_file.write(lines)
+
+
+class OTLPSpanExporter:
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, spans: List[dict]):
+        data = json.dumps(to_otlp(spans)).encode('utf-8')
+        http_request = urllib.request.Request(
+            self.endpoint,
+            data=data,
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        with urllib.request.urlopen(http_request, timeout=self.timeout):
+            pass
+
+
+def get_exporter(name: str):
+    if name == 'file':
+        return FileSpanExporter(settings.TRACING_FILE)
+    if name == 'otlp':
+        return OTLPSpanExporter(settings.TRACING_OTLP_ENDPOINT)
+    return None
+
+
+class BatchSpanProcessor:
+    """
+    Queue the finished spans, and export them on a background thread, so
+    that exporting never blocks a request or a task. Spans are dropped
+    (and counted) when the queue is full.
+
+    The thread is started on the first span of each process, so that it
+    is also running on the forked (gunicorn and celery) workers.
+    """
+
+    def __init__(self, exporter, interval: float, max_queue_size: int):
+        self.exporter = exporter
+        self.interval = interval
+        self.max_queue_size = max_queue_size
+        self.dropped = 0
+        self._pid = None
+        self._queue = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def add(self, span: Span):
+        if self.exporter is None:
+            return
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """
+        Export the queued spans now, on the calling thread.
+        """
+        if self._queue is None:
+            return
+        spans = []
+        while True:
+            try:
+                spans.append(self._queue.get_nowait().as_dict())
+            except queue.Empty:
+                break
+        if not spans:
+            return
+        try:
+            self.exporter.export(spans)
+        except Exception:
+            logger.warning(f'Could not export {len(spans)} spans.', exc_info=True)
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue_size)
+            self._pid = os.getpid()
+            threading.Thread(
+                target=self._run, name='span-exporter', daemon=True
+            ).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+span_processor = BatchSpanProcessor(
+    get_exporter(settings.TRACING_EXPORTER),
+    interval=settings.TRACING_EXPORT_INTERVAL,
+    max_queue_size=settings.TRACING_QUEUE_SIZE,
+)
+atexit.register(span_processor.flush)
+
+
+# log records
+
+
+_record_factory = logging.getLogRecordFactory()
+
+
+def _create_log_record(*args, **kwargs):
+    record = _record_factory(*args, **kwargs)
+    span = _current_span.get()
+    record.trace_id = span.trace_id if span else '-'
+    record.span_id = span.span_id if span else '-'
+    return record
+
+
+logging.setLogRecordFactory(_create_log_record)
+
+
+# flask requests
+
+
+def _before_request():
+    span = create_span(
+        f'{request.method} {request.url_rule.rule if request.url_rule else "unmatched"}',
+        kind='server',
+        traceparent=request.headers.get(TRACEPARENT_HEADER),
+        **{'http.method': request.method, 'http.target': request.path},
+    )
+    g.trace_span_token = _current_span.set(span)
+
+
+def _after_request(response):
+    span = _current_span.get()
+    if span is not None:
+        span.attributes['http.status_code'] = response.status_code
+        response.headers[TRACE_ID_HEADER] = span.trace_id
+    return response
+
+
+def _teardown_request(error=None):
+    token = g.pop('trace_span_token', None)
+    if token is None:
+        return
+    span = _current_span.get()
+    _current_span.reset(token)
+    if error is not None:
+        span.error = repr(error)
+    span.end()
+
+
+def init_tracing(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+# celery
+
+
+def start_task_span(task):
+    """
+    Continue the trace of the publisher (from the message headers), or of
+    the current span when the task runs eagerly.
+    """
+    headers = task.request.headers or {}
+    return start_span(
+        f'task {task.name}',
+        kind='consumer',
+        traceparent=headers.get(TRACEPARENT_HEADER),
+        **{'celery.task_id': task.request.id or '', 'celery.task_name': task.name},
+    )
+
+
+_publishing = threading.local()
+
+
+@before_task_publish.connect
+def _on_before_task_publish(sender=None, headers=None, routing_key=None, **kwargs):
+    if headers is None:
+        return
+    span = create_span(
+        f'publish {sender}',
+        kind='producer',
+        # set by the outbox, to continue the trace of the enqueuing request
+        traceparent=headers.get(TRACEPARENT_HEADER),
+        **{'celery.task_name': sender, 'celery.routing_key': routing_key or ''},
+    )
+    headers[TRACEPARENT_HEADER] = span.traceparent
+    _publishing.span = span
+
+
+@after_task_publish.connect
+def _on_after_task_publish(**kwargs):
+    span = getattr(_publishing, 'span', None)
+    if span is not None:
+        _publishing.span = None
+        span.end()
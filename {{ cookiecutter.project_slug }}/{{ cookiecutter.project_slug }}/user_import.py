@@ -0,0 +1,300 @@
+"""
+Bulk user import (POST /users/bulk and `flask users import`).
+
+The rows (CSV or NDJSON, with username, email and password) are read as a
+stream and imported in batches, one transaction per batch:
+
+1. the rows are validated, and the passwords of the valid ones are hashed
+   across the password hashing process pool;
+2. the batch is loaded with COPY into a temporary staging table;
+3. a single INSERT ... SELECT ... ON CONFLICT merges the staging table
+   into the user table and reports back what happened to each line.
+
+Invalid rows, duplicates within the import and conflicts with existing
+users are reported per line, without aborting the rest of the batch.
+"""
+
+import csv
+import io
+import json
+import logging
+from itertools import islice
+from time import perf_counter
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.extensions import db, password_hasher
+
+logger = logging.getLogger(__name__)
+
+users_cli = AppGroup('users', help='User management commands.')
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson'}
+# skip: existing users (same username) are reported as errors
+# update: existing users get the imported email and password
+ON_CONFLICT = ('skip', 'update')
+# POST /users/bulk only creates users: updating the existing ones (their
+# email and password) is left to the command
+HTTP_ON_CONFLICT = ('skip',)
+FIELDS = {'username': 80, 'email': 120, 'password': 1024}  # max lengths
+
+# line number, row (None when unreadable), error
+Row = Tuple[int, Optional[dict], Optional[str]]
+
+STAGING_TABLE_SQL = """
+CREATE TEMPORARY TABLE IF NOT EXISTS user_import (
+    line integer NOT NULL,
+    username text NOT NULL,
+    email text NOT NULL,
+    password_hash text NOT NULL
+) ON COMMIT DELETE ROWS
+"""
+
+COPY_SQL = (
+    'COPY user_import (line, username, email, password_hash) '
+    'FROM STDIN WITH (FORMAT csv)'
+)
+
+ON_CONFLICT_SQL = {
+    'skip': 'DO NOTHING',
+    'update': (
+        'DO UPDATE SET email = EXCLUDED.email, '
+        'password_hash = EXCLUDED.password_hash, '
+        "last_updated_at = timezone('utc', clock_timestamp())"
+    ),
+}
+
+# Only the first line of each username/email is merged, and never over
+# the email of another user, so the statement itself never conflicts on
+# the email unique index. Returns (line, created, error) for every line.
+MERGE_SQL = """
+WITH ranked AS (
+    SELECT
+        staged.*,
+        row_number() OVER (PARTITION BY username ORDER BY line) AS username_rank,
+        row_number() OVER (PARTITION BY email ORDER BY line) AS email_rank,
+        EXISTS (
+            SELECT 1 FROM "user" existing
+            WHERE existing.email = staged.email
+            AND existing.username <> staged.username
+        ) AS email_taken
+    FROM user_import staged
+),
+merged AS (
+    INSERT INTO "user" (username, email, password_hash)
+    SELECT username, email, password_hash
+    FROM ranked
+    WHERE username_rank = 1 AND email_rank = 1 AND NOT email_taken
+    ORDER BY line
+    ON CONFLICT (username) %s
+    RETURNING username, (xmax = 0) AS created
+)
+SELECT
+    ranked.line,
+    merged.created,
+    CASE
+        WHEN merged.username IS NOT NULL THEN NULL
+        WHEN ranked.username_rank > 1 THEN 'duplicated username on the import'
+        WHEN ranked.email_rank > 1 THEN 'duplicated email on the import'
+        WHEN ranked.email_taken THEN 'email already in use'
+        ELSE 'username already exists'
+    END AS error
+FROM ranked
+LEFT JOIN merged
+    ON merged.username = ranked.username
+    AND ranked.username_rank = 1
+    AND ranked.email_rank = 1
+    AND NOT ranked.email_taken
+ORDER BY ranked.line
+"""
+
+
+class ImportReport:
+    def __init__(self, max_errors: int = settings.USERS_IMPORT_MAX_ERRORS):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line: int, error: str):
+        self.failed += 1
+        # every failure is counted, but only the first ones are detailed
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': error})
+
+    def as_dict(self) -> dict:
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def read_rows(stream: io.TextIOBase, data_format: str) -> Iterator[Row]:
+    """
+    Read the rows of a CSV (with a header line) or NDJSON stream,
+    one at a time.
+    """
+    if data_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line, content in enumerate(stream, start=1):
+        if not content.strip():
+            continue
+        try:
+            row = json.loads(content)
+        except ValueError:
+            yield line, None, 'invalid json'
+            continue
+        if not isinstance(row, dict):
+            yield line, None, 'expected a json object'
+            continue
+        yield line, row, None
+
+
+def validate_row(row: dict) -> Optional[str]:
+    for name, max_length in FIELDS.items():
+        value = row.get(name)
+        if not isinstance(value, str) or not value:
+            return f'{name} is required'
+        if len(value) > max_length:
+            return f'{name} is longer than {max_length} characters'
+        if '\x00' in value:
+            return f'{name} has invalid characters'
+    if '@' not in row['email']:
+        return 'invalid email'
+    return None
+
+
+def import_users(
+    rows: Iterable[Row],
+    on_conflict: str = 'skip',
+    batch_size: int = settings.USERS_IMPORT_BATCH_SIZE,
+    max_errors: int = settings.USERS_IMPORT_MAX_ERRORS,
+    timeout: Optional[float] = None,
+) -> ImportReport:
+    """
+    With a timeout, the password hashing of the whole import must be done
+    within timeout seconds (see PasswordHasher.generate_password_hashes).
+    """
+    report = ImportReport(max_errors=max_errors)
+    rows = iter(rows)
+    deadline = None if timeout is None else perf_counter() + timeout
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return report
+
+        valid_rows = []
+        for line, row, error in batch:
+            error = error or validate_row(row)
+            if error:
+                report.add_error(line, error)
+            else:
+                valid_rows.append((line, row))
+
+        if valid_rows:
+            remaining = None if deadline is None else max(0, deadline - perf_counter())
+            _import_batch(valid_rows, on_conflict, report, remaining)
+
+
+def _import_batch(
+    rows: List[Tuple[int, dict]],
+    on_conflict: str,
+    report,
+    timeout: Optional[float] = None,
+):
+    password_hashes = password_hasher.generate_password_hashes(
+        [row['password'] for _, row in rows], timeout=timeout
+    )
+
+    staged = io.StringIO()
+    writer = csv.writer(staged)
+    for (line, row), password_hash in zip(rows, password_hashes):
+        writer.writerow([line, row['username'], row['email'], password_hash])
+    staged.seek(0)
+
+    try:
+        connection = db.session.connection()
+        connection.exec_driver_sql(STAGING_TABLE_SQL)
+        connection.exec_driver_sql('TRUNCATE user_import')
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(COPY_SQL, staged)
+
+        results = connection.execute(
+            text(MERGE_SQL % ON_CONFLICT_SQL[on_conflict])
+        ).all()
+        db.session.commit()
+    except IntegrityError:
+        # a user with the same email was committed concurrently
+        db.session.rollback()
+        logger.warning('User import batch conflicted with a concurrent write.')
+        for line, _ in rows:
+            report.add_error(line, 'conflicting concurrent write, try again')
+        return
+
+    for line, created, error in results:
+        if error:
+            report.add_error(line, error)
+        elif created:
+            report.created += 1
+        else:
+            report.updated += 1
+
+
+@users_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--format',
+    'data_format',
+    type=click.Choice(FORMATS),
+    help='File format (default: from the file extension, csv otherwise).',
+)
+@click.option('--on-conflict', type=click.Choice(ON_CONFLICT), default='skip')
+@click.option(
+    '--batch-size',
+    default=settings.USERS_IMPORT_BATCH_SIZE,
+    show_default=True,
+    help='Rows per transaction.',
+)
+@click.option(
+    '--workers',
+    default=settings.USERS_IMPORT_HASHING_WORKERS,
+    show_default=True,
+    help='Password hashing processes.',
+)
+def import_command(
+    path: str, data_format: str, on_conflict: str, batch_size: int, workers: int
+):
+    """Import users from a CSV or NDJSON file."""
+    if data_format is None:
+        data_format = 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+    password_hasher.configure(workers=workers, max_pending=0, timeout=None)
+    with open(path, newline='', encoding='utf-8') as stream:
+        report = import_users(
+            read_rows(stream, data_format),
+            on_conflict=on_conflict,
+            batch_size=batch_size,
+            max_errors=settings.USERS_IMPORT_MAX_ERRORS,
+        )
+    password_hasher.shutdown()
+
+    for error in report.errors:
+        click.echo(f'line {error["line"]}: {error["error"]}', err=True)
+    click.echo(
+        f'{report.created} created, {report.updated} updated, '
+        f'{report.failed} failed.'
+    )
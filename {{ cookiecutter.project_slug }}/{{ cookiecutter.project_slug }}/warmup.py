@@ -0,0 +1,128 @@
+"""
+Warm-up of a new gunicorn worker (started, or replacing a recycled one),
+so that its first requests do not pay for what is set up on first use:
+
+- database: a pool connection, and the statements of User.get_by,
+  compiled (and cached by SQLAlchemy) by running them once;
+- broker: the producer connections (see broker.py);
+- jwt: a token encoded and decoded;
+- password hashing: the bcrypt pool processes (see hashing.py);
+- json: a response encoded.
+
+It runs on the post_fork hook (see gunicorn_settings.py), before the
+worker accepts connections, so the requests go to the workers that are
+warm already. The readiness check fails (503) until the worker that
+answers it is warmed up, and a warm-up that failed (e.g. the database was
+not reachable yet) is tried again by the next readiness check. The broker
+is not required: what can not be published is spooled (see spool.py).
+
+The worker does not notify the master while it warms up, so each step is
+bounded well within the gunicorn timeout: by DATABASE_CONNECT_TIMEOUT,
+BROKER_CONNECTION_TIMEOUT and PASSWORD_HASHING_TIMEOUT. An unreachable
+database or broker fails its step, instead of getting the worker killed
+(and the next one, in a loop).
+"""
+
+import logging
+import os
+import threading
+import uuid
+from time import perf_counter
+
+from flask_jwt_extended import create_access_token, decode_token
+
+from {{ cookiecutter.project_slug }} import settings
+from {{ cookiecutter.project_slug }}.broker import warm_up_broker_connections
+from {{ cookiecutter.project_slug }}.extensions import db
+from {{ cookiecutter.project_slug }}.models import User
+
+logger = logging.getLogger(__name__)
+
+_warmed_up_pid = None
+_lock = threading.Lock()
+
+
+def _warm_up_database(app):
+    try:
+        # one of each statement, no user has these
+        User.get_by(uuid=str(uuid.UUID(int=0)))
+        User.get_by(email='warm-up@localhost')
+        User.get_by(username='warm-up')
+    finally:
+        db.session.remove()  # the connection goes back to the pool
+
+
+def _warm_up_broker(app):
+    warm_up_broker_connections(
+        app.extensions['celery'], connections=settings.BROKER_WARM_CONNECTIONS
+    )
+
+
+def _warm_up_jwt(app):
+    decode_token(create_access_token(identity='warm-up'))
+
+
+def _warm_up_password_hashing(app):
+    app.extensions['password_hasher'].warm_up()
+
+
+def _warm_up_json(app):
+    app.json.response({'warm_up': True})
+
+
+STEPS = (
+    ('database', _warm_up_database),
+    ('broker', _warm_up_broker),
+    ('jwt', _warm_up_jwt),
+    ('password_hashing', _warm_up_password_hashing),
+    ('json', _warm_up_json),
+)
+
+
+def warm_up(app) -> bool:
+    """
+    Run every step, and return whether they all succeeded (only then is
+    the process warmed up).
+    """
+    global _warmed_up_pid
+    started_at = perf_counter()
+    timings, failed = [], []
+    with app.app_context():
+        for name, step in STEPS:
+            step_started_at = perf_counter()
+            try:
+                step(app)
+            except Exception:
+                logger.exception(f'Warm-up step {name} failed.')
+                failed.append(name)
+                continue
+            timings.append(f'{name} {(perf_counter() - step_started_at) * 1000:.0f}ms')
+
+    elapsed_ms = (perf_counter() - started_at) * 1000
+    if failed:
+        logger.warning(
+            f'Warm-up incomplete after {elapsed_ms:.0f}ms, failed: {", ".join(failed)}.'
+        )
+        return False
+    _warmed_up_pid = os.getpid()
+    logger.info(f'Warmed up in {elapsed_ms:.0f}ms ({", ".join(timings)}).')
+    return True
+
+
+def is_warmed_up() -> bool:
+    return not settings.WARMUP_ENABLED or _warmed_up_pid == os.getpid()
+
+
+def ensure_warmed_up(app) -> bool:
+    """
+    For the readiness check: warm up if it did not succeed yet, unless
+    another thread is at it already.
+    """
+    if is_warmed_up():
+        return True
+    if not _lock.acquire(blocking=False):
+        return False
+    try:
+        return is_warmed_up() or warm_up(app)
+    finally:
+        _lock.release()